@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import os
+import shutil
 from dataclasses import dataclass
 from pathlib import Path
 
@@ -65,6 +66,8 @@ RUNWAY_SEND_JPEG = os.environ.get('RUNWAY_SEND_JPEG', '1') == '1'
 START_OVERLAY_DEBUG = os.environ.get('START_OVERLAY_DEBUG', '0') == '1'
 MF_DEBUG = OAI_DEBUG or (os.environ.get('MF_DEBUG', '0') == '1')
 CROSSFADE_SEC = _env_float('CROSSFADE_SEC', 0.7)
+# compiled — один filter_complex на всю постобработку; multistep — старая цепочка процессов
+POSTPROCESS_MODE = os.environ.get('POSTPROCESS_MODE', 'compiled').strip().lower()
 
 CANDLE_WIDTH_FRAC = _env_float('CANDLE_WIDTH_FRAC', 0.32)
 MEM_TOP_FRAC = _env_float('MEM_TOP_FRAC', 0.48)
@@ -73,6 +76,19 @@ WM_CORNER_MARGIN_PX = _env_int('WM_CORNER_MARGIN_PX', 24)
 
 UPLOADS_DIR = 'uploads'
 RENDERS_DIR = 'renders'
+DATA_DIR = 'data'
+# кэши (вырезки по фото пользователей, титры, тайминги Runway) — вне RENDERS_DIR: /renders раздаётся публично
+CACHE_DIR = os.path.join(DATA_DIR, 'cache')
+_LEGACY_CACHE_DIR = os.path.join(RENDERS_DIR, 'cache')
+TITLE_CACHE_MAX_ENTRIES = _env_int('TITLE_CACHE_MAX_ENTRIES', 64)
+CUTOUT_CACHE_MAX_ENTRIES = _env_int('CUTOUT_CACHE_MAX_ENTRIES', 256)
+CUTOUT_CACHE_TTL_SEC = _env_int('CUTOUT_CACHE_TTL_SEC', 3 * 24 * 3600)
+# публичный адрес API (https://...): по нему Runway забирает стартовые кадры из /uploads
+PUBLIC_BASE_URL = os.environ.get('PUBLIC_BASE_URL', '').strip().rstrip('/')
+START_FRAME_STORE = os.environ.get('START_FRAME_STORE', 'local').strip().lower()  # local | datauri
+START_FRAME_STORE_DIR = os.path.join(UPLOADS_DIR, 'frames')
+START_FRAME_STORE_MAX_ENTRIES = _env_int('START_FRAME_STORE_MAX_ENTRIES', 200)
+START_FRAME_STORE_TTL_SEC = _env_int('START_FRAME_STORE_TTL_SEC', 24 * 3600)
 ASSETS_DIR = 'assets'
 AUDIO_DIR = 'audio'
 GUIDE_DIR = os.path.join(ASSETS_DIR, 'guide')
@@ -105,7 +121,70 @@ OPT_PRICE_TITLES = _env_int('OPT_PRICE_TITLES', 50)
 
 PAYMENT_GATE_ENABLED = _env_bool('PAYMENT_GATE_ENABLED', True)
 
+RENDER_MAX_WORKERS = max(1, _env_int('RENDER_MAX_WORKERS', 2))
+# сколько готовый веб-рендер отдаётся повторно на такой же запрос (те же фото и параметры)
+RENDER_RESULT_TTL_SEC = _env_int('RENDER_RESULT_TTL_SEC', 6 * 3600)
+# реестр веб-заданий/платежей/сессий: хранение, heartbeat владельца, повторы после падения
+WEB_JOB_TTL_SEC = _env_int('WEB_JOB_TTL_SEC', 3 * 24 * 3600)
+WEB_JOB_LEASE_TTL_SEC = max(15.0, _env_float('WEB_JOB_LEASE_TTL_SEC', 60.0))
+WEB_JOB_RECOVERY_SEC = max(5.0, _env_float('WEB_JOB_RECOVERY_SEC', 30.0))
+WEB_JOB_MAX_ATTEMPTS = max(1, _env_int('WEB_JOB_MAX_ATTEMPTS', 3))
+# токен для GET /v1/metrics (Authorization: Bearer <токен>); пусто — эндпоинт выключен (404)
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '').strip()
+RENDER_POOL_KIND = os.environ.get('RENDER_POOL_KIND', 'thread').strip().lower()
+
+REMBG_WARM_MODELS = [
+    m.strip()
+    for m in os.environ.get('REMBG_WARM_MODELS', 'u2net_human_seg').split(',')
+    if m.strip()
+]
+REMBG_POOL_SIZE = max(1, _env_int('REMBG_POOL_SIZE', RENDER_MAX_WORKERS))
+REMBG_INTRA_OP_THREADS = _env_int('REMBG_INTRA_OP_THREADS', 0)
+REMBG_INTER_OP_THREADS = _env_int('REMBG_INTER_OP_THREADS', 0)
+
+RUNWAY_API_BASE = os.environ.get('RUNWAY_API_BASE', 'https://api.dev.runwayml.com/v1').rstrip('/')
+RUNWAY_MAX_CONCURRENT_TASKS = max(1, _env_int('RUNWAY_MAX_CONCURRENT_TASKS', 4))
+SCENE_MAX_WORKERS = max(1, _env_int('SCENE_MAX_WORKERS', 8))
+# лиза «живого» процесса в очереди Runway: без heartbeat дольше этого — слот освобождается
+RUNWAY_LEASE_TTL_SEC = max(15.0, _env_float('RUNWAY_LEASE_TTL_SEC', 90.0))
+RUNWAY_MAX_CONNECTIONS = max(1, _env_int('RUNWAY_MAX_CONNECTIONS', 20))
+RUNWAY_POLL_INTERVAL_SEC = max(0.5, _env_float('RUNWAY_POLL_INTERVAL_SEC', 5.0))
+RUNWAY_POLL_MAX_INTERVAL_SEC = max(1.0, _env_float('RUNWAY_POLL_MAX_INTERVAL_SEC', 20.0))
+RUNWAY_TIMINGS_FILE = os.path.join(CACHE_DIR, 'runway_timings.json')
+RUNWAY_VARIANT_TTL_SEC = _env_int('RUNWAY_VARIANT_TTL_SEC', 6 * 3600)
+# подписанные колбэки о завершении задач Runway. Runway сам адрес колбэка не принимает —
+# в проде завершение узнаём только опросом, колбэки шлют fake_runway и внешние интеграции.
+# Выключены по умолчанию: включаются RUNWAY_CALLBACKS_ENABLED=1 при заданном RUNWAY_WEBHOOK_SECRET
+RUNWAY_WEBHOOK_SECRET = os.environ.get('RUNWAY_WEBHOOK_SECRET', '').strip()
+RUNWAY_CALLBACKS_ENABLED = _env_bool('RUNWAY_CALLBACKS_ENABLED', False) and bool(RUNWAY_WEBHOOK_SECRET)
+RUNWAY_CALLBACK_DIR = os.path.join(DATA_DIR, 'runway_callbacks')
+RUNWAY_CALLBACK_URL = os.environ.get('RUNWAY_CALLBACK_URL', 'http://127.0.0.1:8000/v1/runway/callback')
+# локальная подмена Runway: RUNWAY_FAKE=1 и RUNWAY_API_BASE=http://127.0.0.1:8000/fake-runway/v1
+RUNWAY_FAKE = _env_bool('RUNWAY_FAKE', False)
+RUNWAY_FAKE_DELAY_SEC = _env_float('RUNWAY_FAKE_DELAY_SEC', 8.0)
+RUNWAY_POLL_CONCURRENCY = max(1, _env_int('RUNWAY_POLL_CONCURRENCY', 16))
+
+# платежи Точки: общий реестр операций бота и веба + один реконсилер на процесс
+# публичный ключ Точки (JWK, JSON) для подписи вебхуков; пусто — вебхук выключен, только опрос
+TOCHKA_WEBHOOK_JWK = os.environ.get('TOCHKA_WEBHOOK_JWK', '').strip()
+PAYMENT_RECONCILE_SEC = max(0.5, _env_float('PAYMENT_RECONCILE_SEC', 2.0))
+PAYMENT_POLL_INTERVAL_SEC = max(1.0, _env_float('PAYMENT_POLL_INTERVAL_SEC', 5.0))
+PAYMENT_SAFETY_POLL_SEC = max(5.0, _env_float('PAYMENT_SAFETY_POLL_SEC', 30.0))
+PAYMENT_POLL_CONCURRENCY = max(1, _env_int('PAYMENT_POLL_CONCURRENCY', 8))
+PAYMENT_PENDING_TTL_SEC = _env_int('PAYMENT_PENDING_TTL_SEC', 24 * 3600)
+PAYMENT_LEDGER_TTL_SEC = _env_int('PAYMENT_LEDGER_TTL_SEC', 30 * 24 * 3600)
+# обработчик оплаты держит операцию под лизой (продлевается, пока он работает); упал — повтор с backoff
+PAYMENT_HANDLER_LEASE_SEC = max(10.0, _env_float('PAYMENT_HANDLER_LEASE_SEC', 120.0))
+PAYMENT_HANDLER_MAX_ATTEMPTS = max(1, _env_int('PAYMENT_HANDLER_MAX_ATTEMPTS', 8))
+
 QUOTA_DIR = 'quota'
+STATE_DB_FILE = os.path.join(DATA_DIR, 'memoryforever.sqlite3')
+# сессии пользователей бота: в памяти не больше N и не дольше TTL простоя, на диске — до SESSION_PERSIST_TTL_SEC
+SESSION_MAX_IN_MEMORY = max(1, _env_int('SESSION_MAX_IN_MEMORY', 2000))
+SESSION_IDLE_TTL_SEC = _env_int('SESSION_IDLE_TTL_SEC', 2 * 3600)
+SESSION_PERSIST_TTL_SEC = _env_int('SESSION_PERSIST_TTL_SEC', 14 * 24 * 3600)
+SESSION_FLUSH_SEC = max(0.2, _env_float('SESSION_FLUSH_SEC', 2.0))
+# старый JSON со счётчиками «Объятий»: при первом обращении переносится в STATE_DB_FILE
 FREE_HUGS_QUOTA_FILE = os.path.join(QUOTA_DIR, 'free_hugs_usage.json')
 FREE_HUGS_WHITELIST = {
     value.strip()
@@ -171,6 +250,10 @@ WAIST_FOG_MAX_ALPHA = _env_int('WAIST_FOG_MAX_ALPHA', 180)
 MIN_SINGLE_FRAC = {'В рост': 0.66, 'По пояс': 0.56, 'По грудь': 0.48}
 MIN_PAIR_FRAC = {'В рост': 0.64, 'По пояс': 0.54, 'По грудь': 0.46}
 
+# Предполагаемая минимальная доля высоты фото, которую занимает человек:
+# определяет максимальный полезный размер фото перед сегментацией
+PHOTO_MIN_SUBJECT_FRAC = _env_float('PHOTO_MIN_SUBJECT_FRAC', 0.35)
+
 PAIR_UPSCALE_CAP = 1.10
 SINGLE_UPSCALE_CAP = 1.12
 
@@ -189,6 +272,9 @@ def ensure_directories() -> None:
         AUDIO_DIR,
         GUIDE_DIR,
         QUOTA_DIR,
+        DATA_DIR,
         LEGAL_DIR,
     ):
         os.makedirs(path, exist_ok=True)
+    # кэш из старого места лежал в публичной /renders — он одноразовый, просто удаляем
+    shutil.rmtree(_LEGACY_CACHE_DIR, ignore_errors=True)
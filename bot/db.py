@@ -0,0 +1,68 @@
+from __future__ import annotations
+
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator
+
+from .config import STATE_DB_FILE
+
+# Общая SQLite-база бота и веб-API (разные процессы): WAL, короткие транзакции.
+# Модули регистрируют свою схему через register_schema(); она применяется один раз на соединение.
+
+_SCHEMAS: Dict[str, str] = {}
+_SCHEMAS_LOCK = threading.Lock()
+_local = threading.local()
+
+
+def register_schema(name: str, ddl: str) -> None:
+    """DDL должен быть идемпотентным (CREATE ... IF NOT EXISTS)."""
+    with _SCHEMAS_LOCK:
+        _SCHEMAS[name] = ddl
+
+
+def _open(path: str) -> sqlite3.Connection:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    conn = sqlite3.connect(path, timeout=10.0, isolation_level=None, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA busy_timeout=10000")
+    return conn
+
+
+def connect(path: str = STATE_DB_FILE) -> sqlite3.Connection:
+    """Соединение на поток (sqlite3 не любит делить соединение между потоками)."""
+    conns = getattr(_local, "conns", None)
+    if conns is None:
+        conns = _local.conns = {}
+    applied = getattr(_local, "applied", None)
+    if applied is None:
+        applied = _local.applied = set()
+    conn = conns.get(path)
+    if conn is None:
+        conn = conns[path] = _open(path)
+    with _SCHEMAS_LOCK:
+        pending = [(n, ddl) for n, ddl in _SCHEMAS.items() if (path, n) not in applied]
+    for name, ddl in pending:
+        conn.executescript(ddl)
+        applied.add((path, name))
+    return conn
+
+
+@contextmanager
+def transaction(path: str = STATE_DB_FILE) -> Iterator[sqlite3.Connection]:
+    """BEGIN IMMEDIATE: запись сериализуется между процессами сразу, без апгрейда блокировки."""
+    conn = connect(path)
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    else:
+        conn.execute("COMMIT")
+
+
+__all__ = ["connect", "register_schema", "transaction"]
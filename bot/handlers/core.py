@@ -26,6 +26,7 @@ from .. import assets
 from ..state import (
     users,
     IN_RENDER,
+    RENDER_IN_PROGRESS,
     PENDING_ALBUMS,
     new_state,
     is_free_hugs_whitelisted,
@@ -41,14 +42,18 @@ from ..payment import (
     start_auto_check_payment,
     tochka_link_keyboard,
     stars_amount_for_state,
+    watch_tg_payments,
 )
 from ..payment import tochka
+from ..payment.ledger import PAID, SOURCE_TG, payment_ledger
+from ..payment.reconciler import payment_reconciler
 from ..render.pipeline import (
     validate_photo,
     ensure_jpeg_copy,
-    ensure_runway_datauri_under_limit,
+    runway_prompt_image,
     runway_start,
     runway_poll,
+    runway_task,
     download,
     _video_duration_sec,
     apply_fullscreen_watermark,
@@ -57,6 +62,8 @@ from ..render.pipeline import (
     postprocess_concat_ffmpeg,
     cleanup_artifacts,
 )
+from ..render.governor import PRIORITY_FREE, PRIORITY_PAID, call_with_runway_request
+from ..render.scenes import scene_scheduler
 from ..media.storage import save_upload_image_bytes
 from ..utils import cleanup_uploads_folder
 
@@ -1183,7 +1190,7 @@ def _generate_scene_from_approved(uid: int, data: dict) -> str | None:
 
     # Подготовка старт-кадра
     send_path = ensure_jpeg_copy(start_frame) if RUNWAY_SEND_JPEG else start_frame
-    data_uri, used_path = ensure_runway_datauri_under_limit(send_path)
+    data_uri, used_path = runway_prompt_image(send_path)
     try:
         fs = os.path.getsize(used_path)
         print(f"[Runway] start_frame path={used_path} size={fs} bytes (jpeg={RUNWAY_SEND_JPEG})")
@@ -1193,22 +1200,23 @@ def _generate_scene_from_approved(uid: int, data: dict) -> str | None:
         bot.send_message(uid, f"Сцена «{scene_key}»: пустой data URI старт-кадра")
         return None
 
-    # Запуск Runway
-    try:
-        start_resp = runway_start(data_uri, prompt, duration)
-    except RuntimeError as e:
-        bot.send_message(uid, f"Сцена «{scene_key}» упала с ошибкой: {e}")
-        _log_fail(uid, "runway_start_failed_approved",
-                  {"scene": scene_key, "prompt_len": len(prompt)}, str(e))
-        return None
-
-    task_id = start_resp.get("id") or start_resp.get("task", {}).get("id")
-    if not task_id:
-        bot.send_message(uid, f"Не получил id задачи от Runway для «{scene_key}».")
-        _log_fail(uid, "no_task_id_approved", {"scene": scene_key, "prompt_len": len(prompt)}, start_resp)
-        return None
-
-    poll = runway_poll(task_id)
+    # Запуск Runway: слот общего лимита освобождается, даже если между запуском и опросом что-то упадёт
+    with runway_task():
+        try:
+            start_resp = runway_start(data_uri, prompt, duration)
+        except RuntimeError as e:
+            bot.send_message(uid, f"Сцена «{scene_key}» упала с ошибкой: {e}")
+            _log_fail(uid, "runway_start_failed_approved",
+                      {"scene": scene_key, "prompt_len": len(prompt)}, str(e))
+            return None
+
+        task_id = start_resp.get("id") or start_resp.get("task", {}).get("id")
+        if not task_id:
+            bot.send_message(uid, f"Не получил id задачи от Runway для «{scene_key}».")
+            _log_fail(uid, "no_task_id_approved", {"scene": scene_key, "prompt_len": len(prompt)}, start_resp)
+            return None
+
+        poll = runway_poll(task_id, duration=duration)
     status = (poll or {}).get("status")
     print(f"[Runway] Final status for {scene_key}: {status}")
 
@@ -1267,7 +1275,7 @@ def _generate_scene_from_approved(uid: int, data: dict) -> str | None:
 
 def _render_all_scenes_from_approved(uid: int, st: dict):
     """
-    Батч: пробегаем по ВСЕМ согласованным сценам и рендерим их по очереди.
+    Батч: запускаем ВСЕ согласованные сцены параллельно (scene_scheduler).
     В конце вызываем финализацию (склейка+музыка+титр) и отправку.
     """
     if uid in IN_RENDER:
@@ -1278,6 +1286,9 @@ def _render_all_scenes_from_approved(uid: int, st: dict):
         return
 
     IN_RENDER.add(uid)
+    # метка сразу пишется в SQLite: рестарт посреди рендера не потеряет оплаченный заказ
+    st[RENDER_IN_PROGRESS] = True
+    users.save(uid)
     try:
         jobs = st.get("scene_jobs") or []
         if not jobs:
@@ -1285,6 +1296,7 @@ def _render_all_scenes_from_approved(uid: int, st: dict):
             return
 
         total = len(jobs)
+        pending = []
         for i, job in enumerate(jobs, start=1):
             # если уже есть сегмент (повторный запуск) — пропускаем
             if job.get("video_path"):
@@ -1301,13 +1313,20 @@ def _render_all_scenes_from_approved(uid: int, st: dict):
                 "prompt": job.get("prompt", ""),
                 "duration": int(job.get("duration") or SCENES[job["scene_key"]]["duration"]),
             }
+            pending.append((i, job, data))
 
             try:
                 bot.send_message(uid, f"Генерация {i}/{total}: «{job['scene_key']}»…")
             except Exception:
                 pass
 
-            seg_path = _generate_scene_from_approved(uid, data)
+        # все сцены уходят в Runway сразу (в пределах общего лимита), каждая
+        # скачивается и дообрабатывается по готовности
+        def _on_scene_done(_idx, item, seg_path, err):
+            i, job, _data = item
+            if err is not None:
+                print(f"[RENDER] Scene {i}/{total} error: {job['scene_key']}: {err}")
+                seg_path = None
             if seg_path:
                 job["video_path"] = seg_path
                 print(f"[RENDER] Scene {i}/{total} completed: {job['scene_key']} -> {seg_path}")
@@ -1319,9 +1338,42 @@ def _render_all_scenes_from_approved(uid: int, st: dict):
                 except Exception:
                     pass
 
+        # общий с веб-API лимит задач Runway: платные заказы вперёд бесплатных «Объятий»
+        try:
+            paid = calc_order_price(st)[0] > 0
+        except Exception:
+            paid = False
+        notified = {"at": 0.0}
+
+        def _on_queue(info):
+            # не чаще раза в минуту
+            if time.monotonic() - notified["at"] < 60:
+                return
+            notified["at"] = time.monotonic()
+            mins = max(1, round(info["eta_sec"] / 60))
+            try:
+                bot.send_message(uid, f"⏳ Генерации сейчас в очереди: вы {info['position']}-й из {info['depth']}, "
+                                      f"старт примерно через {mins} мин.")
+            except Exception:
+                pass
+
+        runway_req = {
+            "user_key": f"tg:{uid}",
+            "priority": PRIORITY_PAID if paid else PRIORITY_FREE,
+            "on_wait": _on_queue,
+        }
+        scene_scheduler.run(
+            pending,
+            lambda item: call_with_runway_request(runway_req, _generate_scene_from_approved, uid, item[2]),
+            _on_scene_done,
+        )
+
         print(f"[RENDER] All scenes processed, calling _finalize_all_scenes_and_send")
         _finalize_all_scenes_and_send(uid, st)
     finally:
+        st.pop(RENDER_IN_PROGRESS, None)
+        # после финализации в users уже может лежать новая сессия — сохраняем текущую
+        users.save(uid)
         IN_RENDER.discard(uid)
 
 def _finalize_all_scenes_and_send(uid: int, st: dict):
@@ -1329,6 +1381,7 @@ def _finalize_all_scenes_and_send(uid: int, st: dict):
     print(f"[FINALIZE] Starting finalization for uid={uid}")
     jobs = st.get("scene_jobs") or []
     segs = [j.get("video_path") for j in jobs if j.get("video_path")]
+    seg_durations = [float(j.get("duration") or 0) for j in jobs if j.get("video_path")]
     print(f"[FINALIZE] Found {len(segs)} video segments: {segs}")
     if not segs:
         bot.send_message(uid, "Ни одна сцена не сгенерировалась. Попробуйте другие фото.")
@@ -1372,7 +1425,8 @@ def _finalize_all_scenes_and_send(uid: int, st: dict):
             final_path,
             bg_overlay_file=bg_file,
             titles_meta=titles_meta,
-            candle_path=CANDLE_PATH
+            candle_path=CANDLE_PATH,
+            segment_durations=seg_durations,
         )
         print(f"[FINALIZE] Postprocess completed successfully: {final_path}")
     except Exception as e:
@@ -1763,47 +1817,93 @@ def on_payment_callbacks(call: telebot.types.CallbackQuery):
             f"После оплаты — жмите «Проверить».",
             reply_markup=tochka_link_keyboard(op_id, link)
         )
-        start_auto_check_payment(bot, uid, op_id, _after_payment_continue)
+        start_auto_check_payment(bot, uid, op_id, _after_payment_continue, amount_rub=total)
         return
 
-    # 4) Проверка оплаты (жмут после оплаты)
+    # 4) Проверка оплаты (жмут после оплаты). Генерацию запускает обработчик реестра —
+    # ровно один раз, даже если оплату одновременно подтвердили вебхук или опрос.
     if call.data.startswith("checkpay_"):
         op_id = call.data.split("_", 1)[1]
         bot.answer_callback_query(call.id, "Проверяю оплату…")
+        payment_ledger.register(op_id, SOURCE_TG, str(uid))  # счета, созданные до общего реестра
         try:
-            resp = tochka.get_payment_status(op_id)
+            row = payment_reconciler.check_now(op_id)
         except Exception as e:
             bot.send_message(uid, f"Ошибка проверки: {e}")
             return
-        if tochka.is_paid_status(resp):
-            st["payment_confirmed"] = True
-            st["await_payment"] = False
-            bot.send_message(uid, "✅ Оплата получена. Запускаю генерацию.")
-            _after_payment_continue(uid, st)
+        if row and row["status"] == PAID:
+            if row["handled"]:
+                bot.send_message(uid, "✅ Оплата уже получена — генерация запущена.")
         else:
             bot.send_message(uid, "Пока оплата не найдена. Если уже оплатили — подождите 5–10 секунд и нажмите «Проверить» ещё раз.")
 
+def _start_render_in_background(uid: int, st: dict) -> None:
+    """
+    Запускает рендер всех согласованных сцен в отдельном потоке и сразу возвращается:
+    обработчик оплаты не должен занимать поток реконсилера на всё время рендера.
+    Ошибка запуска потока пробрасывается вызывающему.
+    """
+    def _run() -> None:
+        try:
+            with users.hold(uid):
+                _render_all_scenes_from_approved(uid, st)
+        except Exception as e:
+            print(f"[RENDER] background render for uid={uid} failed: {e}")
+            try:
+                bot.send_message(uid, "⚠️ Не удалось завершить генерацию. Мы уже разбираемся.")
+            except Exception:
+                pass
+
+    threading.Thread(target=_run, name=f"render-{uid}", daemon=True).start()
+
+
 def _after_payment_continue(uid: int, st: dict):
     """
     Продолжаем пайплайн сразу после подтверждения оплаты:
     - если есть несогласованные сюжеты — просим их завершить;
     - если оферта ещё не принята — показываем экран согласия;
-    - иначе — запускаем рендер всех согласованных сцен.
+    - иначе — запускаем рендер всех согласованных сцен (в фоне).
+    Исключения не глушим: реестр оплат повторит обработку, если продолжить не удалось.
     """
-    try:
-        jobs = st.get("scene_jobs") or []
-        all_ready = jobs and all(j.get("start_frame") for j in jobs)
-        if not all_ready:
-            bot.send_message(uid, "Оплата получена. Завершите согласование старт-кадров по всем сюжетам — и я запущу генерацию.")
-            return
+    jobs = st.get("scene_jobs") or []
+    all_ready = jobs and all(j.get("start_frame") for j in jobs)
+    if not all_ready:
+        bot.send_message(uid, "Оплата получена. Завершите согласование старт-кадров по всем сюжетам — и я запущу генерацию.")
+        return
 
-        if not st.get("offer_accepted"):
-            send_legal_gate(uid)
-            return
+    if not st.get("offer_accepted"):
+        send_legal_gate(uid)
+        return
+
+    _start_render_in_background(uid, st)
 
-        _render_all_scenes_from_approved(uid, st)
+
+def resume_interrupted_renders() -> None:
+    """
+    Продолжает рендеры, прерванные рестартом: готовые сцены (video_path) не перегенерируются,
+    остальные запускаются заново. Вызывается при старте процесса бота.
+    """
+    try:
+        keys = users.find(RENDER_IN_PROGRESS, True)
     except Exception as e:
-        print(f"[PAY] after-payment continue err: {e}")
+        print(f"[RENDER] cannot look up interrupted renders: {e}")
+        return
+    for key in keys:
+        uid = int(key)
+        st = users.get(uid)
+        if not st or uid in IN_RENDER:
+            continue
+        print(f"[RENDER] resuming interrupted render for uid={uid}")
+        try:
+            bot.send_message(uid, "Бот был перезапущен — продолжаю генерацию вашего видео.")
+        except Exception:
+            pass
+        _start_render_in_background(uid, st)
+
+
+def start_payment_confirmations() -> None:
+    """Подписать бота на подтверждения оплат Точки (вызывается при старте процесса бота)."""
+    watch_tg_payments(bot, _after_payment_continue)
 
 @bot.callback_query_handler(func=lambda call: call.data == "pay_stars")
 def on_pay_stars(call: telebot.types.CallbackQuery):
@@ -5,10 +5,14 @@ import logging
 from .app import bot
 from .config import ensure_directories
 from .handlers import core  # noqa: F401 ensures handlers register
+from .render.rembg_pool import start_warm_up
 
 
 def run() -> None:
     ensure_directories()
+    start_warm_up()
+    core.start_payment_confirmations()
+    core.resume_interrupted_renders()
     try:
         bot.remove_webhook()
     except Exception as exc:
@@ -0,0 +1,76 @@
+from __future__ import annotations
+
+import hashlib
+import os
+from abc import ABC, abstractmethod
+
+from ..config import (
+    PUBLIC_BASE_URL,
+    START_FRAME_STORE,
+    START_FRAME_STORE_DIR,
+    START_FRAME_STORE_MAX_ENTRIES,
+    START_FRAME_STORE_TTL_SEC,
+    UPLOADS_DIR,
+)
+from ..render.cache import DiskLRUCache
+
+
+class StartFrameStore(ABC):
+    """
+    Хранилище стартовых кадров, доступное Runway по HTTPS.
+    Ключ — sha256 содержимого: один и тот же кадр загружается один раз.
+    Другой бэкенд (объектное хранилище) достаточно реализовать через put_bytes().
+    """
+
+    @abstractmethod
+    def put_bytes(self, data: bytes, suffix: str = ".jpg") -> str:
+        """Сохранить кадр и вернуть его публичный URL."""
+
+    def put_file(self, path: str) -> str:
+        with open(path, "rb") as f:
+            data = f.read()
+        suffix = os.path.splitext(path)[1].lower() or ".jpg"
+        return self.put_bytes(data, suffix)
+
+
+class LocalStartFrameStore(StartFrameStore):
+    """Папка внутри uploads/, которую API уже раздаёт статикой по /uploads."""
+
+    def __init__(
+        self,
+        base_url: str = PUBLIC_BASE_URL,
+        directory: str = START_FRAME_STORE_DIR,
+        max_entries: int = START_FRAME_STORE_MAX_ENTRIES,
+        ttl_sec: float = START_FRAME_STORE_TTL_SEC,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.directory = directory
+        # suffix пустой: расширение входит в ключ (jpg/png)
+        self._cache = DiskLRUCache(directory, max_entries=max_entries, ttl_sec=ttl_sec, suffix="")
+        rel = os.path.relpath(directory, UPLOADS_DIR).replace(os.sep, "/")
+        self._url_prefix = f"{self.base_url}/uploads/{rel}"
+
+    def put_bytes(self, data: bytes, suffix: str = ".jpg") -> str:
+        key = hashlib.sha256(data).hexdigest() + suffix
+        if self._cache.get(key) is None:
+            self._cache.put_bytes(key, data)
+        return f"{self._url_prefix}/{key}"
+
+
+_STORE: StartFrameStore | None = None
+
+
+def start_frame_store() -> StartFrameStore | None:
+    """
+    Хранилище по настройке START_FRAME_STORE (local | datauri).
+    Без PUBLIC_BASE_URL Runway не сможет скачать кадр — тогда None и вызывающий шлёт data URI.
+    """
+    global _STORE
+    if START_FRAME_STORE != "local" or not PUBLIC_BASE_URL:
+        return None
+    if _STORE is None:
+        _STORE = LocalStartFrameStore()
+    return _STORE
+
+
+__all__ = ["LocalStartFrameStore", "StartFrameStore", "start_frame_store"]
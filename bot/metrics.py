@@ -0,0 +1,61 @@
+from __future__ import annotations
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator
+
+
+class Metrics:
+    """Минимальный потокобезопасный реестр метрик процесса (счётчики, гейджи, тайминги)."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._counters: Dict[str, int] = {}
+        self._gauges: Dict[str, float] = {}
+        self._timings: Dict[str, Dict[str, float]] = {}
+
+    def incr(self, name: str, value: int = 1) -> None:
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def set_gauge(self, name: str, value: float) -> None:
+        with self._lock:
+            self._gauges[name] = float(value)
+
+    def observe(self, name: str, value: float) -> None:
+        with self._lock:
+            t = self._timings.get(name)
+            if t is None:
+                t = self._timings[name] = {"count": 0, "sum": 0.0, "min": value, "max": value, "last": value}
+            t["count"] += 1
+            t["sum"] += value
+            t["min"] = min(t["min"], value)
+            t["max"] = max(t["max"], value)
+            t["last"] = value
+
+    @contextmanager
+    def timed(self, name: str) -> Iterator[None]:
+        """Замер длительности блока в миллисекундах."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, (time.perf_counter() - started) * 1000.0)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            timings = {
+                k: {**v, "avg": (v["sum"] / v["count"]) if v["count"] else 0.0}
+                for k, v in self._timings.items()
+            }
+            return {
+                "counters": dict(self._counters),
+                "gauges": dict(self._gauges),
+                "timings_ms": timings,
+            }
+
+
+metrics = Metrics()
+
+__all__ = ["Metrics", "metrics"]
@@ -1,10 +1,7 @@
 from __future__ import annotations
 
 import math
-import asyncio
 import os
-import threading
-import time
 from typing import Callable
 
 import telebot
@@ -17,7 +14,8 @@ from ..config import (
     PAYMENT_GATE_ENABLED,
     SCENE_PRICE_10S,
 )
-from . import tochka
+from .ledger import SOURCE_API, SOURCE_TG, payment_ledger
+from .reconciler import payment_reconciler
 
 
 def calc_order_price(st: dict) -> tuple[int, dict]:
@@ -122,6 +120,27 @@ def send_payment_quote(
         print(f"[PAY] send quote error: {exc}")
 
 
+def watch_tg_payments(bot: telebot.TeleBot, on_paid: Callable[[int, dict], None]) -> None:
+    """
+    Реакция бота на оплату его операций — откуда бы ни пришло подтверждение
+    (вебхук в веб-процессе, опрос, кнопка «Проверить»). Вызывается при старте бота:
+    оплаты, подтверждённые, пока бот лежал, обработаются сразу.
+    """
+    def _on_paid(row: dict) -> None:
+        uid = int(row["ref"])
+        st = state.users.setdefault(uid, state.new_state())
+        st["payment_confirmed"] = True
+        st["await_payment"] = False
+        try:
+            bot.send_message(uid, "✅ Оплата получена. Запускаю генерацию.")
+        except Exception as exc:  # noqa: BLE001
+            # уведомление не обязательно (пользователь мог заблокировать бота) — заказ всё равно ведём
+            print(f"[PAY] notify {uid} failed: {exc}")
+        on_paid(uid, st)
+
+    payment_reconciler.subscribe(SOURCE_TG, _on_paid)
+
+
 def start_auto_check_payment(
     bot: telebot.TeleBot,
     uid: int,
@@ -129,24 +148,14 @@ def start_auto_check_payment(
     on_paid: Callable[[int, dict], None],
     period_sec: int = 10,
     max_checks: int = 12,
+    amount_rub: float | None = None,
 ) -> None:
     """
-    Поддерживаем старое API, но делегируем фактическое ожидание в async helper ниже.
+    Поддерживаем старое API: операция попадает в общий реестр, дальше её ведёт реконсилер.
+    period_sec/max_checks больше не используются — расписание проверок общее (PaymentReconciler).
     """
-    def _worker():
-        try:
-            resp = asyncio.run(wait_for_tochka_payment(op_id, timeout=period_sec * max_checks, poll_interval=period_sec))
-            st = state.users.setdefault(uid, state.new_state())
-            if not resp:
-                return
-            st["payment_confirmed"] = True
-            st["await_payment"] = False
-            bot.send_message(uid, "✅ Оплата получена. Запускаю генерацию.")
-            on_paid(uid, st)
-        except Exception as exc:
-            print(f"[PAY] auto-check thread crash: {exc}")
-
-    threading.Thread(target=_worker, daemon=True).start()
+    payment_ledger.register(op_id, SOURCE_TG, str(uid), amount_rub)
+    watch_tg_payments(bot, on_paid)
 
 
 async def wait_for_tochka_payment(
@@ -156,18 +165,13 @@ async def wait_for_tochka_payment(
     poll_interval: int = 5,
 ) -> dict | None:
     """
-    Периодически опрашивает Точку и возвращает финальный ответ при оплате, либо None по таймауту/ошибке.
+    Ждёт оплату операции по общему реестру и возвращает её запись, либо None по таймауту.
+    Точку опрашивает реконсилер; незнакомая реестру операция регистрируется как SOURCE_API.
     """
-    started = time.time()
-    while time.time() - started < timeout:
-        try:
-            resp = tochka.get_payment_status(payment_uid)
-            if tochka.is_paid_status(resp):
-                return resp
-        except Exception as exc:
-            print(f"[PAY] wait_for_tochka_payment error: {exc}")
-        await asyncio.sleep(poll_interval)
-    return None
+    if payment_ledger.get(payment_uid) is None:
+        payment_ledger.register(payment_uid, SOURCE_API, payment_uid)
+    payment_reconciler.serve(SOURCE_API)
+    return await payment_reconciler.wait_paid(payment_uid, timeout, poll_interval=min(poll_interval, 1))
 
 
 __all__ = [
@@ -178,4 +182,5 @@ __all__ = [
     "tochka_link_keyboard",
     "stars_amount_for_state",
     "wait_for_tochka_payment",
+    "watch_tg_payments",
 ]
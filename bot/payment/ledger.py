@@ -0,0 +1,227 @@
+from __future__ import annotations
+
+import time
+from typing import Callable, Dict, Iterable, List
+
+from ..config import PAYMENT_LEDGER_TTL_SEC, PAYMENT_PENDING_TTL_SEC, PAYMENT_POLL_INTERVAL_SEC
+from ..db import connect, register_schema, transaction
+from ..metrics import metrics
+from .tochka import PAID_STATUSES
+
+# Операции Точки бота и веба в общей SQLite: один автомат состояний на оба процесса.
+# Подтверждение (вебхук, опрос, ручная проверка) меняет status; обработчик своего источника
+# берёт оплаченную операцию под лизу (handling_until) и отмечает handled только после успеха.
+register_schema("payments", """
+CREATE TABLE IF NOT EXISTS payments (
+    op_id           TEXT PRIMARY KEY,
+    source          TEXT NOT NULL,
+    ref             TEXT NOT NULL,
+    amount_rub      REAL,
+    status          TEXT NOT NULL,
+    provider_status TEXT,
+    confirmed_via   TEXT,
+    handled         INTEGER NOT NULL DEFAULT 0,
+    handling_until  REAL,
+    handle_attempts INTEGER NOT NULL DEFAULT 0,
+    checks          INTEGER NOT NULL DEFAULT 0,
+    next_check_at   REAL NOT NULL,
+    expires_at      REAL NOT NULL,
+    created_at      REAL NOT NULL,
+    updated_at      REAL NOT NULL,
+    paid_at         REAL
+);
+CREATE INDEX IF NOT EXISTS idx_payments_due ON payments(status, next_check_at);
+CREATE INDEX IF NOT EXISTS idx_payments_unhandled ON payments(status, handled, source);
+""")
+
+PENDING = "pending"
+PAID = "paid"
+EXPIRED = "expired"
+
+# источник — кто создал счёт и кто реагирует на оплату: ref = uid Telegram | payment_key веба
+SOURCE_TG = "tg"
+SOURCE_WEB = "web"
+SOURCE_API = "api"
+
+# paid терминален (возвраты — вручную); из expired можно только в paid: оплата после нашего TTL
+_TRANSITIONS = {PENDING: {PAID, EXPIRED}, EXPIRED: {PAID}}
+
+# handled: обработчик ещё не отработал | отработал | сдался после всех попыток (разбирать вручную)
+UNHANDLED = 0
+HANDLED = 1
+HANDLER_FAILED = -1
+
+
+def payment_state(provider_status: str) -> str:
+    status = (provider_status or "").upper()
+    if status in PAID_STATUSES:
+        return PAID
+    if status == "EXPIRED":
+        return EXPIRED
+    return PENDING
+
+
+def _marks(items: List[str]) -> str:
+    return ",".join("?" for _ in items)
+
+
+class PaymentLedger:
+    """Реестр операций Точки; все переходы — атомарные UPDATE в BEGIN IMMEDIATE."""
+
+    def __init__(
+        self,
+        pending_ttl: float = PAYMENT_PENDING_TTL_SEC,
+        first_check_sec: float = PAYMENT_POLL_INTERVAL_SEC,
+        keep_sec: float = PAYMENT_LEDGER_TTL_SEC,
+    ):
+        self.pending_ttl = float(pending_ttl)
+        self.first_check_sec = float(first_check_sec)
+        self.keep_sec = float(keep_sec)
+
+    def register(self, op_id: str, source: str, ref: str, amount_rub: float | None = None) -> None:
+        """Идемпотентно: повторная регистрация той же операции ничего не меняет."""
+        now = time.time()
+        connect().execute(
+            "INSERT INTO payments (op_id, source, ref, amount_rub, status, next_check_at, expires_at,"
+            " created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT(op_id) DO NOTHING",
+            (str(op_id), source, str(ref), amount_rub, PENDING, now + self.first_check_sec,
+             now + self.pending_ttl, now, now),
+        )
+
+    def get(self, op_id: str) -> dict | None:
+        row = connect().execute("SELECT * FROM payments WHERE op_id = ?", (str(op_id),)).fetchone()
+        return dict(row) if row is not None else None
+
+    def apply(self, op_id: str, provider_status: str, via: str) -> str | None:
+        """Применить статус Точки; возвращает новое состояние, если переход случился."""
+        new = payment_state(provider_status)
+        now = time.time()
+        with transaction() as c:
+            row = c.execute("SELECT status FROM payments WHERE op_id = ?", (str(op_id),)).fetchone()
+            if row is None:
+                return None
+            old = row["status"]
+            moved = new in _TRANSITIONS.get(old, ())
+            c.execute(
+                "UPDATE payments SET provider_status = ?, updated_at = ?,"
+                " status = CASE WHEN ? THEN ? ELSE status END,"
+                " confirmed_via = CASE WHEN ? THEN ? ELSE confirmed_via END,"
+                " paid_at = CASE WHEN ? THEN ? ELSE paid_at END"
+                " WHERE op_id = ?",
+                (provider_status, now, moved, new, moved, via, moved and new == PAID, now, str(op_id)),
+            )
+        if not moved:
+            return None
+        print(f"[PAY] {op_id}: {old} → {new} (via {via})")
+        metrics.incr(f"payments.{new}_via.{via}")
+        return new
+
+    def claim_due(self, sources: Iterable[str], limit: int, interval: Callable[[float], float]) -> List[dict]:
+        """
+        Операции источников sources, которым пора на проверку у Точки. Следующая проверка
+        назначается сразу (interval от возраста операции) — соседний процесс эти же операции не возьмёт.
+        Просроченные по PAYMENT_PENDING_TTL_SEC переводятся в expired.
+        """
+        sources = list(sources)
+        if not sources:
+            return []
+        now = time.time()
+        with transaction() as c:
+            expired = c.execute(
+                f"UPDATE payments SET status = ?, confirmed_via = 'ttl', updated_at = ?"
+                f" WHERE status = ? AND expires_at < ? AND source IN ({_marks(sources)})",
+                [EXPIRED, now, PENDING, now, *sources],
+            ).rowcount
+            rows = c.execute(
+                f"SELECT * FROM payments WHERE status = ? AND next_check_at <= ? AND source IN ({_marks(sources)})"
+                " ORDER BY next_check_at LIMIT ?",
+                [PENDING, now, *sources, int(limit)],
+            ).fetchall()
+            c.executemany(
+                "UPDATE payments SET next_check_at = ?, checks = checks + 1 WHERE op_id = ?",
+                [(now + interval(now - r["created_at"]), r["op_id"]) for r in rows],
+            )
+        if expired:
+            metrics.incr("payments.expired_via.ttl", expired)
+        return [dict(r) for r in rows]
+
+    def take_paid(self, sources: Iterable[str], lease_sec: float, limit: int = 50) -> List[dict]:
+        """
+        Оплаченные и ещё не обработанные операции, свободные от чужой лизы; берёт их под лизу
+        на lease_sec. Дальше — mark_handled() после успеха или retry_later() при ошибке;
+        умер процесс — лиза истекает, и операцию берёт следующий.
+        """
+        sources = list(sources)
+        if not sources:
+            return []
+        now = time.time()
+        with transaction() as c:
+            rows = c.execute(
+                f"SELECT * FROM payments WHERE status = ? AND handled = ? AND source IN ({_marks(sources)})"
+                " AND (handling_until IS NULL OR handling_until <= ?) ORDER BY paid_at LIMIT ?",
+                [PAID, UNHANDLED, *sources, now, int(limit)],
+            ).fetchall()
+            c.executemany(
+                "UPDATE payments SET handling_until = ?, handle_attempts = handle_attempts + 1 WHERE op_id = ?",
+                [(now + lease_sec, r["op_id"]) for r in rows],
+            )
+        return [dict(r, handle_attempts=r["handle_attempts"] + 1) for r in rows]
+
+    def extend(self, op_ids: Iterable[str], lease_sec: float) -> None:
+        """Продлить лизу операций, чьи обработчики ещё работают."""
+        until = time.time() + lease_sec
+        with transaction() as c:
+            c.executemany(
+                "UPDATE payments SET handling_until = ? WHERE op_id = ? AND handled = ?",
+                [(until, str(op_id), UNHANDLED) for op_id in op_ids],
+            )
+
+    def mark_handled(self, op_id: str) -> None:
+        connect().execute(
+            "UPDATE payments SET handled = ?, handling_until = NULL WHERE op_id = ?", (HANDLED, str(op_id))
+        )
+
+    def retry_later(self, op_id: str, delay: float, give_up: bool = False) -> None:
+        """Обработчик упал: снова отдать операцию через delay; give_up — больше не пытаться."""
+        connect().execute(
+            "UPDATE payments SET handled = ?, handling_until = ? WHERE op_id = ? AND handled = ?",
+            (HANDLER_FAILED if give_up else UNHANDLED, time.time() + delay, str(op_id), UNHANDLED),
+        )
+
+    def gc(self) -> int:
+        # оплаченные без успешной обработки не удаляем — их ещё нужно довести или разобрать
+        cur = connect().execute(
+            "DELETE FROM payments WHERE status != ? AND updated_at < ? AND NOT (status = ? AND handled != ?)",
+            (PENDING, time.time() - self.keep_sec, PAID, HANDLED),
+        )
+        return cur.rowcount or 0
+
+    def counts(self) -> Dict[str, int]:
+        rows = connect().execute(
+            "SELECT status, handled, COUNT(*) AS n FROM payments GROUP BY status, handled"
+        ).fetchall()
+        out: Dict[str, int] = {}
+        for r in rows:
+            key = r["status"]
+            if r["status"] == PAID and r["handled"] != HANDLED:
+                key = "paid_unhandled" if r["handled"] == UNHANDLED else "paid_handler_failed"
+            out[key] = out.get(key, 0) + r["n"]
+        return out
+
+
+payment_ledger = PaymentLedger()
+
+__all__ = [
+    "EXPIRED",
+    "HANDLED",
+    "HANDLER_FAILED",
+    "PAID",
+    "PENDING",
+    "PaymentLedger",
+    "SOURCE_API",
+    "SOURCE_TG",
+    "SOURCE_WEB",
+    "UNHANDLED",
+    "payment_ledger",
+    "payment_state",
+]
@@ -0,0 +1,266 @@
+from __future__ import annotations
+
+import asyncio
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict
+
+import httpx
+
+from ..config import (
+    PAYMENT_HANDLER_LEASE_SEC,
+    PAYMENT_HANDLER_MAX_ATTEMPTS,
+    PAYMENT_POLL_CONCURRENCY,
+    PAYMENT_POLL_INTERVAL_SEC,
+    PAYMENT_RECONCILE_SEC,
+    PAYMENT_SAFETY_POLL_SEC,
+    TOCHKA_WEBHOOK_JWK,
+)
+from ..metrics import metrics
+from . import tochka
+from .ledger import PAID, PaymentLedger, payment_ledger
+
+
+class PaymentReconciler:
+    """
+    Подтверждение оплат Точки: один на процесс — поток с event loop, один httpx.AsyncClient
+    (keep-alive пул) и одна корутина, которая раз в tick_sec:
+      - берёт из реестра все операции своих источников, которым пора на проверку,
+        и опрашивает Точку пачкой (не больше concurrency запросов одновременно);
+      - раздаёт обработчикам оплаченные, но ещё не обработанные операции.
+    Операция отмечается обработанной только после успеха обработчика; пока он работает,
+    лиза в реестре продлевается, упал — повтор с backoff, после max_attempts — в ручной разбор.
+    Вебхук Точки меняет статус в реестре из любого процесса (и будит корутину через notify),
+    при TOCHKA_WEBHOOK_JWK опрос становится страховкой раз в PAYMENT_SAFETY_POLL_SEC.
+    Обработчики выполняются в пуле потоков — они шлют сообщения и запускают рендер.
+    """
+
+    def __init__(
+        self,
+        ledger: PaymentLedger = payment_ledger,
+        tick_sec: float = PAYMENT_RECONCILE_SEC,
+        poll_interval: float = PAYMENT_POLL_INTERVAL_SEC,
+        concurrency: int = PAYMENT_POLL_CONCURRENCY,
+        webhooks_enabled: bool = bool(TOCHKA_WEBHOOK_JWK),
+        handler_lease: float = PAYMENT_HANDLER_LEASE_SEC,
+        max_attempts: int = PAYMENT_HANDLER_MAX_ATTEMPTS,
+    ):
+        self.ledger = ledger
+        self.tick_sec = float(tick_sec)
+        self.poll_interval = float(poll_interval)
+        self.safety_poll_interval = PAYMENT_SAFETY_POLL_SEC
+        self.concurrency = max(1, int(concurrency))
+        self.webhooks_enabled = webhooks_enabled
+        self.handler_lease = float(handler_lease)
+        self.max_attempts = max(1, int(max_attempts))
+        self._inflight: set = set()  # op_id, чьи обработчики сейчас работают в этом процессе
+        self._lock = threading.Lock()
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._client: httpx.AsyncClient | None = None
+        self._wakeup: asyncio.Event | None = None
+        self._handlers: Dict[str, Callable[[dict], None]] = {}
+        self._sources: set = set()
+        self._pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="payment-cb")
+        self._paused_until = 0.0  # пауза опроса после 429
+        self._last_gc = 0.0
+
+    # --- подписка ---
+    def subscribe(self, source: str, handler: Callable[[dict], None]) -> None:
+        """handler(запись реестра) — реакция этого процесса на оплату операций источника source."""
+        with self._lock:
+            self._handlers[source] = handler
+            self._sources.add(source)
+        self._ensure_loop()
+        self.notify()
+
+    def serve(self, source: str) -> None:
+        """Опрашивать операции источника без обработчика (их ждут через wait_paid)."""
+        with self._lock:
+            self._sources.add(source)
+        self._ensure_loop()
+
+    def notify(self) -> None:
+        """Будит корутину (вебхук или новая операция в этом процессе)."""
+        loop = self._loop
+        if loop is None or self._wakeup is None:
+            return
+        loop.call_soon_threadsafe(self._wakeup.set)
+
+    # --- event loop ---
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is not None:
+                return self._loop
+            loop = asyncio.new_event_loop()
+            ready = threading.Event()
+
+            def _run():
+                asyncio.set_event_loop(loop)
+                self._wakeup = asyncio.Event()
+                loop.call_soon(ready.set)
+                loop.run_forever()
+
+            threading.Thread(target=_run, name="payments-io", daemon=True).start()
+            ready.wait()
+            self._loop = loop
+            asyncio.run_coroutine_threadsafe(self._reconcile_forever(), loop)
+            return loop
+
+    def _http(self) -> httpx.AsyncClient:
+        # вызывается только из потока loop — гонок нет
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(30.0, connect=10.0),
+                limits=httpx.Limits(
+                    max_connections=self.concurrency,
+                    max_keepalive_connections=self.concurrency,
+                    keepalive_expiry=60.0,
+                ),
+            )
+        return self._client
+
+    # --- сверка ---
+    def _poll_interval(self, age: float) -> float:
+        # свежий счёт чаще всего оплачивают в первые минуты; брошенный — проверяем всё реже
+        if age < 120:
+            interval = self.poll_interval
+        elif age < 900:
+            interval = self.poll_interval * 3
+        else:
+            interval = 300.0
+        if self.webhooks_enabled:
+            interval = max(interval, self.safety_poll_interval)
+        return interval * random.uniform(0.9, 1.1)
+
+    async def _reconcile_forever(self) -> None:
+        sem = asyncio.Semaphore(self.concurrency)
+        while True:
+            try:
+                await self._reconcile_once(sem)
+            except Exception as exc:  # noqa: BLE001
+                print(f"[PAY] reconcile error: {exc}")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.tick_sec)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def _reconcile_once(self, sem: asyncio.Semaphore) -> None:
+        with self._lock:
+            sources = list(self._sources)
+            handled = list(self._handlers)
+        if time.monotonic() >= self._paused_until:
+            due = self.ledger.claim_due(sources, self.concurrency * 8, self._poll_interval)
+            if due:
+                await asyncio.gather(*(self._poll(row, sem) for row in due))
+        with self._lock:
+            inflight = list(self._inflight)
+        if inflight:
+            self.ledger.extend(inflight, self.handler_lease)
+        for row in self.ledger.take_paid(handled, self.handler_lease):
+            with self._lock:
+                self._inflight.add(row["op_id"])
+            self._pool.submit(self._dispatch, row)
+        if time.monotonic() - self._last_gc > 3600:
+            self._last_gc = time.monotonic()
+            removed = self.ledger.gc()
+            if removed:
+                print(f"[PAY] ledger gc: removed {removed}")
+
+    async def _poll(self, row: dict, sem: asyncio.Semaphore) -> None:
+        async with sem:
+            if time.monotonic() < self._paused_until:
+                return
+            try:
+                with metrics.timed("payments.poll_ms"):
+                    resp = await tochka.get_payment_status_async(self._http(), row["op_id"])
+            except httpx.HTTPStatusError as exc:
+                metrics.incr(f"payments.poll.{exc.response.status_code}")
+                if exc.response.status_code == 429:
+                    # лимит общий на токен — притормаживаем весь опрос
+                    self._paused_until = time.monotonic() + 30.0
+                print(f"[PAY] poll {row['op_id']}: HTTP {exc.response.status_code}")
+                return
+            except Exception as exc:  # noqa: BLE001
+                metrics.incr("payments.poll_errors")
+                print(f"[PAY] poll {row['op_id']} error: {exc}")
+                return
+        metrics.incr("payments.polls")
+        self.ledger.apply(row["op_id"], tochka.operation_status(resp), via="poll")
+
+    def _retry_delay(self, attempt: int) -> float:
+        return min(600.0, 15.0 * 2 ** (attempt - 1)) * random.uniform(0.8, 1.2)
+
+    def _dispatch(self, row: dict) -> bool:
+        """Вызвать обработчик; True — операция обработана и больше не выдаётся."""
+        op_id = row["op_id"]
+        try:
+            with self._lock:
+                handler = self._handlers.get(row["source"])
+            if handler is None:
+                self.ledger.retry_later(op_id, 0.0)
+                return False
+            try:
+                handler(row)
+            except Exception as exc:  # noqa: BLE001
+                attempt = int(row.get("handle_attempts") or 1)
+                give_up = attempt >= self.max_attempts
+                metrics.incr("payments.handler_errors")
+                print(f"[PAY] on_paid error for {op_id} (attempt {attempt}): {exc}")
+                if give_up:
+                    print(f"[PAY] ERROR {op_id}: paid but not handled after {attempt} attempts — needs manual action")
+                self.ledger.retry_later(op_id, self._retry_delay(attempt), give_up=give_up)
+                return False
+            self.ledger.mark_handled(op_id)
+            return True
+        finally:
+            with self._lock:
+                self._inflight.discard(op_id)
+
+    # --- точечные проверки ---
+    async def _check(self, op_id: str) -> dict | None:
+        row = self.ledger.get(op_id)
+        if row is None or row["status"] == PAID:
+            return row
+        resp = await tochka.get_payment_status_async(self._http(), op_id)
+        if self.ledger.apply(op_id, tochka.operation_status(resp), via="check") == PAID:
+            self._wakeup.set()
+        return self.ledger.get(op_id)
+
+    def check_now(self, op_id: str, timeout: float = 60.0) -> dict | None:
+        """«Я оплатил»: спросить Точку сейчас, не дожидаясь расписания. Обработчик вызовет корутина."""
+        fut = asyncio.run_coroutine_threadsafe(self._check(op_id), self._ensure_loop())
+        return fut.result(timeout)
+
+    async def check_async(self, op_id: str) -> dict | None:
+        """check_now для кода в чужом event loop (веб-API)."""
+        fut = asyncio.run_coroutine_threadsafe(self._check(op_id), self._ensure_loop())
+        return await asyncio.wrap_future(fut)
+
+    async def wait_paid(self, op_id: str, timeout: float, poll_interval: float = 1.0) -> dict | None:
+        """Ждать оплату по реестру (без собственных запросов к Точке); None — по таймауту."""
+        deadline = time.monotonic() + timeout
+        while True:
+            row = self.ledger.get(op_id)
+            if row is not None and row["status"] == PAID:
+                return row
+            if time.monotonic() >= deadline:
+                return None
+            await asyncio.sleep(poll_interval)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            sources = sorted(self._sources)
+        return {
+            "sources": sources,
+            "webhooks": self.webhooks_enabled,
+            "paused": time.monotonic() < self._paused_until,
+            "ledger": self.ledger.counts(),
+        }
+
+
+payment_reconciler = PaymentReconciler()
+
+__all__ = ["PaymentReconciler", "payment_reconciler"]
@@ -1,8 +1,19 @@
 from __future__ import annotations
 
+import base64
+import hashlib
+import hmac
+import json
+
+import httpx
 import requests
 
-from ..config import settings
+from ..config import TOCHKA_WEBHOOK_JWK, settings
+
+PAID_STATUSES = frozenset({"APPROVED", "COMPLETED"})
+
+# DigestInfo SHA-256 для EMSA-PKCS1-v1_5 (RFC 8017, 9.2)
+_SHA256_DIGEST_INFO = bytes.fromhex("3031300d060960864801650304020105000420")
 
 
 class TochkaError(RuntimeError):
@@ -57,13 +68,83 @@ def get_payment_status(op_id: str) -> dict:
     return resp.json()
 
 
-def is_paid_status(resp_json: dict) -> bool:
+async def get_payment_status_async(client: httpx.AsyncClient, op_id: str) -> dict:
+    """То же, что get_payment_status, через общий пул соединений (вызывает реконсилер платежей)."""
+    headers = {"Accept": "application/json", "Authorization": f"Bearer {settings.tochka_jwt}"}
+    resp = await client.get(f"{settings.tochka_api_base}/payments/{op_id}", headers=headers)
+    resp.raise_for_status()
+    return resp.json()
+
+
+def operation_status(resp_json: dict) -> str:
     data = resp_json.get("Data") or {}
     op = None
     if isinstance(data.get("Operation"), list) and data["Operation"]:
         op = data["Operation"][0]
-    status = (op or data).get("status") or ""
-    return status.upper() in {"APPROVED", "COMPLETED"}
+    return str((op or data).get("status") or "").upper()
+
+
+def is_paid_status(resp_json: dict) -> bool:
+    return operation_status(resp_json) in PAID_STATUSES
+
+
+def _b64url(value: str) -> bytes:
+    return base64.urlsafe_b64decode(value + "=" * (-len(value) % 4))
+
+
+def _webhook_key(jwk: str) -> tuple[int, int] | None:
+    try:
+        key = json.loads(jwk)
+        return int.from_bytes(_b64url(key["n"]), "big"), int.from_bytes(_b64url(key["e"]), "big")
+    except (ValueError, KeyError, TypeError) as exc:
+        print(f"[PAY] bad TOCHKA_WEBHOOK_JWK: {exc}")
+        return None
+
+
+def verify_webhook(token: str, jwk: str = TOCHKA_WEBHOOK_JWK) -> dict | None:
+    """
+    Вебхук Точки приходит телом-JWT, подписанным RS256 её ключом (публичный JWK — в TOCHKA_WEBHOOK_JWK).
+    Проверяем подпись без сторонних библиотек; возвращает payload или None, если подпись не сошлась.
+    """
+    key = _webhook_key(jwk) if jwk else None
+    if key is None or not token.isascii():
+        return None
+    try:
+        head_b64, payload_b64, sig_b64 = token.strip().split(".")
+        header = json.loads(_b64url(head_b64))
+        signature = int.from_bytes(_b64url(sig_b64), "big")
+    except ValueError:
+        return None
+    if not isinstance(header, dict) or header.get("alg") != "RS256":
+        return None
+    n, e = key
+    size = (n.bit_length() + 7) // 8
+    if signature >= n:
+        return None
+    digest = hashlib.sha256(f"{head_b64}.{payload_b64}".encode("ascii")).digest()
+    tail = _SHA256_DIGEST_INFO + digest
+    expected = b"\x00\x01" + b"\xff" * (size - len(tail) - 3) + b"\x00" + tail
+    if not hmac.compare_digest(pow(signature, e, n).to_bytes(size, "big"), expected):
+        return None
+    try:
+        payload = json.loads(_b64url(payload_b64))
+    except ValueError:
+        return None
+    if not isinstance(payload, dict):
+        return None
+    customer = settings.tochka_customer_code
+    if customer and payload.get("customerCode") and str(payload["customerCode"]) != customer:
+        return None
+    return payload
 
 
-__all__ = ["create_payment_link", "get_payment_status", "is_paid_status", "TochkaError"]
+__all__ = [
+    "PAID_STATUSES",
+    "TochkaError",
+    "create_payment_link",
+    "get_payment_status",
+    "get_payment_status_async",
+    "is_paid_status",
+    "operation_status",
+    "verify_webhook",
+]
@@ -0,0 +1,110 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+
+
+def content_key(*parts) -> str:
+    """sha256 от JSON-представления частей ключа (порядок важен)."""
+    raw = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def file_fingerprint(path: str | None) -> list | None:
+    """Дешёвый отпечаток файла для ключей кэша: (абс. путь, размер, mtime)."""
+    if not path or not os.path.isfile(path):
+        return None
+    st = os.stat(path)
+    return [os.path.abspath(path), st.st_size, st.st_mtime_ns]
+
+
+class DiskLRUCache:
+    """
+    Простой content-addressed кэш на диске: один файл на ключ.
+    LRU — по mtime (обновляем при каждом попадании), TTL — по времени с последнего доступа.
+    """
+
+    def __init__(self, directory: str, max_entries: int = 64, ttl_sec: float | None = None, suffix: str = ""):
+        self.directory = directory
+        self.max_entries = max(1, int(max_entries))
+        self.ttl_sec = ttl_sec if ttl_sec and ttl_sec > 0 else None
+        self.suffix = suffix
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+
+    def path_for(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}{self.suffix}")
+
+    def get(self, key: str) -> str | None:
+        path = self.path_for(key)
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None
+        now = time.time()
+        if self.ttl_sec is not None and now - st.st_mtime > self.ttl_sec:
+            self._remove(path)
+            return None
+        try:
+            os.utime(path, (now, now))
+        except OSError:
+            pass
+        return path
+
+    def put_file(self, key: str, src_path: str, *, move: bool = False) -> str:
+        dest = self.path_for(key)
+        tmp = f"{dest}.{uuid.uuid4().hex}.tmp"
+        os.makedirs(self.directory, exist_ok=True)
+        if move:
+            shutil.move(src_path, tmp)
+        else:
+            shutil.copyfile(src_path, tmp)
+        os.replace(tmp, dest)
+        self._evict()
+        return dest
+
+    def put_bytes(self, key: str, data: bytes) -> str:
+        dest = self.path_for(key)
+        tmp = f"{dest}.{uuid.uuid4().hex}.tmp"
+        os.makedirs(self.directory, exist_ok=True)
+        with open(tmp, "wb") as fh:
+            fh.write(data)
+        os.replace(tmp, dest)
+        self._evict()
+        return dest
+
+    def _remove(self, path: str) -> None:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def _evict(self) -> None:
+        with self._lock:
+            try:
+                names = [n for n in os.listdir(self.directory) if n.endswith(self.suffix) and not n.endswith(".tmp")]
+            except FileNotFoundError:
+                return
+            items = []
+            now = time.time()
+            for name in names:
+                p = os.path.join(self.directory, name)
+                try:
+                    mtime = os.path.getmtime(p)
+                except OSError:
+                    continue
+                if self.ttl_sec is not None and now - mtime > self.ttl_sec:
+                    self._remove(p)
+                    continue
+                items.append((p, mtime))
+            items.sort(key=lambda x: x[1], reverse=True)
+            for p, _ in items[self.max_entries:]:
+                self._remove(p)
+
+
+__all__ = ["DiskLRUCache", "content_key", "file_fingerprint"]
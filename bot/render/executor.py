@@ -0,0 +1,157 @@
+from __future__ import annotations
+
+import threading
+from collections import deque
+from concurrent.futures import CancelledError, Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Deque, Dict
+
+from ..config import RENDER_MAX_WORKERS, RENDER_POOL_KIND
+
+
+@dataclass
+class _QueuedRender:
+    job_id: str
+    fn: Callable[..., Any]
+    args: tuple
+    kwargs: dict
+    future: Future = field(default_factory=Future)
+    on_start: Callable[[str], None] | None = None
+    on_position: Callable[[str, int], None] | None = None
+    position: int | None = None  # последняя сообщённая on_position позиция
+
+
+class RenderExecutor:
+    """
+    Ограниченный пул рендеров с FIFO-очередью.
+    Пул (thread/process) получает задачу только когда есть свободный слот,
+    поэтому позицию в очереди можно честно отдавать в статусе.
+    """
+
+    def __init__(self, max_workers: int = RENDER_MAX_WORKERS, kind: str = RENDER_POOL_KIND):
+        self.max_workers = max(1, int(max_workers))
+        self.kind = "process" if (kind or "").lower() == "process" else "thread"
+        self._lock = threading.Lock()
+        self._waiting: Deque[_QueuedRender] = deque()
+        self._running: Dict[str, _QueuedRender] = {}
+        self._pool: Executor | None = None
+
+    def _ensure_pool(self) -> Executor:
+        if self._pool is None:
+            if self.kind == "process":
+                self._pool = ProcessPoolExecutor(max_workers=self.max_workers)
+            else:
+                self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="render")
+        return self._pool
+
+    def submit(
+        self,
+        job_id: str,
+        fn: Callable[..., Any],
+        *args: Any,
+        on_start: Callable[[str], None] | None = None,
+        on_position: Callable[[str, int], None] | None = None,
+        **kwargs: Any,
+    ) -> Future:
+        """
+        Ставит рендер в очередь; возвращает Future с результатом fn(*args, **kwargs).
+        on_position(job_id, N) вызывается при каждом сдвиге места в очереди — чтобы позицию
+        видели другие процессы, её пишут в общий реестр.
+        """
+        item = _QueuedRender(
+            job_id=job_id, fn=fn, args=args, kwargs=kwargs, on_start=on_start, on_position=on_position
+        )
+        with self._lock:
+            self._waiting.append(item)
+        item.future.add_done_callback(lambda f, it=item: self._drop_cancelled(it) if f.cancelled() else None)
+        self._dispatch()
+        return item.future
+
+    def _drop_cancelled(self, item: _QueuedRender) -> None:
+        """Отменённый в очереди рендер уходит из неё сразу — стоящие за ним продвигаются."""
+        with self._lock:
+            try:
+                self._waiting.remove(item)
+            except ValueError:
+                return
+        self._dispatch()
+
+    def position(self, job_id: str) -> int | None:
+        """0 — рендер уже выполняется, N>0 — место в очереди, None — задачи нет."""
+        with self._lock:
+            if job_id in self._running:
+                return 0
+            for idx, item in enumerate(self._waiting, start=1):
+                if item.job_id == job_id:
+                    return idx
+        return None
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "kind": self.kind,
+                "max_workers": self.max_workers,
+                "running": len(self._running),
+                "queued": len(self._waiting),
+            }
+
+    def _dispatch(self) -> None:
+        started: list[_QueuedRender] = []
+        with self._lock:
+            while self._waiting and len(self._running) < self.max_workers:
+                item = self._waiting.popleft()
+                if not item.future.set_running_or_notify_cancel():
+                    continue  # клиент уже отменил ожидание
+                self._running[item.job_id] = item
+                started.append(item)
+            moved = []
+            for idx, item in enumerate(self._waiting, start=1):
+                if item.on_position and item.position != idx:
+                    item.position = idx
+                    moved.append(item)
+
+        for item in moved:
+            try:
+                item.on_position(item.job_id, item.position)
+            except Exception as exc:  # noqa: BLE001
+                print(f"[RENDER_POOL] on_position error for {item.job_id}: {exc}")
+
+        for item in started:
+            if item.on_start:
+                try:
+                    item.on_start(item.job_id)
+                except Exception as exc:  # noqa: BLE001
+                    print(f"[RENDER_POOL] on_start error for {item.job_id}: {exc}")
+            try:
+                inner = self._ensure_pool().submit(item.fn, *item.args, **item.kwargs)
+            except Exception as exc:  # noqa: BLE001
+                self._finish(item, None, exc)
+                continue
+            inner.add_done_callback(lambda f, it=item: self._finish(it, f, None))
+
+    def _finish(self, item: _QueuedRender, inner: Future | None, error: BaseException | None) -> None:
+        with self._lock:
+            self._running.pop(item.job_id, None)
+        if error is None and inner is not None:
+            # внешний future уже RUNNING, cancel() на нём не сработает — отдаём отмену как исключение
+            error = CancelledError() if inner.cancelled() else inner.exception()
+        if error is not None:
+            item.future.set_exception(error)
+        else:
+            item.future.set_result(inner.result() if inner is not None else None)
+        self._dispatch()
+
+    def shutdown(self, wait: bool = False) -> None:
+        with self._lock:
+            pending = list(self._waiting)
+            self._waiting.clear()
+        for item in pending:
+            item.future.cancel()
+        if self._pool is not None:
+            self._pool.shutdown(wait=wait, cancel_futures=True)
+            self._pool = None
+
+
+render_executor = RenderExecutor()
+
+__all__ = ["RenderExecutor", "render_executor"]
@@ -0,0 +1,262 @@
+from __future__ import annotations
+
+import math
+import os
+import random
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator
+
+from ..config import RUNWAY_LEASE_TTL_SEC, RUNWAY_MAX_CONCURRENT_TASKS
+from ..db import register_schema, transaction, connect
+from ..metrics import metrics
+from .runway import runway_client
+
+# Лизы на задачи Runway в общей SQLite: бот и API (разные процессы) делят один лимит аккаунта.
+register_schema("runway_leases", """
+CREATE TABLE IF NOT EXISTS runway_leases (
+    id          TEXT PRIMARY KEY,
+    user_key    TEXT NOT NULL,
+    priority    INTEGER NOT NULL DEFAULT 0,
+    state       TEXT NOT NULL,
+    tag         TEXT,
+    duration    INTEGER,
+    task_id     TEXT,
+    pid         INTEGER NOT NULL,
+    enqueued_at REAL NOT NULL,
+    started_at  REAL,
+    heartbeat   REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_runway_leases_state ON runway_leases(state, priority, enqueued_at);
+CREATE INDEX IF NOT EXISTS idx_runway_leases_tag ON runway_leases(tag);
+""")
+
+# честная очередь: сначала платные, затем пользователь с меньшим числом уже идущих задач, затем FIFO
+_QUEUE_SQL = """
+SELECT w.id, w.user_key, w.duration
+FROM runway_leases w
+WHERE w.state = 'waiting'
+ORDER BY w.priority DESC,
+         (SELECT COUNT(*) FROM runway_leases r WHERE r.state = 'running' AND r.user_key = w.user_key) ASC,
+         w.enqueued_at ASC
+"""
+
+PRIORITY_FREE = 0
+PRIORITY_PAID = 1
+
+_REQUEST: ContextVar[dict | None] = ContextVar("runway_request", default=None)
+
+
+@contextmanager
+def runway_request(
+    user_key: str,
+    priority: int = PRIORITY_FREE,
+    tag: str | None = None,
+    on_wait: Callable[[dict], None] | None = None,
+) -> Iterator[None]:
+    """Кто и с каким приоритетом запускает задачи Runway в этом потоке (читает runway_start)."""
+    token = _REQUEST.set({"user_key": user_key, "priority": priority, "tag": tag, "on_wait": on_wait})
+    try:
+        yield
+    finally:
+        _REQUEST.reset(token)
+
+
+def call_with_runway_request(request: dict, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """Обёртка для пулов потоков/процессов: контекст не наследуется, ставим его в рабочем потоке."""
+    with runway_request(**request):
+        return fn(*args, **kwargs)
+
+
+def current_runway_request() -> dict:
+    return _REQUEST.get() or {}
+
+
+class RunwayGovernor:
+    """
+    Общий для процессов лимит одновременных задач Runway с приоритетами и честной очередью.
+    acquire() блокирует поток до выдачи слота, пока ждём — on_wait получает позицию и ETA.
+    Живость процесса — heartbeat; лизы умерших процессов освобождаются через RUNWAY_LEASE_TTL_SEC.
+    """
+
+    def __init__(
+        self,
+        limit: int = RUNWAY_MAX_CONCURRENT_TASKS,
+        lease_ttl: float = RUNWAY_LEASE_TTL_SEC,
+        poll_sec: float = 1.0,
+    ):
+        self.limit = max(1, int(limit))
+        self.lease_ttl = float(lease_ttl)
+        self.poll_sec = float(poll_sec)
+        self._lock = threading.Lock()
+        self._mine: Dict[str, float] = {}
+        self._by_task: Dict[str, str] = {}
+        self._heartbeat: threading.Thread | None = None
+
+    # --- очередь ---
+    def acquire(
+        self,
+        user_key: str,
+        priority: int = PRIORITY_FREE,
+        tag: str | None = None,
+        duration: int | None = None,
+        on_wait: Callable[[dict], None] | None = None,
+    ) -> str:
+        lease_id = uuid.uuid4().hex
+        now = time.time()
+        with transaction() as c:
+            c.execute(
+                "INSERT INTO runway_leases (id, user_key, priority, state, tag, duration, pid, enqueued_at, heartbeat)"
+                " VALUES (?, ?, ?, 'waiting', ?, ?, ?, ?, ?)",
+                (lease_id, str(user_key), int(priority), tag, duration, os.getpid(), now, now),
+            )
+        with self._lock:
+            self._mine[lease_id] = now
+        self._ensure_heartbeat()
+
+        started = time.perf_counter()
+        last_position = None
+        last_notice = 0.0
+        try:
+            while True:
+                granted, info = self._try_grant(lease_id)
+                if granted:
+                    metrics.observe("runway.queue_wait_ms", (time.perf_counter() - started) * 1000.0)
+                    return lease_id
+                if on_wait and info and (
+                    info["position"] != last_position or time.monotonic() - last_notice > 60
+                ):
+                    last_position, last_notice = info["position"], time.monotonic()
+                    try:
+                        on_wait(info)
+                    except Exception as exc:  # noqa: BLE001
+                        print(f"[GOVERNOR] on_wait error: {exc}")
+                time.sleep(self.poll_sec * random.uniform(0.8, 1.2))
+        except BaseException:
+            self.release(lease_id)
+            raise
+
+    def _try_grant(self, lease_id: str) -> tuple[bool, dict | None]:
+        now = time.time()
+        with transaction() as c:
+            c.execute("UPDATE runway_leases SET heartbeat = ? WHERE id = ?", (now, lease_id))
+            c.execute("DELETE FROM runway_leases WHERE heartbeat < ?", (now - self.lease_ttl,))
+            running = c.execute("SELECT COUNT(*) FROM runway_leases WHERE state = 'running'").fetchone()[0]
+            queue = c.execute(_QUEUE_SQL).fetchall()
+            ids = [row["id"] for row in queue]
+            if lease_id not in ids:
+                raise RuntimeError("Runway lease lost")
+            idx = ids.index(lease_id)
+            if idx < self.limit - running:
+                c.execute(
+                    "UPDATE runway_leases SET state = 'running', started_at = ? WHERE id = ?",
+                    (now, lease_id),
+                )
+                return True, None
+        return False, self._queue_info(idx, len(ids), running, queue[idx]["duration"])
+
+    def _queue_info(self, idx: int, depth: int, running: int, duration: int | None) -> dict:
+        # каждые `limit` позиций очереди — ещё одна «волна» длиной в ожидаемое время задачи
+        per_task = runway_client.model.expected(duration)
+        waves = math.ceil((idx + 1) / self.limit)
+        return {
+            "state": "waiting",
+            "position": idx + 1,
+            "depth": depth,
+            "running": running,
+            "limit": self.limit,
+            "eta_sec": int(waves * per_task),
+        }
+
+    def bind(self, lease_id: str, task_id: str) -> None:
+        with self._lock:
+            self._by_task[str(task_id)] = lease_id
+        with transaction() as c:
+            c.execute("UPDATE runway_leases SET task_id = ? WHERE id = ?", (str(task_id), lease_id))
+
+    def release(self, lease_id: str) -> None:
+        """Идемпотентно: повторное освобождение (runway_poll, затем runway_task) ничего не делает."""
+        with self._lock:
+            self._mine.pop(lease_id, None)
+            for task_id in [t for t, lid in self._by_task.items() if lid == lease_id]:
+                del self._by_task[task_id]
+        try:
+            with transaction() as c:
+                c.execute("DELETE FROM runway_leases WHERE id = ?", (lease_id,))
+        except Exception as exc:  # noqa: BLE001
+            print(f"[GOVERNOR] release error for {lease_id}: {exc}")
+
+    def release_task(self, task_id: str) -> None:
+        with self._lock:
+            lease_id = self._by_task.pop(str(task_id), None)
+        if lease_id:
+            self.release(lease_id)
+
+    # --- живость ---
+    def _ensure_heartbeat(self) -> None:
+        with self._lock:
+            if self._heartbeat is not None and self._heartbeat.is_alive():
+                return
+            self._heartbeat = threading.Thread(target=self._heartbeat_loop, name="runway-lease-hb", daemon=True)
+            self._heartbeat.start()
+
+    def _heartbeat_loop(self) -> None:
+        while True:
+            time.sleep(self.lease_ttl / 3)
+            with self._lock:
+                ids = list(self._mine)
+            if not ids:
+                continue
+            try:
+                with transaction() as c:
+                    c.executemany(
+                        "UPDATE runway_leases SET heartbeat = ? WHERE id = ?",
+                        [(time.time(), lid) for lid in ids],
+                    )
+            except Exception as exc:  # noqa: BLE001
+                print(f"[GOVERNOR] heartbeat error: {exc}")
+
+    # --- статус ---
+    def queue_info(self, tag: str) -> dict | None:
+        """Состояние лизы по метке (id задания/сессии) — для статусов в API, из любого процесса."""
+        c = connect()
+        row = c.execute(
+            "SELECT id, state FROM runway_leases WHERE tag = ? ORDER BY enqueued_at LIMIT 1", (tag,)
+        ).fetchone()
+        if row is None:
+            return None
+        running = c.execute("SELECT COUNT(*) FROM runway_leases WHERE state = 'running'").fetchone()[0]
+        if row["state"] == "running":
+            return {"state": "running", "position": 0, "running": running, "limit": self.limit, "eta_sec": 0}
+        queue = c.execute(_QUEUE_SQL).fetchall()
+        ids = [r["id"] for r in queue]
+        if row["id"] not in ids:
+            return None
+        idx = ids.index(row["id"])
+        return self._queue_info(idx, len(ids), running, queue[idx]["duration"])
+
+    def snapshot(self) -> dict:
+        c = connect()
+        rows = c.execute("SELECT state, priority, COUNT(*) AS n FROM runway_leases GROUP BY state, priority").fetchall()
+        out: dict = {"limit": self.limit, "running": 0, "waiting": 0, "waiting_by_priority": {}}
+        for r in rows:
+            out[r["state"]] = out.get(r["state"], 0) + r["n"]
+            if r["state"] == "waiting":
+                out["waiting_by_priority"][str(r["priority"])] = r["n"]
+        return out
+
+
+runway_governor = RunwayGovernor()
+
+__all__ = [
+    "PRIORITY_FREE",
+    "PRIORITY_PAID",
+    "RunwayGovernor",
+    "call_with_runway_request",
+    "current_runway_request",
+    "runway_governor",
+    "runway_request",
+]
@@ -2,6 +2,7 @@
 from __future__ import annotations
 
 import base64
+import hashlib
 import io
 import json
 import math
@@ -9,25 +10,21 @@ import os
 import re
 import shutil
 import subprocess
+import tempfile
 import textwrap
+import threading
 import time
 import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
 from datetime import datetime, timezone
 from functools import lru_cache
 from pathlib import Path
-from typing import List
+from typing import Iterator, List
 
+import httpx
 import numpy as np
-import requests
-try:
-    from rembg import remove, new_session  # type: ignore[attr-defined]
-except Exception as exc:  # noqa: BLE001
-    remove = None  # type: ignore[assignment]
-    new_session = None  # type: ignore[assignment]
-    _REMBG_IMPORT_ERROR: Exception | None = exc
-else:
-    _REMBG_IMPORT_ERROR = None
-from PIL import Image, ImageDraw, ImageFilter, ImageFont
+from PIL import Image, ImageDraw, ImageFilter, ImageFont, ImageOps
 
 TITLE_FONT_REGULAR_ENV = os.environ.get("TITLE_FONT_PATH")
 TITLE_FONT_BOLD_ENV = os.environ.get("TITLE_FONT_BOLD_PATH")
@@ -54,6 +51,9 @@ TITLE_FONT_BOLD_CANDIDATES = [p for p in TITLE_FONT_BOLD_CANDIDATES if p]
 
 from ..config import (
     ADMIN_CHAT_ID,
+    CACHE_DIR,
+    CUTOUT_CACHE_MAX_ENTRIES,
+    CUTOUT_CACHE_TTL_SEC,
     FREE_HUGS_LIMIT,
     CANDLE_PATH,
     CANDLE_WIDTH_FRAC,
@@ -90,10 +90,14 @@ from ..config import (
     MIN_SINGLE_FRAC,
     PAIR_UPSCALE_CAP,
     PAIR_WIDTH_WARN_RATIO,
+    PHOTO_MIN_SUBJECT_FRAC,
+    POSTPROCESS_MODE,
     PROJECT_ROOT,
     RESAMPLE,
-    RUNWAY_KEY,
+    RUNWAY_API_BASE,
+    RUNWAY_VARIANT_TTL_SEC,
     SINGLE_UPSCALE_CAP,
+    TITLE_CACHE_MAX_ENTRIES,
     TH_CHEST_DOUBLE,
     TH_CHEST_SINGLE,
     TH_FULL_DOUBLE,
@@ -109,16 +113,14 @@ from ..config import (
 )
 from ..config import settings
 from ..app import bot
+from .cache import DiskLRUCache, content_key, file_fingerprint
 
-os.environ.setdefault("U2NET_HOME", str(PROJECT_ROOT / "models"))
-
-
-def _ensure_rembg_available() -> None:
-    if remove is None or new_session is None:
-        message = "rembg is not installed; background removal is unavailable on this host."
-        if _REMBG_IMPORT_ERROR is not None:
-            raise ModuleNotFoundError(message) from _REMBG_IMPORT_ERROR
-        raise ModuleNotFoundError(message)
+from ..metrics import metrics
+from ..media.start_frames import start_frame_store
+from .rembg_pool import ensure_rembg_available, rembg_pool, remove
+from .runway import runway_client
+from .governor import current_runway_request, runway_governor
+from .progress import bound_reporter, report_stage
 
 
 def _wm_safe_top_px() -> int:
@@ -131,18 +133,12 @@ def _wm_safe_top_px() -> int:
         return 160
 
 
-@lru_cache(maxsize=None)
-def _get_rmbg_session(model: str):
-    _ensure_rembg_available()
-    assert new_session is not None
-    return new_session(model)
-
-
 def _rembg_remove(data, *, model: str, **kwargs):
-    _ensure_rembg_available()
+    ensure_rembg_available()
     assert remove is not None
-    session = _get_rmbg_session(model)
-    return remove(data, session=session, **kwargs)
+    with rembg_pool.session(model) as session:
+        with metrics.timed(f"rembg.infer_ms.{model}"):
+            return remove(data, session=session, **kwargs)
 
 from ..assets import SCENE_PROMPTS, SCENES, BG_FILES, MUSIC
 from ..state import (
@@ -297,7 +293,64 @@ def _visible_bbox_height(img: Image.Image) -> int:
     b = img.getbbox() or (0, 0, img.width, img.height)
     return max(1, b[3] - b[1])
 
+_CUTOUT_PRIMARY_MODEL = "u2net_human_seg"
+_CUTOUT_FALLBACK_MODEL = "u2net"
+_CUTOUT_ALT_MODEL = "isnet-general-use"
+_CUTOUT_SMALL_AREA_FRAC = 0.12
+_CUTOUT_ERODE_PX = 3
+_CUTOUT_FEATHER_RADIUS = 1.2
+_CUTOUT_CACHE_VERSION = 1
+
+_CUTOUT_CACHE = DiskLRUCache(
+    os.path.join(CACHE_DIR, "cutouts"),
+    max_entries=CUTOUT_CACHE_MAX_ENTRIES,
+    ttl_sec=CUTOUT_CACHE_TTL_SEC,
+    suffix=".png",
+)
+
+def _cutout_cache_key(img: Image.Image) -> str:
+    """sha256 пикселей входа + цепочка моделей и параметры рафинирования маски."""
+    h = hashlib.sha256()
+    h.update(f"{img.mode}:{img.width}x{img.height}:".encode("ascii"))
+    h.update(img.tobytes())
+    params = {
+        "models": [_CUTOUT_PRIMARY_MODEL, _CUTOUT_FALLBACK_MODEL, _CUTOUT_ALT_MODEL],
+        "small_area": _CUTOUT_SMALL_AREA_FRAC,
+        "erode": _CUTOUT_ERODE_PX,
+        "feather": _CUTOUT_FEATHER_RADIUS,
+        "post_process_mask": True,
+    }
+    return content_key(_CUTOUT_CACHE_VERSION, h.hexdigest(), params)
+
 def smart_cutout(img_rgba: Image.Image) -> Image.Image:
+    """
+    Вырезка человека с кэшем: одинаковые фото (замена второго фото пары, смена фона
+    или формата) не прогоняются через U²-Net/ISNet повторно.
+    """
+    key = None
+    try:
+        key = _cutout_cache_key(img_rgba)
+        cached = _CUTOUT_CACHE.get(key)
+        if cached:
+            with Image.open(cached) as im:
+                cut = im.convert("RGBA")
+            metrics.incr("cutout_cache.hit")
+            return cut
+    except Exception as e:
+        print(f"[CUTOUT] cache read failed: {e}")
+
+    metrics.incr("cutout_cache.miss")
+    cut = _smart_cutout_uncached(img_rgba)
+    if key:
+        try:
+            buf = io.BytesIO()
+            cut.save(buf, "PNG", compress_level=6)
+            _CUTOUT_CACHE.put_bytes(key, buf.getvalue())
+        except Exception as e:
+            print(f"[CUTOUT] cache store failed: {e}")
+    return cut
+
+def _smart_cutout_uncached(img_rgba: Image.Image) -> Image.Image:
     """
     Вырезка человека:
       1) пробуем портретную модель, иначе базовую;
@@ -314,17 +367,17 @@ def smart_cutout(img_rgba: Image.Image) -> Image.Image:
 
     # 1) Портретная модель → fallback
     try:
-        cut = _run("u2net_human_seg")
+        cut = _run(_CUTOUT_PRIMARY_MODEL)
     except Exception:
-        cut = _run("u2net")
+        cut = _run(_CUTOUT_FALLBACK_MODEL)
 
     # 2) Если силуэт подозрительно маленький — пробуем ISNet
     try:
         bb = cut.getbbox() or (0, 0, cut.width, cut.height)
         area = (bb[2] - bb[0]) * (bb[3] - bb[1])
-        if area < 0.12 * cut.width * cut.height:
+        if area < _CUTOUT_SMALL_AREA_FRAC * cut.width * cut.height:
             try:
-                alt = _run("isnet-general-use")
+                alt = _run(_CUTOUT_ALT_MODEL)
                 bb2 = alt.getbbox() or (0, 0, alt.width, alt.height)
                 area2 = (bb2[2] - bb2[0]) * (bb2[3] - bb2[1])
                 if area2 > area:
@@ -336,11 +389,27 @@ def smart_cutout(img_rgba: Image.Image) -> Image.Image:
 
     # 3) Рафинирование маски: чуть «поджать» и дать перо
     a = cut.split()[-1]
-    a = a.filter(ImageFilter.MinFilter(3))       # ~1px эрозия — убираем ореол
-    a = a.filter(ImageFilter.GaussianBlur(1.2))  # мягкое перо ~1–2px
+    a = a.filter(ImageFilter.MinFilter(_CUTOUT_ERODE_PX))           # ~1px эрозия — убираем ореол
+    a = a.filter(ImageFilter.GaussianBlur(_CUTOUT_FEATHER_RADIUS))  # мягкое перо ~1–2px
     cut.putalpha(a)
     return cut
 
+@lru_cache(maxsize=32)
+def _bottom_fog_strip(W: int, H: int, start_y: int, color: tuple, max_alpha: int) -> Image.Image:
+    """
+    Полоса тумана [start_y, H) одним векторным расчётом альфы.
+    Параметры приходят из констант конфига, поэтому слой одинаков между рендерами и кэшируется.
+    """
+    rows = H - start_y
+    t = np.arange(rows, dtype=np.float64) / max(1, rows)  # 0..1
+    alpha = np.round(max_alpha * t).astype(np.uint8)     # плавное нарастание к низу
+    strip = np.empty((rows, W, 4), dtype=np.uint8)
+    strip[..., 0] = color[0]
+    strip[..., 1] = color[1]
+    strip[..., 2] = color[2]
+    strip[..., 3] = alpha[:, None]
+    return Image.fromarray(strip, "RGBA")
+
 def add_bottom_fog(canvas_rgba: Image.Image, start_y: int, color=(255, 224, 170), max_alpha=210):
     """
     Мягкий туман снизу (градиентная альфа от низа к start_y).
@@ -351,22 +420,11 @@ def add_bottom_fog(canvas_rgba: Image.Image, start_y: int, color=(255, 224, 170)
     start_y = max(0, min(H, int(start_y)))
     if start_y >= H:
         return
-    fog = Image.new("RGBA", (W, H), (0, 0, 0, 0))
-    draw = ImageDraw.Draw(fog)
-    # рисуем вертикальный альфа-градиент
-    for y in range(start_y, H):
-        t = (y - start_y) / max(1, (H - start_y))  # 0..1
-        a = int(round(max_alpha * t))              # плавное нарастание к низу
-        draw.line([(0, y), (W, y)], fill=(color[0], color[1], color[2], a))
-    canvas_rgba.alpha_composite(fog)
+    strip = _bottom_fog_strip(W, H, start_y, tuple(int(c) for c in color[:3]), int(max_alpha))
+    canvas_rgba.alpha_composite(strip, (0, start_y))
 
 # ---------- RUNWAY ----------
-RUNWAY_API = "https://api.dev.runwayml.com/v1"
-HEADERS = {
-    "Authorization": f"Bearer {RUNWAY_KEY}",
-    "X-Runway-Version": "2024-11-06",
-    "Content-Type": "application/json",
-}
+RUNWAY_API = RUNWAY_API_BASE
 
 def encode_image_datauri(path: str) -> str:
     with open(path, "rb") as f:
@@ -375,17 +433,56 @@ def encode_image_datauri(path: str) -> str:
     mime = "image/jpeg" if ext in ["jpg","jpeg"] else "image/png"
     return f"data:{mime};base64,{b64}"
 
-def ensure_jpeg_copy(path: str, quality: int = 88) -> str:
+RUNWAY_DATAURI_LIMIT = 5_000_000
+_JPEG_DATAURI_PREFIX = "data:image/jpeg;base64,"
+
+def _jpeg_budget_for_datauri(limit: int) -> int:
+    """Сколько байт JPEG влезает в data URI длиной limit (base64: 4 символа на 3 байта)."""
+    return max(1, (limit - len(_JPEG_DATAURI_PREFIX)) // 4 * 3)
+
+def encode_jpeg_for_budget(im: Image.Image, max_bytes: int | None, quality: int = 88, min_quality: int = 40) -> tuple[bytes, int]:
+    """
+    Кодирует RGB-изображение в JPEG в памяти; если не влезает в max_bytes — бинарный поиск качества
+    в [min_quality, quality). Поиск без optimize (быстрее), финал — с optimize (только уменьшает размер).
+    Возвращает (байты, качество).
+    """
+    def _enc(q: int, optimize: bool) -> bytes:
+        bio = io.BytesIO()
+        im.save(bio, "JPEG", quality=q, optimize=optimize, progressive=True)
+        return bio.getvalue()
+
+    data = _enc(quality, True)
+    if max_bytes is None or len(data) <= max_bytes:
+        return data, quality
+
+    lo, hi = min_quality, quality - 1
+    best: tuple[bytes, int] | None = None
+    while lo <= hi:
+        mid = (lo + hi) // 2
+        cand = _enc(mid, False)
+        if len(cand) <= max_bytes:
+            best, lo = (cand, mid), mid + 1
+        else:
+            hi = mid - 1
+    if best is None:
+        print(f"[JPEG] still over budget at q={min_quality} ({len(data)} > {max_bytes} bytes)")
+        return _enc(min_quality, True), min_quality
+    cand, q = best
+    final = _enc(q, True)
+    return (final if len(final) <= len(cand) else cand), q
+
+def ensure_jpeg_copy(path: str, quality: int = 88, limit: int = RUNWAY_DATAURI_LIMIT) -> str:
     """
-    Делает JPEG-копию файла (оптимизированную) и возвращает путь к .jpg.
+    Делает JPEG-копию файла и возвращает путь к .jpg.
+    Качество подбирается в памяти так, чтобы data URI уложился в limit; на диск пишется один раз.
     """
     im = Image.open(path).convert("RGB")
+    data, q = encode_jpeg_for_budget(im, _jpeg_budget_for_datauri(limit), quality)
     out = os.path.splitext(path)[0] + ".jpg"
-    im.save(out, "JPEG", quality=quality, optimize=True, progressive=True)
-    try:
-        os.sync()  # не у всех ОС есть, ок если свалится
-    except Exception:
-        pass
+    with open(out, "wb") as f:
+        f.write(data)
+    if q != quality:
+        print(f"[JPEG] {out}: q={q} ({len(data)} bytes)")
     return out
 
 def encode_image_as_jpeg_datauri(path: str, quality: int = 88) -> str:
@@ -409,33 +506,45 @@ def cut_foreground_to_png(in_path: str) -> str:
         f.write(out)
     return out_path
 
-def _to_jpeg_copy(src_path: str, quality: int = 88) -> str:
-    im = Image.open(src_path).convert("RGB")
-    out_path = os.path.join("uploads", f"startframe_{uuid.uuid4().hex}.jpg")
-    im.save(out_path, "JPEG", quality=quality, optimize=True, progressive=True)
-    return out_path
+def ensure_runway_datauri_under_limit(path: str, limit: int = RUNWAY_DATAURI_LIMIT) -> tuple[str, str]:
+    """
+    data URI кадра не длиннее limit. Файл читается один раз; если он крупнее — один JPEG-энкод
+    с подбором качества в памяти и одна запись startframe_*.jpg. Возвращает (data URI, путь).
+    """
+    with open(path, "rb") as f:
+        raw = f.read()
+    ext = path.lower().split(".")[-1]
+    mime = "image/jpeg" if ext in ["jpg", "jpeg"] else "image/png"
+    if len(f"data:{mime};base64,") + 4 * ((len(raw) + 2) // 3) <= limit:
+        return f"data:{mime};base64,{base64.b64encode(raw).decode('utf-8')}", path
 
-def ensure_runway_datauri_under_limit(path: str, limit: int = 5_000_000) -> tuple[str, str]:
-    data = encode_image_datauri(path)
-    if len(data) <= limit:
-        return data, path
+    im = Image.open(io.BytesIO(raw)).convert("RGB")
+    data, q = encode_jpeg_for_budget(im, _jpeg_budget_for_datauri(limit), 88)
+    out_path = os.path.join("uploads", f"startframe_{uuid.uuid4().hex}.jpg")
+    with open(out_path, "wb") as f:
+        f.write(data)
+    datauri = _JPEG_DATAURI_PREFIX + base64.b64encode(data).decode("utf-8")
+    print(f"[Runway] using JPEG q={q}, data_uri={len(datauri)} bytes")
+    return datauri, out_path
 
-    last_path = path
-    for q in (88, 80, 72):
+def runway_prompt_image(path: str) -> tuple[str, str]:
+    """
+    Ссылка на стартовый кадр для Runway: HTTPS URL из start_frame_store (кадр кладётся один раз,
+    ключ — хэш содержимого), иначе — data URI в пределах лимита. Возвращает (promptImage, путь).
+    """
+    store = start_frame_store()
+    if store is not None:
         try:
-            jpg = _to_jpeg_copy(path, quality=q)
-            last_path = jpg
-            data = encode_image_datauri(jpg)
-            if len(data) <= limit:
-                print(f"[Runway] using JPEG q={q}, data_uri={len(data)} bytes")
-                return data, jpg
+            url = store.put_file(path)
+            metrics.incr("runway.prompt_image.url")
+            print(f"[Runway] start frame by URL: {url}")
+            return url, path
         except Exception as e:
-            print(f"[Runway] jpeg fallback q={q} failed: {e}")
-
-    print(f"[Runway] still heavy after JPEG attempts, length={len(data)}")
-    return data, last_path
+            print(f"[Runway] start frame store failed ({e}); falling back to data URI")
+    metrics.incr("runway.prompt_image.datauri")
+    return ensure_runway_datauri_under_limit(path)
 
-def _post_runway(payload: dict) -> dict | None:
+def _post_runway(payload: dict) -> tuple[int, object]:
     try:
         _pl = ""
         try:
@@ -468,22 +577,78 @@ def _post_runway(payload: dict) -> dict | None:
             except Exception as _e:
                 print(f"[Runway] payload preview save err: {_e}")
 
-        # Отправка в Runway (заглушка отключена)
-        r = requests.post(f"{RUNWAY_API}/image_to_video", headers=HEADERS, json=payload, timeout=60)
-        if r.status_code == 200:
-            return r.json()
-        print(f"[Runway {r.status_code}] {r.text}")
-        return None
-    except requests.RequestException as e:
+        # Отправка в Runway через общий keep-alive клиент
+        status, body = runway_client.start(payload)
+        if status != 200:
+            print(f"[Runway {status}] {body}")
+        return status, body
+    except httpx.HTTPError as e:
         print(f"[Runway transport error] {e}")
+        return 0, str(e)
+
+# какая форма payload принята Runway последней — чтобы не заливать data URI повторно в отвергнутые формы
+_RUNWAY_VARIANT = {"index": None, "expires": 0.0}
+_RUNWAY_VARIANT_LOCK = threading.Lock()
+_RUNWAY_NON_SCHEMA_HINTS = ("credit", "moderation", "safety", "content policy", "quota", "rate limit")
+
+def _cached_runway_variant() -> int | None:
+    with _RUNWAY_VARIANT_LOCK:
+        if _RUNWAY_VARIANT["index"] is not None and time.time() < _RUNWAY_VARIANT["expires"]:
+            return _RUNWAY_VARIANT["index"]
+        _RUNWAY_VARIANT["index"] = None
         return None
 
+def _remember_runway_variant(index: int | None) -> None:
+    with _RUNWAY_VARIANT_LOCK:
+        _RUNWAY_VARIANT["index"] = index
+        _RUNWAY_VARIANT["expires"] = time.time() + RUNWAY_VARIANT_TTL_SEC if index is not None else 0.0
+
+def _runway_is_schema_error(status: int, body) -> bool:
+    """
+    400/422 из-за формы запроса (лишние/неизвестные поля, не та модель) — имеет смысл пробовать другую форму.
+    Решаем по структуре ответа (issues / "Validation ..." в error), а не по словам в тексте:
+    «invalid API key» или «unknown task» — не ошибка схемы.
+    Кредиты, модерация, авторизация, 5xx и сеть — нет: тот же кадр в другой обёртке упадёт так же.
+    """
+    if status not in (400, 422) or not isinstance(body, dict):
+        return False
+    text = json.dumps(body, ensure_ascii=False, default=str).lower()
+    if any(h in text for h in _RUNWAY_NON_SCHEMA_HINTS):
+        return False
+    issues = body.get("issues") or body.get("errors")
+    if isinstance(issues, list) and issues:
+        return True
+    return str(body.get("error") or "").lower().startswith("validation")
+
+_RUNWAY_LEASES: ContextVar[list | None] = ContextVar("runway_leases", default=None)
+
+
+@contextmanager
+def runway_task() -> Iterator[None]:
+    """
+    Слоты Runway, взятые runway_start внутри блока, освобождаются при выходе из него —
+    и при исключении между запуском задачи и runway_poll, иначе слот держался бы до рестарта.
+    """
+    leases: list = []
+    token = _RUNWAY_LEASES.set(leases)
+    try:
+        yield
+    finally:
+        _RUNWAY_LEASES.reset(token)
+        for lease in leases:
+            runway_governor.release(lease)
+
+
 def runway_start(prompt_image_datauri: str, prompt_text: str, duration: int):
     """
+    prompt_image_datauri — data URI или HTTPS URL кадра (см. runway_prompt_image).
     Порядок попыток:
     1) gen4_turbo + promptImage/promptText + ratio (текущая схема этого API)
     2) gen4_turbo + image/prompt + aspect_ratio (альтернативная)
     3) gen3a_turbo + image/prompt + aspect_ratio (запасной)
+    Принятая форма запоминается на RUNWAY_VARIANT_TTL_SEC и идёт первой; ошибка схемы на ней сбрасывает кэш.
+    Следующая форма пробуется только при ошибке схемы (_runway_is_schema_error); переход на другую
+    форму запоминается, только если прежние отвергнуты с 422 (однозначная валидация).
     """
     variants = [
         {
@@ -509,88 +674,210 @@ def runway_start(prompt_image_datauri: str, prompt_text: str, duration: int):
         },
     ]
 
+    # слот общего (бот + API) лимита задач Runway: держится до завершения задачи в runway_poll
+    # (или до выхода из runway_task, если вызов внутри него)
+    req = current_runway_request()
+    user_on_wait = req.get("on_wait")
+
+    def _on_wait(info: dict) -> None:
+        report_stage("runway_queued", position=info.get("position"), depth=info.get("depth"), eta_sec=info.get("eta_sec"))
+        if user_on_wait:
+            user_on_wait(info)
+
+    lease = runway_governor.acquire(
+        user_key=req.get("user_key") or "anon",
+        priority=req.get("priority") or 0,
+        tag=req.get("tag"),
+        duration=int(duration),
+        on_wait=_on_wait,
+    )
+    scope = _RUNWAY_LEASES.get()
+    if scope is not None:
+        scope.append(lease)
+    try:
+        body = _runway_start_variants(variants)
+    except BaseException:
+        runway_governor.release(lease)
+        raise
+    task_id = body.get("id") or (body.get("task") or {}).get("id")
+    if task_id:
+        runway_governor.bind(lease, task_id)
+        report_stage("runway_submitted", task_id=task_id, expected_sec=int(runway_client.model.expected(int(duration))))
+    else:
+        runway_governor.release(lease)
+    return body
+
+def _runway_start_variants(variants: list[dict]) -> dict:
+    cached = _cached_runway_variant()
+    order = list(range(len(variants)))
+    if cached is not None and cached < len(variants):
+        order.remove(cached)
+        order.insert(0, cached)
+
     last_keys = ""
-    for payload in variants:
-        resp = _post_runway(payload)
-        if resp:
-            return resp
+    cacheable = True
+    for idx in order:
+        payload = variants[idx]
+        status, body = _post_runway(payload)
+        if status == 200 and isinstance(body, dict):
+            if idx != cached and cacheable:
+                _remember_runway_variant(idx)
+            metrics.incr(f"runway.variant_ok.{idx + 1}")
+            return body
+        if not _runway_is_schema_error(status, body):
+            # форма запроса ни при чём — не гоняем тот же data URI в других обёртках
+            raise RuntimeError(f"Runway {status or 'transport error'} (variant {idx + 1}): {str(body)[:300]}")
+        if idx == cached:
+            _remember_runway_variant(None)
+        # 400 с issues бывает и не из-за формы: запасную форму используем, но не закрепляем
+        cacheable = cacheable and status == 422
+        metrics.incr("runway.variant_schema_reject")
         last_keys = f"{list(payload.keys())}"
 
     raise RuntimeError(f"Runway returned 400/4xx for all variants (payload={last_keys}). Check logs above.")
 
-def runway_poll(task_id: str, timeout_sec=300, every=5):
-    """Опрашивает статус задачи Runway с обработкой ошибок сети."""
-    start = time.time()
-    attempts = 0
-    max_attempts = 10
+def runway_poll(task_id: str, timeout_sec=None, every=None, duration: int | None = None):
+    """
+    Ждёт терминального статуса задачи Runway.
+    Опрос делает общий поллер runway_client: момент проверок — по ожидаемому времени генерации
+    для этой длительности, ошибки — backoff с jitter, 429 — по Retry-After.
+    timeout_sec=None — адаптивный таймаут (не меньше 5 минут); `every` оставлен для совместимости.
+    """
+    print(f"[Runway] Waiting for task {task_id}")
+    report = bound_reporter()
 
-    while True:
-        attempts += 1
-        try:
-            print(f"[Runway] Polling task {task_id} (attempt {attempts}/{max_attempts})")
-            rr = requests.get(f"{RUNWAY_API}/tasks/{task_id}", headers=HEADERS, timeout=30)
-            rr.raise_for_status()
-            data = rr.json()
-            st = data.get("status")
-            print(f"[Runway] Status: {st}")
-
-            if st in ("SUCCEEDED","FAILED","ERROR","CANCELED"):
-                return data
-
-            if time.time() - start > timeout_sec:
-                print(f"[Runway] Timeout after {timeout_sec}s")
-                return {"status":"TIMEOUT","raw":data}
-
-            time.sleep(every)
-
-        except requests.exceptions.Timeout:
-            print(f"[Runway] Request timeout (attempt {attempts})")
-            if attempts >= max_attempts:
-                return {"status":"NETWORK_ERROR","error":"Too many timeouts"}
-            time.sleep(10)
-
-        except requests.exceptions.RequestException as e:
-            print(f"[Runway] Network error (attempt {attempts}): {e}")
-            if attempts >= max_attempts:
-                return {"status":"NETWORK_ERROR","error":str(e)}
-            time.sleep(10)
+    def on_progress(data: dict) -> None:
+        if data.get("status") == "RUNNING":
+            fraction = data.get("progress")
+            report("runway_running", fraction if isinstance(fraction, (int, float)) else None)
 
-        except Exception as e:
-            print(f"[Runway] Unexpected error (attempt {attempts}): {e}")
-            if attempts >= max_attempts:
-                return {"status":"ERROR","error":str(e)}
-            time.sleep(10)
+    try:
+        return runway_client.wait(
+            task_id,
+            timeout_sec=timeout_sec,
+            duration=duration,
+            on_progress=on_progress if report is not None else None,
+        )
+    finally:
+        runway_governor.release_task(task_id)
+
+def _segment_is_playable(path: str) -> bool:
+    """Быстрый пробник контейнера: ffprobe читает заголовок и отдаёт длительность > 0."""
+    return _video_duration_sec(path) > 0
 
 def download(url: str, save_path: str):
-    with requests.get(url, stream=True, timeout=300) as r:
-        r.raise_for_status()
-        with open(save_path, "wb") as f:
-            for chunk in r.iter_content(8192):
-                if chunk: f.write(chunk)
-    return save_path
+    return runway_client.download(url, save_path, verify=_segment_is_playable)
+
+TEMP_DIR = "renders/temp"
+# рабочие папки видны всем процессам (бот, веб-API, дочерние процессы пула): владелец — pid в файле .owner
+_WORKSPACE_OWNER = ".owner"
+# без живого владельца папка считается брошенной не раньше, чем через grace (папку могли только что создать)
+_WORKSPACE_GRACE_SEC = 3600
+# pid мог достаться другому процессу после рестарта — дольше этого рендер не живёт
+_WORKSPACE_MAX_AGE_SEC = 6 * 3600
+
+
+@contextmanager
+def job_workspace(prefix: str = "job") -> Iterator[str]:
+    """
+    Отдельная временная папка под промежуточные файлы ОДНОГО рендера.
+    Удаляется при выходе из блока; при ошибке в режиме MF_DEBUG остаётся для разбора.
+    """
+    os.makedirs(TEMP_DIR, exist_ok=True)
+    path = tempfile.mkdtemp(prefix=f"{prefix}_", dir=TEMP_DIR)
+    with open(os.path.join(path, _WORKSPACE_OWNER), "w", encoding="utf-8") as f:
+        f.write(str(os.getpid()))
+    failed = False
+    try:
+        yield path
+    except BaseException:
+        failed = True
+        raise
+    finally:
+        if failed and MF_DEBUG:
+            print(f"[WORKSPACE] kept for debug: {path}")
+        else:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    except OSError:
+        return False
+    return True
+
+
+def _workspace_is_stale(path: str, now: float) -> bool:
+    owner = os.path.join(path, _WORKSPACE_OWNER)
+    try:
+        age = now - os.path.getmtime(owner)
+        with open(owner, encoding="utf-8") as f:
+            pid = int(f.read().strip() or 0)
+    except (OSError, ValueError):
+        # владельца нет (папка только создана или чужая) — судим по возрасту самой папки
+        try:
+            return now - os.path.getmtime(path) > _WORKSPACE_GRACE_SEC
+        except OSError:
+            return False
+    if age > _WORKSPACE_MAX_AGE_SEC:
+        return True
+    return not (pid and _pid_alive(pid))
+
+
+@lru_cache(maxsize=256)
+def _probe_duration_cached(path: str, mtime_ns: int, size: int) -> float:
+    r = subprocess.run(
+        ["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "default=nk=1:nw=1", path],
+        capture_output=True, text=True, check=True
+    )
+    return float(r.stdout.strip() or "0")
 
 def _video_duration_sec(path: str) -> float:
-    """Возвращает длительность видео через ffprobe (секунды)."""
+    """Возвращает длительность видео через ffprobe (секунды). Результат кэшируется по (путь, mtime, размер)."""
     try:
-        r = subprocess.run(
-            ["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "default=nk=1:nw=1", path],
-            capture_output=True, text=True, check=True
-        )
-        return float(r.stdout.strip() or "0")
+        st = os.stat(path)
+        return _probe_duration_cached(os.path.abspath(path), st.st_mtime_ns, st.st_size)
     except Exception:
         return 0.0
 
-def _xfade_two(in1: str, in2: str, out_path: str, fade_sec: float = 0.7):
-    """Сшивает два видео с кроссфейдом (без аудио)."""
-    d1 = _video_duration_sec(in1)
-    offset = max(0.0, d1 - fade_sec)
+def _segment_durations(video_paths: List[str], known: List[float] | None = None) -> List[float]:
+    """
+    Длительности сегментов для расчёта смещений xfade: кэшированный ffprobe,
+    а если он не смог — известная длительность сцены Runway (SCENES[...]["duration"]).
+    """
+    out: List[float] = []
+    for i, vp in enumerate(video_paths):
+        d = _video_duration_sec(vp)
+        if d <= 0 and known and i < len(known) and known[i]:
+            d = float(known[i])
+        out.append(d)
+    return out
+
+def _merge_with_fades(video_paths: List[str], fade_sec: float = 0.7, tmp_dir: str = TEMP_DIR,
+                      durations: List[float] | None = None) -> str:
+    """
+    Склеивает N роликов кроссфейдами за ОДИН вызов ffmpeg (без пересжатия
+    растущего промежуточного файла на каждой сцене). Возвращает путь к итоговому ролику.
+    """
+    assert len(video_paths) >= 2
+    os.makedirs(tmp_dir, exist_ok=True)
+    durs = _segment_durations(video_paths, durations)
+    out_path = os.path.join(tmp_dir, f"xfade_{len(video_paths)}_{uuid.uuid4().hex}.mp4")
+
+    cmd = ["ffmpeg", "-y"]
+    for vp in video_paths:
+        cmd += ["-i", vp]
     # Единый fps/профиль для стабильности
-    _run_ffmpeg([
-        "ffmpeg", "-y",
-        "-i", in1, "-i", in2,
-        "-filter_complex",
-        f"[0:v]fps=24,format=yuv420p[v0];[1:v]fps=24,format=yuv420p[v1];"
-        f"[v0][v1]xfade=transition=fade:duration={fade_sec}:offset={offset},format=yuv420p[v]",
+    fc = [f"[{i}:v]fps=24,format=yuv420p[v{i}]" for i in range(len(video_paths))]
+    fc.append(_xfade_chain_filter([f"v{i}" for i in range(len(video_paths))], durs, fade_sec, out_label="vx"))
+    fc.append("[vx]format=yuv420p[v]")
+    cmd += [
+        "-filter_complex", ";".join(fc),
         "-map", "[v]",
         "-an",
         "-r", "24",
@@ -598,20 +885,9 @@ def _xfade_two(in1: str, in2: str, out_path: str, fade_sec: float = 0.7):
         "-pix_fmt", "yuv420p",
         "-movflags", "+faststart",
         out_path
-    ], tag="xfade", out_hint=out_path)
-
-def _merge_with_fades(video_paths: List[str], fade_sec: float = 0.7) -> str:
-    """Чейним кроссфейды попарно: (((v1 xfade v2) xfade v3) ...). Возвращает путь к итоговому ролику."""
-    assert len(video_paths) >= 2
-    tmp_dir = "renders/temp"
-    os.makedirs(tmp_dir, exist_ok=True)
-    acc = video_paths[0]
-    for i, nxt in enumerate(video_paths[1:], start=1):
-        out_i = os.path.join(tmp_dir, f"xfade_{i}_{uuid.uuid4().hex}.mp4")
-        _xfade_two(acc, nxt, out_i, fade_sec=fade_sec)
-        # следующая итерация будет склеивать out_i с следующим
-        acc = out_i
-    return acc
+    ]
+    _run_ffmpeg(cmd, tag="xfade", out_hint=out_path)
+    return out_path
 
 def _ffmpeg_bin() -> str:
     try:
@@ -780,6 +1056,37 @@ def cutout(path: str) -> Image.Image:
         cut = Image.open(io.BytesIO(cut)).convert("RGBA")
     return cut
 
+def _max_useful_photo_side(canvas_h: int = 1280) -> int:
+    """
+    Больше этого размера (по длинной стороне) пиксели фото в кадр 720×1280 не попадут:
+    человек занимает не меньше PHOTO_MIN_SUBJECT_FRAC высоты фото, а в кадре — не больше
+    LEAN_MAX_VISIBLE_FRAC высоты холста.
+    """
+    frac = max(LEAN_MAX_VISIBLE_FRAC, 0.76)
+    return int(math.ceil(canvas_h * frac / max(0.05, PHOTO_MIN_SUBJECT_FRAC)))
+
+def load_photo_for_layout(path: str, max_side: int | None = None) -> Image.Image:
+    """
+    Открывает фото для вырезки/компоновки: EXIF-ориентация и ОДНО уменьшение до полезного
+    размера (JPEG декодируется сразу в уменьшенном виде через draft). Фото 12–48 Мп иначе
+    целиком идут в rembg и ресайзы, а лишние пиксели всё равно выбрасываются в конце.
+    """
+    max_side = max_side or _max_useful_photo_side()
+    with Image.open(path) as src:
+        orig_size = src.size
+        try:
+            src.draft("RGB", (max_side, max_side))
+        except Exception:
+            pass
+        im = ImageOps.exif_transpose(src).convert("RGBA")
+    if max(im.size) > max_side:
+        k = max_side / max(im.size)
+        im = im.resize((max(1, int(round(im.width * k))), max(1, int(round(im.height * k)))), RESAMPLE.LANCZOS)
+    if im.size != orig_size:
+        print(f"[PHOTO] {os.path.basename(path)}: {orig_size[0]}x{orig_size[1]} → {im.width}x{im.height}")
+    metrics.observe("photo.layout_mpix", im.width * im.height / 1e6)
+    return im
+
 def _resize_fit_center(img: Image.Image, W: int, H: int) -> Image.Image:
     """Вписать картинку в холст W×H с сохранением пропорций и кропом по центру."""
     wr, hr = W / img.width, H / img.height
@@ -845,9 +1152,10 @@ def make_start_frame(photo_paths: List[str], framing_key: str, bg_file: str, lay
     # 2) вырезаем людей
     cuts = []
     for p in photo_paths:
-        im = Image.open(p).convert("RGBA")
+        im = load_photo_for_layout(p)
         cut_rgba = smart_cutout(im)
         cuts.append(cut_rgba)
+    report_stage("start_frame")
 
     if MF_DEBUG:
         try:
@@ -1000,80 +1308,12 @@ def make_start_frame(photo_paths: List[str], framing_key: str, bg_file: str, lay
         L = cuts[0]
         R = cuts[1]
 
-        # --- базовые хелперы ---
-        def _vis_rect(img):
-            (bx, by, bx1, by1), _ = alpha_metrics(img)
-            return bx, by, bx1, by1
-
-        def _vis_w(img):
-            bx, by, bx1, by1 = _vis_rect(img)
-            return max(1, bx1 - bx)
-
-        def _vis_h(img):
-            (bx, by, bx1, by1), yb = alpha_metrics(img)
-            return max(1, yb - by + 1)
-
-        def _scale_abs(img, k):
-            k = float(k)
-            if k <= 0: 
-                return img
-            nw, nh = max(1, int(round(img.width * k))), max(1, int(round(img.height * k)))
-            if nw == img.width and nh == img.height:
-                # принудительно уменьшаем на 1 пикс при k<1, чтобы не зациклиться
-                if k < 1.0:
-                    nw = max(1, img.width - 1)
-                    nh = max(1, img.height - 1)
-            return img.resize((nw, nh), RESAMPLE.LANCZOS)
-
-        def _place_pair(center_x, gap_px, left_limit, right_limit, floor_y):
-            """
-            Ставит пару как ЕДИНУЮ группу внутрь [left_limit, right_limit], сохраняя gap_px и «низ» = floor_y.
-            Возвращает (lx, yl, rx, yr, ra, rb).
-            """
-            bxL, byL, bx1L, by1L = _vis_rect(L)
-            bxR, byR, bx1R, by1R = _vis_rect(R)
-            wL = bx1L - bxL
-            wR = bx1R - bxR
-
-            total = wL + gap_px + wR
-            group_left_desired = int(round(center_x - (wL + gap_px/2)))
-            group_left  = max(left_limit, min(right_limit - total, group_left_desired))
-            group_right = group_left + total
-
-            lx = group_left - bxL
-            rx = group_left + wL + gap_px - bxR
-            yl = place_y_for_floor(L, floor_y)
-            yr = place_y_for_floor(R, floor_y)
-
-            def _rect_at(x, y, img):
-                bx, by, bx1, by1 = _vis_rect(img)
-                return (x + bx, y + by, x + bx1, y + by1)
-
-            ra = _rect_at(lx, yl, L)
-            rb = _rect_at(rx, yr, R)
-            return lx, yl, rx, yr, ra, rb
-
         # --- параметры размещения ---
         MARGIN = 20
         is_full = ("В рост" in framing_key) or ("в рост" in framing_key)
         MAX_VISIBLE_FRAC = LEAN_MAX_VISIBLE_FRAC if is_full else max(LEAN_MAX_VISIBLE_FRAC, 0.76)
         TARGET_VISIBLE_FRAC = min(LEAN_TARGET_VISIBLE_FRAC, MAX_VISIBLE_FRAC)
 
-        # начальный масштаб по видимой высоте
-        def _scale_to_vis_frac(img, target_frac):
-            cur = _vis_h(img) / H
-            if cur <= 1e-6:
-                return img
-            k = max(0.4, min(MAX_UPSCALE, target_frac / cur))
-            return _scale_abs(img, k)
-
-        L = _scale_to_vis_frac(L, TARGET_VISIBLE_FRAC)
-        R = _scale_to_vis_frac(R, TARGET_VISIBLE_FRAC)
-        if (_vis_h(L)/H) > MAX_VISIBLE_FRAC:
-            L = _scale_to_vis_frac(L, MAX_VISIBLE_FRAC)
-        if (_vis_h(R)/H) > MAX_VISIBLE_FRAC:
-            R = _scale_to_vis_frac(R, MAX_VISIBLE_FRAC)
-
         # НИКАКОЙ «полосы» — используем всю ширину кадра (кроме безопасных полей)
         left_limit  = MARGIN
         right_limit = W - MARGIN
@@ -1097,70 +1337,71 @@ def make_start_frame(photo_paths: List[str], framing_key: str, bg_file: str, lay
             elif "gap_pct" in layout:  # в процентах от ширины кадра
                 ideal_gap = max(min_gap, int(W * float(layout["gap_pct"]) / 100.0))
 
-        # --- 1) АВТОСКЕЙЛ ПО ГОРИЗОНТАЛИ (равномерно) ---
-        for _ in range(60):
-            wL = _vis_w(L)
-            wR = _vis_w(R)
-            need = wL + wR + min_gap
-            if need <= available_width:
+        # --- 1) МАСШТАБ В ЗАМКНУТОЙ ФОРМЕ ---
+        # bbox каждого выреза меряем один раз на оригинале; видимые размеры масштабируются линейно.
+        def _vis_size(img):
+            (bx, by, bx1, by1), yb = alpha_metrics(img)
+            return max(1, bx1 - bx), max(1, yb - by + 1)
+
+        def _height_scale(vis_h):
+            cur = vis_h / H
+            k = max(0.4, min(MAX_UPSCALE, TARGET_VISIBLE_FRAC / cur))
+            if cur * k > MAX_VISIBLE_FRAC:
+                k = MAX_VISIBLE_FRAC / cur
+            return k
+
+        (w0L, h0L), (w0R, h0R) = _vis_size(L), _vis_size(R)
+        kL, kR = _height_scale(h0L), _height_scale(h0R)
+
+        # равномерный даунскейл пары, чтобы wL + wR + min_gap уместились в доступную ширину;
+        # небольшой запас покрывает ореол LANCZOS по краям альфы
+        pair_w = w0L * kL + w0R * kR
+        if pair_w + min_gap > available_width:
+            fit = (available_width - min_gap) / pair_w * 0.995
+            kL *= fit
+            kR *= fit
+
+        # --- 2) ОДИН РЕСАЙЗ С ОРИГИНАЛА ---
+        def _resize_once(img, k):
+            nw, nh = max(1, int(round(img.width * k))), max(1, int(round(img.height * k)))
+            if (nw, nh) == img.size:
+                return img
+            return img.resize((nw, nh), RESAMPLE.LANCZOS)
+
+        # --- 3) ПОСТАНОВКА ГРУППЫ ---
+        # Итоговые bbox → позиции: пара центрируется и клампится в [left_limit, right_limit],
+        # внутренний зазор задаётся напрямую, поэтому перекрытия нет по построению.
+        # Округление ресайза может сделать пару шире доступного: тогда ужимаем на перелёт
+        # и ресайзим заново с оригинала (обычно хватает одного повтора).
+        for _ in range(3):
+            L = _resize_once(cuts[0], kL)
+            R = _resize_once(cuts[1], kR)
+            (bxL, byL, bx1L, by1L), ybL = alpha_metrics(L)
+            (bxR, byR, bx1R, by1R), ybR = alpha_metrics(R)
+            wL = bx1L - bxL
+            wR = bx1R - bxR
+
+            gap_px = ideal_gap
+            # если идеальный зазор не помещается — берём минимальный
+            if wL + wR + gap_px > available_width:
+                gap_px = min_gap
+
+            total = wL + gap_px + wR
+            overflow = total - available_width
+            if overflow <= 0:
                 break
-            k = max(0.40, min(0.995, (available_width / need) * 0.985))  # чуть с запасом
-            L = _scale_abs(L, k)
-            R = _scale_abs(R, k)
-        # страховка от редких «не сжалось»
-        wL = _vis_w(L); wR = _vis_w(R)
-        if (wL + wR + min_gap) > available_width:
-            k = (available_width - min_gap) / max(1, (wL + wR))
-            k = max(0.40, min(0.99, k))
-            L = _scale_abs(L, k); R = _scale_abs(R, k)
-
-        # --- 2) СТАВИМ ГРУППУ ВНУТРЬ ПОЛОСЫ (без перекрытия) ---
-        gap_px = ideal_gap
-        # если идеальный зазор не помещается — берём минимальный
-        if _vis_w(L) + _vis_w(R) + gap_px > available_width:
-            gap_px = min_gap
-
-        lx, yl, rx, yr, ra, rb = _place_pair(center_x, gap_px, left_limit, right_limit, virtual_floor_y)
-
-        # --- 3) HEADROOM/CLAMP: даунскейлим ВСЮ группу, пока всё не ок ---
-        headroom_px = int(HEADROOM_FRAC * H)
-
-        def _top_ok(r):  # r = (x0,y0,x1,y1)
-            return r[1] > headroom_px
-
-        # --- 3) HEADROOM: людей больше не уменьшаем; place_y_for_floor гарантирует,
-        # что верх в кадре, а ноги «на полу».
-        pass
+            fit = max(0.1, (wL + wR - overflow - 1) / max(1, wL + wR))
+            kL *= fit
+            kR *= fit
+
+        group_left_desired = int(round(center_x - (wL + gap_px/2)))
+        group_left = max(left_limit, min(right_limit - total, group_left_desired))
 
-        # --- 4) ФИНАЛЬНЫЕ ГАРАНТИИ: no overlap, всё внутри пределов ---
-        # Пере-проверка зазора после всех клампов
-        def _inner_gap(a, b):  # a,b = rects
-            return b[0] - a[2]
-
-        if _inner_gap(ra, rb) < min_gap:
-            # Разводим как группу без изменения зазора (двигаем только центр)
-            total = _vis_w(L) + gap_px + _vis_w(R)
-            # ставим по центру, затем клампим группу
-            group_left = max(left_limit, min(right_limit - total, int(round(center_x - (total/2)))))
-            lx = group_left - _vis_rect(L)[0]
-            rx = group_left + _vis_w(L) + gap_px - _vis_rect(R)[0]
-            yl = place_y_for_floor(L, virtual_floor_y); yr = place_y_for_floor(R, virtual_floor_y)
-            ra = (lx + _vis_rect(L)[0], yl + _vis_rect(L)[1], lx + _vis_rect(L)[2], yl + _vis_rect(L)[3])
-            rb = (rx + _vis_rect(R)[0], yr + _vis_rect(R)[1], rx + _vis_rect(R)[2], yr + _vis_rect(R)[3])
-
-            # если всё ещё тесно — минимальный даунскейл пары и повторная постановка
-            trips = 0
-            while _inner_gap(ra, rb) < min_gap and trips < 20:
-                L = _scale_abs(L, 0.98)
-                R = _scale_abs(R, 0.98)
-                total = _vis_w(L) + min_gap + _vis_w(R)
-                if total > available_width:
-                    # гарантированный вариант: сжимаем так, чтобы ровно поместилось
-                    k = (available_width - min_gap) / max(1, (_vis_w(L) + _vis_w(R)))
-                    L = _scale_abs(L, k); R = _scale_abs(R, k)
-                gap_px = max(min_gap, min(ideal_gap, available_width - (_vis_w(L) + _vis_w(R))))
-                lx, yl, rx, yr, ra, rb = _place_pair(center_x, gap_px, left_limit, right_limit, virtual_floor_y)
-                trips += 1
+        lx = group_left - bxL
+        rx = group_left + wL + gap_px - bxR
+        # низ видимого силуэта — на линии virtual_floor_y (как place_y_for_floor)
+        yl = int(virtual_floor_y - (ybL - byL + 1)) - byL
+        yr = int(virtual_floor_y - (ybR - byR + 1)) - byR
 
         # Рисуем строго слева-направо, перекрытий геометрически нет
         draw_with_shadow(canvas, L, lx, yl)
@@ -1407,24 +1648,27 @@ def create_memorial_title_image(width, height, fio, dates, mem_text, output_path
     img.save(output_path)
     return output_path
 
-def postprocess_concat_ffmpeg(video_paths: List[str], music_path: str|None, title_text: str, save_as: str, bg_overlay_file: str|None = None, titles_meta: dict|None = None, candle_path: str|None = None) -> str:
-    """Постобработка видео через ffmpeg (склейка + фон-анимация + водяной знак + музыка). С фолбэком, faststart и портативной копией."""
-    import tempfile
-
-    def _escape_concat_path(p: str) -> str:
-        # экранируем одинарные кавычки для concat-файла
-        return os.path.abspath(p).replace("'", "'\\''")
-
-    temp_dir = "renders/temp"
-    os.makedirs(temp_dir, exist_ok=True)
-
-    # Если несколько сцен — сначала делаем промежуточную склейку с кроссфейдами,
-    # а дальше работаем как с одним видео.
-    if len(video_paths) > 1:
-        premerged = _merge_with_fades(video_paths, fade_sec=CROSSFADE_SEC)
-        video_paths = [premerged]
+def _xfade_chain_filter(labels: List[str], durations: List[float], fade_sec: float, out_label: str = "vx") -> str:
+    """
+    Строит цепочку xfade для N входов: [a][b]xfade→[x1]; [x1][c]xfade→[x2]; ...
+    Смещения считаются заранее из длительностей, без промежуточных файлов.
+    """
+    if len(labels) == 1:
+        return f"[{labels[0]}]null[{out_label}]"
+    parts = []
+    acc = labels[0]
+    acc_len = float(durations[0])
+    for i, (lbl, dur) in enumerate(zip(labels[1:], durations[1:]), start=1):
+        offset = max(0.0, acc_len - fade_sec)
+        nxt = out_label if i == len(labels) - 1 else f"x{i}"
+        parts.append(
+            f"[{acc}][{lbl}]xfade=transition=fade:duration={fade_sec}:offset={offset:.3f}[{nxt}]"
+        )
+        acc = nxt
+        acc_len = acc_len + float(dur) - fade_sec
+    return ";".join(parts)
 
-    # 1) Финальный титр (PNG)
+def _render_title_image(temp_dir: str, title_text: str, titles_meta: dict | None, candle_path: str | None) -> str:
     title_img_path = f"{temp_dir}/title.png"
     if titles_meta:
         create_memorial_title_image(
@@ -1437,8 +1681,42 @@ def postprocess_concat_ffmpeg(video_paths: List[str], music_path: str|None, titl
         )
     else:
         create_title_image(720, 1280, title_text, title_img_path)
+    return title_img_path
+
+_TITLE_CACHE = DiskLRUCache(os.path.join(CACHE_DIR, "titles"), max_entries=TITLE_CACHE_MAX_ENTRIES, suffix=".mp4")
+_TITLE_CLIP_VERSION = 1  # поднять при изменении вёрстки титров или параметров кодирования
 
-    # 2) 2-секундный ролик из титра
+def _title_cache_key(title_text: str, titles_meta: dict | None, candle_path: str | None) -> str:
+    """Ключ титра: всё, от чего зависят байты ролика (текст, свеча, шрифты, WM, разрешение)."""
+    fonts = [file_fingerprint(p) for p in TITLE_FONT_REGULAR_CANDIDATES + TITLE_FONT_BOLD_CANDIDATES]
+    if titles_meta:
+        content = {
+            "fio": titles_meta.get("fio") or "",
+            "dates": titles_meta.get("dates") or "",
+            "mem": titles_meta.get("mem") or "",
+            "candle": file_fingerprint(candle_path or CANDLE_PATH),
+            "candle_w": CANDLE_WIDTH_FRAC,
+            "pad": os.environ.get("TITLE_PAD", "24"),
+            "wm": file_fingerprint(WATERMARK_PATH),
+            "wm_w": WM_CORNER_WIDTH_PX,
+            "wm_m": WM_CORNER_MARGIN_PX,
+        }
+    else:
+        content = {"text": title_text}
+    return content_key(_TITLE_CLIP_VERSION, "720x1280@24x2s", content, [f for f in fonts if f])
+
+def _title_clip(temp_dir: str, title_text: str, titles_meta: dict | None, candle_path: str | None) -> str:
+    """
+    2-секундный ролик титра. Одинаковые титры (чаще всего DEFAULT_TITLE_TEXT)
+    берутся из дискового LRU-кэша и не перекодируются на каждом рендере.
+    """
+    key = _title_cache_key(title_text, titles_meta, candle_path)
+    cached = _TITLE_CACHE.get(key)
+    if cached:
+        print(f"[TITLE] cache hit {key[:12]}")
+        return cached
+
+    title_img_path = _render_title_image(temp_dir, title_text, titles_meta, candle_path)
     title_video_path = f"{temp_dir}/title_video.mp4"
     _run_ffmpeg([
         "ffmpeg", "-y", "-loop", "1", "-i", title_img_path,
@@ -1446,15 +1724,110 @@ def postprocess_concat_ffmpeg(video_paths: List[str], music_path: str|None, titl
         "-movflags", "+faststart",
         title_video_path
     ], tag="title_video", out_hint=title_video_path)
+    try:
+        return _TITLE_CACHE.put_file(key, title_video_path)
+    except Exception as e:
+        print(f"[TITLE] cache store failed: {e}")
+        return title_video_path
+
+def _postprocess_compiled(video_paths: List[str], music_path: str | None, title_clip_path: str, save_as: str, bg_overlay_file: str | None,
+                          durations: List[float] | None = None) -> str:
+    """
+    Вся постобработка одним вызовом ffmpeg: кроссфейды → титр → фон-анимация →
+    угловой водяной знак → музыка. Видео декодируется и кодируется ровно один раз.
+    """
+    W, H, FPS = 720, 1280, 24
+    cmd: list[str] = ["ffmpeg", "-y"]
+    for vp in video_paths:
+        cmd += ["-i", vp]
+    idx = len(video_paths)
+
+    title_idx = idx
+    cmd += ["-i", title_clip_path]
+    idx += 1
+
+    bg_idx = None
+    if bg_overlay_file and os.path.isfile(bg_overlay_file):
+        bg_idx = idx
+        cmd += ["-loop", "1", "-i", bg_overlay_file]
+        idx += 1
+    else:
+        print("BG overlay disabled (no file)")
+
+    wm_idx = None
+    if os.path.isfile(WATERMARK_PATH):
+        wm_idx = idx
+        cmd += ["-i", WATERMARK_PATH]
+        idx += 1
+
+    music_idx = None
+    if music_path and os.path.isfile(music_path):
+        music_idx = idx
+        cmd += ["-stream_loop", "-1", "-i", music_path]
+        idx += 1
+
+    norm = f"fps={FPS},scale={W}:{H},setsar=1,format=yuv420p"
+    fc = [f"[{i}:v]{norm}[s{i}]" for i in range(len(video_paths))]
+    durs = _segment_durations(video_paths, durations)
+    fc.append(_xfade_chain_filter([f"s{i}" for i in range(len(video_paths))], durs, CROSSFADE_SEC))
+    fc.append(f"[{title_idx}:v]{norm}[title]")
+    fc.append("[vx][title]concat=n=2:v=1:a=0[vc]")
+    cur = "vc"
+    if bg_idx is not None:
+        fc.append(
+            f"[{bg_idx}:v]scale={W}:{H},boxblur=25:1,format=rgba,colorchannelmixer=aa=0.08,setsar=1[ov]"
+        )
+        fc.append(f"[{cur}][ov]overlay=x='t*2':y=0:shortest=1[vb]")
+        cur = "vb"
+    if wm_idx is not None:
+        fc.append(f"[{wm_idx}:v]scale={WM_CORNER_WIDTH_PX}:-1[wm]")
+        fc.append(f"[{cur}][wm]overlay=W-w-{WM_CORNER_MARGIN_PX}:{WM_CORNER_MARGIN_PX}[vw]")
+        cur = "vw"
+    fc.append(f"[{cur}]format=yuv420p[vout]")
+    if music_idx is not None:
+        fc.append(f"[{music_idx}:a]volume=0.6[aout]")
+
+    cmd += ["-filter_complex", ";".join(fc), "-map", "[vout]"]
+    if music_idx is not None:
+        cmd += ["-map", "[aout]", "-c:a", "aac", "-ar", "44100", "-shortest"]
+    elif len(video_paths) == 1:
+        # как multi-step: без музыки у одной сцены остаётся её собственный звук (если он есть)
+        cmd += ["-map", "0:a?", "-c:a", "copy"]
+    else:
+        # кроссфейд нескольких сцен звук не переносит (_merge_with_fades: -an) — и здесь тоже
+        cmd += ["-an"]
+    cmd += [
+        "-r", str(FPS),
+        "-c:v", "libx264", "-crf", "18", "-preset", "veryfast",
+        "-pix_fmt", "yuv420p",
+        "-movflags", "+faststart",
+        save_as,
+    ]
+    _run_ffmpeg(cmd, tag="post_compiled", out_hint=save_as)
+    return save_as
 
-    # 3) Файл для concat
+def _postprocess_multistep(video_paths: List[str], music_path: str | None, title_clip_path: str, save_as: str, bg_overlay_file: str | None, temp_dir: str,
+                           durations: List[float] | None = None) -> str:
+    """Старая схема: отдельный процесс ffmpeg на каждый шаг (фолбэк для compiled)."""
+    def _escape_concat_path(p: str) -> str:
+        # экранируем одинарные кавычки для concat-файла
+        return os.path.abspath(p).replace("'", "'\\''")
+
+    # Если несколько сцен — сначала делаем промежуточную склейку с кроссфейдами,
+    # а дальше работаем как с одним видео.
+    if len(video_paths) > 1:
+        premerged = _merge_with_fades(video_paths, fade_sec=CROSSFADE_SEC, tmp_dir=temp_dir, durations=durations)
+        video_paths = [premerged]
+
+    # 3) Файл для concat (титр уже готов: _title_clip, часто из кэша)
     concat_list_path = f"{temp_dir}/concat_list.txt"
     with open(concat_list_path, "w", encoding="utf-8") as f:
         for vp in video_paths:
             f.write(f"file '{_escape_concat_path(vp)}'\n")
-        f.write(f"file '{_escape_concat_path(title_video_path)}'\n")
+        f.write(f"file '{_escape_concat_path(title_clip_path)}'\n")
 
     # 4) Склейка (попытка без перекодирования)
+    report_stage("post_concat")
     concat_video_path = f"{temp_dir}/concat_video.mp4"
     try:
         _run_ffmpeg([
@@ -1477,6 +1850,7 @@ def postprocess_concat_ffmpeg(video_paths: List[str], music_path: str|None, titl
     # 4.5) Деликатная анимация фона (если есть картинка)
     bg_anim_video_path = concat_video_path
     if bg_overlay_file and os.path.isfile(bg_overlay_file):
+        report_stage("post_bg")
         try:
             bg_anim_video_path = f"{temp_dir}/with_bg_anim.mp4"
             _run_ffmpeg([
@@ -1500,10 +1874,11 @@ def postprocess_concat_ffmpeg(video_paths: List[str], music_path: str|None, titl
     # 5) Водяной знак
     wm_video_path = bg_anim_video_path
     if os.path.isfile(WATERMARK_PATH):
+        report_stage("post_watermark")
         wm_video_path = f"{temp_dir}/with_watermark.mp4"
         _run_ffmpeg([
             "ffmpeg", "-y", "-i", bg_anim_video_path, "-i", WATERMARK_PATH,
-            "-filter_complex", "[1:v]scale=120:-1[wm];[0:v][wm]overlay=W-w-24:24",
+            "-filter_complex", f"[1:v]scale={WM_CORNER_WIDTH_PX}:-1[wm];[0:v][wm]overlay=W-w-{WM_CORNER_MARGIN_PX}:{WM_CORNER_MARGIN_PX}",
             "-c:v", "libx264", "-crf", "18", "-preset", "veryfast", "-pix_fmt", "yuv420p",
             "-c:a", "copy",
             "-movflags", "+faststart",
@@ -1511,6 +1886,7 @@ def postprocess_concat_ffmpeg(video_paths: List[str], music_path: str|None, titl
         ], tag="wm_corner", out_hint=wm_video_path)
 
     # 6) Музыка (или просто сохранить)
+    report_stage("post_music")
     if music_path and os.path.isfile(music_path):
         # зациклить музыку и подложить под видео
         _run_ffmpeg([
@@ -1539,6 +1915,30 @@ def postprocess_concat_ffmpeg(video_paths: List[str], music_path: str|None, titl
 
     return save_as
 
+def postprocess_concat_ffmpeg(video_paths: List[str], music_path: str|None, title_text: str, save_as: str, bg_overlay_file: str|None = None, titles_meta: dict|None = None, candle_path: str|None = None,
+                              segment_durations: List[float] | None = None) -> str:
+    """
+    Постобработка видео через ffmpeg (склейка + фон-анимация + водяной знак + музыка). С фолбэком, faststart и портативной копией.
+    segment_durations — известные длительности сцен (запасной вариант, если ffprobe не сработал).
+    """
+    # Каждый рендер работает в своей папке: параллельные задачи не затирают
+    # друг другу title.png/concat_video.mp4 и т.п.
+    with job_workspace("post") as temp_dir:
+        # 1-2) Финальный титр: PNG → 2-секундный ролик (или готовый из кэша)
+        report_stage("post_titles")
+        title_clip_path = _title_clip(temp_dir, title_text, titles_meta, candle_path)
+
+        if POSTPROCESS_MODE == "compiled":
+            report_stage("post_compose")
+            try:
+                return _postprocess_compiled(video_paths, music_path, title_clip_path, save_as, bg_overlay_file,
+                                             durations=segment_durations)
+            except Exception as e:
+                print(f"[POST] compiled graph failed, falling back to multi-step: {e}")
+
+        return _postprocess_multistep(video_paths, music_path, title_clip_path, save_as, bg_overlay_file, temp_dir,
+                                      durations=segment_durations)
+
 DEFAULT_TITLE_TEXT = "Memory Forever — Память навсегда с вами"
 FINAL_VIDEO_WIDTH = 720
 FINAL_VIDEO_HEIGHT = 1280
@@ -1568,16 +1968,17 @@ def _runway_segment_from_startframe(
     session_id: str | None = None,
 ) -> str:
     send_path = ensure_jpeg_copy(start_frame_path) if RUNWAY_SEND_JPEG else start_frame_path
-    data_uri, used_path = ensure_runway_datauri_under_limit(send_path)
+    data_uri, used_path = runway_prompt_image(send_path)
     if not data_uri or len(data_uri) < 64:
         raise RuntimeError("EMPTY_START_FRAME_DATA")
 
-    start_resp = runway_start(data_uri, prompt, duration)
-    task_id = start_resp.get("id") or start_resp.get("task", {}).get("id")
-    if not task_id:
-        raise RuntimeError("RUNWAY_NO_TASK_ID")
+    with runway_task():
+        start_resp = runway_start(data_uri, prompt, duration)
+        task_id = start_resp.get("id") or start_resp.get("task", {}).get("id")
+        if not task_id:
+            raise RuntimeError("RUNWAY_NO_TASK_ID")
 
-    poll = runway_poll(task_id)
+        poll = runway_poll(task_id, duration=duration)
     status = (poll or {}).get("status")
     if status != "SUCCEEDED":
         raise RuntimeError(f"RUNWAY_STATUS_{status}")
@@ -1593,6 +1994,7 @@ def _runway_segment_from_startframe(
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     seg_name = f"{owner_label}_{timestamp}_{uuid.uuid4().hex}.mp4"
     seg_path = os.path.join("renders", seg_name)
+    report_stage("download")
     download(url, seg_path)
 
     needs_wm = (
@@ -1602,6 +2004,7 @@ def _runway_segment_from_startframe(
         and (not session_id or not is_free_hugs_whitelisted(session_id))
     )
     if needs_wm:
+        report_stage("watermark")
         apply_fullscreen_watermark(
             in_video=seg_path,
             out_video=seg_path,
@@ -1659,6 +2062,7 @@ def render_full_video_from_photos_web(
             print(f"[WEB_RENDER] photo#{idx} open failed ({type(exc).__name__}: {exc})")
             raise RuntimeError(f"Invalid image file: {path}") from exc
 
+    report_stage("cutout")
     start_frame_path, layout_metrics = make_start_frame(photo_paths, format_key, bg_abs, layout=None)
 
     if (
@@ -1705,6 +2109,7 @@ def render_full_video_from_photos_web(
         bg_overlay_file=bg_abs,
         titles_meta=titles_meta,
         candle_path=CANDLE_PATH,
+        segment_durations=[duration],
     )
     return os.path.abspath(final_path)
 
@@ -1758,10 +2163,31 @@ def cleanup_dir_keep_last_n(dir_path: str, keep_n: int = 20, extensions: tuple[s
     except FileNotFoundError:
         pass
 
+def _cleanup_temp_dir() -> None:
+    """
+    Чистит renders/temp от брошенных рабочих папок (владелец умер или папка слишком старая).
+    Папки рендеров, идущих в любом процессе, и свежие файлы не трогает.
+    """
+    try:
+        names = os.listdir(TEMP_DIR)
+    except FileNotFoundError:
+        return
+    now = time.time()
+    for name in names:
+        p = os.path.join(TEMP_DIR, name)
+        try:
+            if os.path.isdir(p):
+                if _workspace_is_stale(p, now):
+                    shutil.rmtree(p, ignore_errors=True)
+            elif now - os.path.getmtime(p) > _WORKSPACE_GRACE_SEC:
+                os.remove(p)
+        except Exception:
+            pass
+
 def cleanup_artifacts(keep_last: int = 20):
-    # Полностью чистим временную папку рендеров (кроме режима отладки)
+    # Чистим временную папку рендеров (кроме режима отладки и активных рендеров)
     if not OAI_DEBUG:
-        shutil.rmtree("renders/temp", ignore_errors=True)
+        _cleanup_temp_dir()
     # Оставляем только N последних оригиналов и финалов
     cleanup_dir_keep_last_n("uploads", keep_n=keep_last, extensions=(".jpg", ".jpeg", ".png", ".webp"))
     cleanup_dir_keep_last_n("renders", keep_n=keep_last, extensions=(".mp4", ".mov", ".mkv", ".webm"))
@@ -0,0 +1,91 @@
+from __future__ import annotations
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator
+
+# Этапы рендера и их доля в общем прогрессе (%). runway_running растягивается на RUNWAY_BAND
+# по progress, который отдаёт Runway; остальные — точки.
+STAGE_PROGRESS: Dict[str, int] = {
+    "queued": 0,
+    "started": 5,
+    "cutout": 10,
+    "start_frame": 20,
+    "runway_queued": 25,
+    "runway_submitted": 30,
+    "runway_running": 35,
+    "download": 78,
+    "watermark": 82,
+    "post_titles": 85,
+    "post_compose": 88,
+    "post_concat": 88,
+    "post_bg": 91,
+    "post_watermark": 94,
+    "post_music": 97,
+    "done": 100,
+}
+RUNWAY_BAND = (35, 75)
+
+Reporter = Callable[[str, int, Dict[str, Any]], None]
+
+_REPORTER: ContextVar[Reporter | None] = ContextVar("render_progress", default=None)
+
+
+def stage_percent(stage: str, fraction: float | None = None) -> int:
+    if stage == "runway_running" and fraction is not None:
+        lo, hi = RUNWAY_BAND
+        return int(lo + (hi - lo) * min(1.0, max(0.0, float(fraction))))
+    return STAGE_PROGRESS.get(stage, 0)
+
+
+def report_stage(stage: str, fraction: float | None = None, **detail: Any) -> None:
+    """Сообщить об этапе текущего рендера; без подписчика — no-op."""
+    reporter = _REPORTER.get()
+    if reporter is None:
+        return
+    try:
+        reporter(stage, stage_percent(stage, fraction), detail)
+    except Exception as exc:  # noqa: BLE001
+        print(f"[PROGRESS] reporter error at {stage}: {exc}")
+
+
+def bound_reporter() -> Callable[..., None] | None:
+    """report_stage, привязанный к текущему подписчику — для колбэков из чужих потоков (loop Runway)."""
+    reporter = _REPORTER.get()
+    if reporter is None:
+        return None
+
+    def _report(stage: str, fraction: float | None = None, **detail: Any) -> None:
+        token = _REPORTER.set(reporter)
+        try:
+            report_stage(stage, fraction, **detail)
+        finally:
+            _REPORTER.reset(token)
+
+    return _report
+
+
+@contextmanager
+def progress_reporter(reporter: Reporter) -> Iterator[None]:
+    token = _REPORTER.set(reporter)
+    try:
+        yield
+    finally:
+        _REPORTER.reset(token)
+
+
+def call_with_progress(reporter: Reporter, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """Обёртка для пулов потоков: контекст не наследуется, ставим подписчика в рабочем потоке."""
+    with progress_reporter(reporter):
+        return fn(*args, **kwargs)
+
+
+__all__ = [
+    "RUNWAY_BAND",
+    "STAGE_PROGRESS",
+    "bound_reporter",
+    "call_with_progress",
+    "progress_reporter",
+    "report_stage",
+    "stage_percent",
+]
@@ -0,0 +1,160 @@
+from __future__ import annotations
+
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator
+
+try:
+    from rembg import remove, new_session  # type: ignore[attr-defined]
+except Exception as exc:  # noqa: BLE001
+    remove = None  # type: ignore[assignment]
+    new_session = None  # type: ignore[assignment]
+    _REMBG_IMPORT_ERROR: Exception | None = exc
+else:
+    _REMBG_IMPORT_ERROR = None
+
+from ..config import (
+    PROJECT_ROOT,
+    REMBG_INTER_OP_THREADS,
+    REMBG_INTRA_OP_THREADS,
+    REMBG_POOL_SIZE,
+    REMBG_WARM_MODELS,
+)
+from ..metrics import metrics
+
+os.environ.setdefault("U2NET_HOME", str(PROJECT_ROOT / "models"))
+
+
+def ensure_rembg_available() -> None:
+    if remove is None or new_session is None:
+        message = "rembg is not installed; background removal is unavailable on this host."
+        if _REMBG_IMPORT_ERROR is not None:
+            raise ModuleNotFoundError(message) from _REMBG_IMPORT_ERROR
+        raise ModuleNotFoundError(message)
+
+
+def _session_options():
+    """SessionOptions onnxruntime с заданным числом потоков (0 — оставить значение по умолчанию)."""
+    if not (REMBG_INTRA_OP_THREADS or REMBG_INTER_OP_THREADS):
+        return None
+    try:
+        import onnxruntime as ort
+    except Exception:  # noqa: BLE001
+        return None
+    opts = ort.SessionOptions()
+    if REMBG_INTRA_OP_THREADS:
+        opts.intra_op_num_threads = REMBG_INTRA_OP_THREADS
+    if REMBG_INTER_OP_THREADS:
+        opts.inter_op_num_threads = REMBG_INTER_OP_THREADS
+    return opts
+
+
+def _create_session(model: str):
+    ensure_rembg_available()
+    assert new_session is not None
+    opts = _session_options()
+    if opts is not None:
+        # new_session() берёт потоки только из OMP_NUM_THREADS, поэтому при явной
+        # настройке создаём класс сессии сами
+        try:
+            from rembg.sessions import sessions_class  # type: ignore[import-not-found]
+
+            for cls in sessions_class:
+                if cls.name() == model:
+                    return cls(model, opts)
+        except Exception as exc:  # noqa: BLE001
+            print(f"[REMBG] custom SessionOptions unsupported ({exc}); using defaults")
+    return new_session(model)
+
+
+class RembgSessionPool:
+    """
+    Пул ONNX-сессий rembg: до `size` сессий на модель, чтобы параллельные
+    вырезания не стояли в очереди за одной сессией. Сессии создаются лениво
+    (или заранее через warm_up) и переиспользуются.
+    """
+
+    def __init__(self, size: int = REMBG_POOL_SIZE):
+        self.size = max(1, int(size))
+        self._lock = threading.Lock()
+        self._idle: Dict[str, queue.LifoQueue] = {}
+        self._created: Dict[str, int] = {}
+
+    def _idle_queue(self, model: str) -> queue.LifoQueue:
+        with self._lock:
+            q = self._idle.get(model)
+            if q is None:
+                q = self._idle[model] = queue.LifoQueue()
+                self._created[model] = 0
+            return q
+
+    def _checkout(self, model: str):
+        q = self._idle_queue(model)
+        try:
+            return q.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            can_create = self._created[model] < self.size
+            if can_create:
+                self._created[model] += 1
+        if not can_create:
+            return q.get()
+        started = time.perf_counter()
+        try:
+            sess = _create_session(model)
+        except Exception:
+            with self._lock:
+                self._created[model] -= 1
+            raise
+        metrics.observe(f"rembg.session_load_ms.{model}", (time.perf_counter() - started) * 1000.0)
+        metrics.set_gauge(f"rembg.sessions.{model}", self._created[model])
+        return sess
+
+    @contextmanager
+    def session(self, model: str) -> Iterator[object]:
+        sess = self._checkout(model)
+        try:
+            yield sess
+        finally:
+            self._idle_queue(model).put(sess)
+
+    def warm_up(self, models: list[str] | None = None) -> float:
+        """Загружает модели и прогоняет пустой кадр (аллокации ONNX). Возвращает время в секундах."""
+        ensure_rembg_available()
+        assert remove is not None
+        from PIL import Image
+
+        started = time.perf_counter()
+        for model in models if models is not None else REMBG_WARM_MODELS:
+            t0 = time.perf_counter()
+            try:
+                with self.session(model) as sess:
+                    remove(Image.new("RGB", (64, 64)), session=sess)
+            except Exception as exc:  # noqa: BLE001
+                print(f"[REMBG] warm-up failed for {model}: {exc}")
+                continue
+            ms = (time.perf_counter() - t0) * 1000.0
+            metrics.observe(f"rembg.warmup_ms.{model}", ms)
+            print(f"[REMBG] warmed {model} in {ms:.0f} ms")
+        total = time.perf_counter() - started
+        metrics.set_gauge("rembg.warmup_total_sec", total)
+        return total
+
+
+rembg_pool = RembgSessionPool()
+
+
+def start_warm_up() -> threading.Thread | None:
+    """Фоновый прогрев моделей при старте процесса (не блокирует запуск бота/API)."""
+    if not REMBG_WARM_MODELS or remove is None:
+        return None
+    t = threading.Thread(target=rembg_pool.warm_up, name="rembg-warmup", daemon=True)
+    t.start()
+    return t
+
+
+__all__ = ["RembgSessionPool", "ensure_rembg_available", "rembg_pool", "remove", "start_warm_up"]
@@ -0,0 +1,662 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import hmac
+import json
+import os
+import random
+import threading
+import time
+from dataclasses import dataclass, field
+from email.utils import parsedate_to_datetime
+from typing import Any, Callable, Dict, List
+
+import httpx
+
+from ..config import (
+    RUNWAY_API_BASE,
+    RUNWAY_CALLBACK_DIR,
+    RUNWAY_CALLBACKS_ENABLED,
+    RUNWAY_KEY,
+    RUNWAY_MAX_CONNECTIONS,
+    RUNWAY_POLL_CONCURRENCY,
+    RUNWAY_POLL_INTERVAL_SEC,
+    RUNWAY_POLL_MAX_INTERVAL_SEC,
+    RUNWAY_TIMINGS_FILE,
+    RUNWAY_WEBHOOK_SECRET,
+)
+from ..metrics import metrics
+
+HEADERS = {
+    "Authorization": f"Bearer {RUNWAY_KEY}",
+    "X-Runway-Version": "2024-11-06",
+    "Content-Type": "application/json",
+}
+
+TERMINAL_STATUSES = ("SUCCEEDED", "FAILED", "ERROR", "CANCELED")
+
+# стартовые оценки времени генерации (сек) по длительности клипа, пока нет истории
+_PRIOR_COMPLETION_SEC = {5: 45.0, 10: 80.0}
+_MIN_POLL_TIMEOUT_SEC = 300.0
+_CALLBACK_MAX_SKEW_SEC = 300
+_DOWNLOAD_CHUNK = 1 << 20
+
+
+def _retry_after_sec(response: httpx.Response | None) -> float | None:
+    """Retry-After в секундах (число или HTTP-дата); None, если заголовка нет."""
+    if response is None:
+        return None
+    raw = (response.headers.get("Retry-After") or "").strip()
+    if not raw:
+        return None
+    try:
+        return max(0.0, float(raw))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(raw).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _backoff_sec(attempt: int, base: float = 2.0, cap: float = 60.0) -> float:
+    """Экспоненциальная задержка с «equal jitter»: половина фиксирована, половина случайна."""
+    exp = min(cap, base * (2 ** max(0, attempt - 1)))
+    return exp / 2 + random.uniform(0, exp / 2)
+
+
+def sign_callback(body: bytes, timestamp: int, secret: str = RUNWAY_WEBHOOK_SECRET) -> str:
+    """Значение заголовка X-Runway-Signature: t=<unix>,v1=<hmac_sha256(secret, "<t>.<body>")>."""
+    mac = hmac.new(secret.encode("utf-8"), f"{timestamp}.".encode("utf-8") + body, hashlib.sha256)
+    return f"t={timestamp},v1={mac.hexdigest()}"
+
+
+def verify_callback(body: bytes, header: str | None, secret: str = RUNWAY_WEBHOOK_SECRET) -> bool:
+    if not secret or not header:
+        return False
+    parts = dict(p.split("=", 1) for p in header.split(",") if "=" in p)
+    try:
+        ts = int(parts.get("t", ""))
+    except ValueError:
+        return False
+    if abs(time.time() - ts) > _CALLBACK_MAX_SKEW_SEC:
+        return False
+    expected = sign_callback(body, ts, secret).split("v1=", 1)[1]
+    return hmac.compare_digest(expected, parts.get("v1", ""))
+
+
+class CompletionRegistry:
+    """
+    Межпроцессный реестр завершённых задач: колбэк кладёт <task_id>.json,
+    поллер процесса, который ждёт задачу (бот или API), забирает файл.
+    """
+
+    def __init__(self, directory: str = RUNWAY_CALLBACK_DIR, max_age_sec: float = 3600.0):
+        self.directory = directory
+        self.max_age_sec = max_age_sec
+        self._last_gc = 0.0
+
+    def _path(self, task_id: str) -> str:
+        safe = "".join(ch for ch in str(task_id) if ch.isalnum() or ch in "-_")
+        return os.path.join(self.directory, f"{safe}.json")
+
+    def publish(self, task_id: str, data: dict) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(task_id)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp, path)
+
+    def take(self, task_id: str) -> dict | None:
+        path = self._path(task_id)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        return data if isinstance(data, dict) else None
+
+    def gc(self) -> None:
+        """Удаляет колбэки, которые никто не забрал (процесс-владелец умер)."""
+        now = time.time()
+        if now - self._last_gc < 600:
+            return
+        self._last_gc = now
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return
+        for name in names:
+            p = os.path.join(self.directory, name)
+            try:
+                if now - os.path.getmtime(p) > self.max_age_sec:
+                    os.remove(p)
+            except OSError:
+                pass
+
+
+class CompletionModel:
+    """
+    EWMA времени выполнения задач Runway по длительности клипа.
+    Хранится в JSON, чтобы оценки переживали рестарт процесса.
+    """
+
+    def __init__(self, path: str = RUNWAY_TIMINGS_FILE, alpha: float = 0.2):
+        self.path = path
+        self.alpha = alpha
+        self._lock = threading.Lock()
+        self._data: Dict[str, dict] = {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                loaded = json.load(f)
+            if isinstance(loaded, dict):
+                self._data = loaded
+        except (OSError, ValueError):
+            pass
+
+    def expected(self, duration: int | None) -> float:
+        d = int(duration or 10)
+        with self._lock:
+            rec = self._data.get(str(d))
+        if rec and rec.get("ewma"):
+            return float(rec["ewma"])
+        return _PRIOR_COMPLETION_SEC.get(d, 8.0 * d + 5.0)
+
+    def observe(self, duration: int | None, elapsed_sec: float) -> None:
+        d = str(int(duration or 10))
+        with self._lock:
+            rec = self._data.get(d)
+            if rec and rec.get("ewma"):
+                rec["ewma"] = (1 - self.alpha) * float(rec["ewma"]) + self.alpha * elapsed_sec
+                rec["n"] = int(rec.get("n", 0)) + 1
+            else:
+                self._data[d] = {"ewma": elapsed_sec, "n": 1}
+            snapshot = json.dumps(self._data, ensure_ascii=False, indent=2)
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(snapshot)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            print(f"[Runway] timings save error: {e}")
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {k: dict(v) for k, v in self._data.items()}
+
+
+@dataclass
+class _Watch:
+    task_id: str
+    deadline: float
+    duration: int | None = None
+    created: float = field(default_factory=time.monotonic)
+    next_at: float = 0.0
+    futures: List[asyncio.Future] = field(default_factory=list)
+    listeners: List[Callable[[dict], None]] = field(default_factory=list)
+    errors: int = 0
+    checks: int = 0
+    last: dict | None = None
+
+
+class RunwayClient:
+    """
+    Асинхронный клиент Runway на отдельном потоке с event loop.
+    Один httpx.AsyncClient (keep-alive пул соединений) на процесс и один поллер,
+    который опрашивает незавершённые задачи и резолвит их future.
+    Момент опроса каждой задачи планируется по ожидаемому времени генерации
+    (CompletionModel); ошибки — экспоненциальный backoff с jitter, 429 — пауза по Retry-After.
+    При RUNWAY_CALLBACKS_ENABLED поллер раз в секунду забирает и колбэки из CompletionRegistry.
+    Публичный API Runway не принимает адрес колбэка для задачи (колбэки шлёт только
+    fake_runway и внешние интеграции), поэтому в проде флаг выключен и всё держится на опросе.
+    Синхронный код (бот, рендер-потоки) вызывает обёртки start()/wait()/download().
+    """
+
+    def __init__(
+        self,
+        base_url: str = RUNWAY_API_BASE,
+        max_connections: int = RUNWAY_MAX_CONNECTIONS,
+        poll_interval: float = RUNWAY_POLL_INTERVAL_SEC,
+        max_poll_interval: float = RUNWAY_POLL_MAX_INTERVAL_SEC,
+        poll_concurrency: int = RUNWAY_POLL_CONCURRENCY,
+        max_errors: int = 10,
+        model: CompletionModel | None = None,
+        registry: CompletionRegistry | None = None,
+        callbacks_enabled: bool = RUNWAY_CALLBACKS_ENABLED,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.max_connections = max(1, int(max_connections))
+        self.poll_interval = float(poll_interval)
+        self.max_poll_interval = max(self.poll_interval, float(max_poll_interval))
+        self.poll_concurrency = max(1, int(poll_concurrency))
+        self.max_errors = max(1, int(max_errors))
+        self.model = model or CompletionModel()
+        self.registry = registry or CompletionRegistry()
+        # колбэки только ускоряют завершение: реестр проверяется раз в секунду, опрос идёт как обычно
+        self.callbacks_enabled = callbacks_enabled
+        self.registry_check_sec = 1.0
+        self._lock = threading.Lock()
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._client: httpx.AsyncClient | None = None
+        self._dl_client: httpx.AsyncClient | None = None
+        self._watches: Dict[str, _Watch] = {}
+        self._task_durations: Dict[str, int] = {}
+        self._wakeup: asyncio.Event | None = None
+        self._poller: asyncio.Task | None = None
+        self._paused_until = 0.0  # глобальная пауза после 429
+        self._throttle_streak = 0  # 429 подряд — пауза общая, поэтому и счётчик общий
+
+    # --- event loop ---
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is not None:
+                return self._loop
+            loop = asyncio.new_event_loop()
+            ready = threading.Event()
+
+            def _run():
+                asyncio.set_event_loop(loop)
+                loop.call_soon(ready.set)
+                loop.run_forever()
+
+            threading.Thread(target=_run, name="runway-io", daemon=True).start()
+            ready.wait()
+            self._loop = loop
+            return loop
+
+    def _run(self, coro, timeout: float | None = None):
+        fut = asyncio.run_coroutine_threadsafe(coro, self._ensure_loop())
+        return fut.result(timeout)
+
+    def _http(self) -> httpx.AsyncClient:
+        # вызывается только из потока loop — гонок нет
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers=HEADERS,
+                timeout=httpx.Timeout(60.0, connect=15.0),
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                    keepalive_expiry=60.0,
+                ),
+            )
+        return self._client
+
+    def _download_http(self) -> httpx.AsyncClient:
+        # отдельный пул без заголовков API: ссылки на результат — подписанные URL CDN
+        if self._dl_client is None:
+            self._dl_client = httpx.AsyncClient(
+                timeout=httpx.Timeout(300.0, connect=15.0),
+                follow_redirects=True,
+                limits=httpx.Limits(max_connections=self.max_connections, keepalive_expiry=60.0),
+            )
+        return self._dl_client
+
+    # --- запросы ---
+    async def post_json(self, path: str, payload: dict, max_throttle_retries: int = 3) -> tuple[int, Any]:
+        """Возвращает (status_code, json|text). На 429 ждёт Retry-After и повторяет тот же запрос."""
+        for attempt in range(1, max_throttle_retries + 2):
+            with metrics.timed("runway.post_ms"):
+                r = await self._http().post(path, json=payload)
+            metrics.incr(f"runway.post.{r.status_code}")
+            if r.status_code == 429 and attempt <= max_throttle_retries:
+                wait = _retry_after_sec(r)
+                wait = min(60.0, wait if wait is not None else _backoff_sec(attempt))
+                print(f"[Runway] 429 on {path}, retry in {wait:.1f}s")
+                await asyncio.sleep(wait)
+                continue
+            break
+        try:
+            body: Any = r.json()
+        except ValueError:
+            body = r.text
+        if r.status_code == 200 and isinstance(body, dict):
+            task_id = body.get("id") or (body.get("task") or {}).get("id")
+            if task_id and payload.get("duration"):
+                self._task_durations[str(task_id)] = int(payload["duration"])
+        return r.status_code, body
+
+    async def get_task(self, task_id: str) -> dict:
+        r = await self._http().get(f"/tasks/{task_id}", timeout=30.0)
+        r.raise_for_status()
+        return r.json()
+
+    # --- поллер ---
+    def default_timeout(self, duration: int | None) -> float:
+        return max(_MIN_POLL_TIMEOUT_SEC, 4.0 * self.model.expected(duration))
+
+    async def wait_async(
+        self,
+        task_id: str,
+        timeout_sec: float | None = None,
+        duration: int | None = None,
+        on_progress: Callable[[dict], None] | None = None,
+    ) -> dict:
+        """Ждёт терминального статуса задачи; опрос делает общий поллер. on_progress — каждый промежуточный ответ."""
+        loop = self._ensure_loop()
+        if asyncio.get_running_loop() is not loop:
+            # вызов из чужого loop (FastAPI) — регистрируем ожидание в loop клиента
+            return await asyncio.wrap_future(
+                asyncio.run_coroutine_threadsafe(self.wait_async(task_id, timeout_sec, duration, on_progress), loop)
+            )
+        if duration is None:
+            duration = self._task_durations.get(task_id)
+        if timeout_sec is None:
+            timeout_sec = self.default_timeout(duration)
+        fut: asyncio.Future = loop.create_future()
+        watch = self._watches.get(task_id)
+        if watch is None:
+            watch = self._watches[task_id] = _Watch(
+                task_id=task_id, deadline=time.monotonic() + timeout_sec, duration=duration
+            )
+            watch.next_at = min(watch.created + self._first_check_delay(watch), watch.deadline)
+        else:
+            watch.deadline = max(watch.deadline, time.monotonic() + timeout_sec)
+        watch.futures.append(fut)
+        if on_progress is not None:
+            watch.listeners.append(on_progress)
+        metrics.set_gauge("runway.tasks_in_flight", len(self._watches))
+        self._start_poller()
+        return await fut
+
+    def _first_check_delay(self, watch: _Watch) -> float:
+        # клип почти никогда не готов раньше ~70% ожидаемого времени — до этого не опрашиваем
+        return max(self.poll_interval, 0.7 * self.model.expected(watch.duration))
+
+    def _adaptive_delay(self, watch: _Watch, data: dict) -> float:
+        elapsed = time.monotonic() - watch.created
+        expected = self.model.expected(watch.duration)
+        st = data.get("status")
+        if st in ("PENDING", "THROTTLED"):
+            # задача ещё в очереди у Runway — генерация не началась
+            return self.max_poll_interval
+        progress = data.get("progress")
+        if isinstance(progress, (int, float)) and 0.05 <= progress < 1:
+            remaining = elapsed * (1 - progress) / progress
+            return min(self.max_poll_interval, max(self.poll_interval, 0.8 * remaining))
+        if elapsed < 0.7 * expected:
+            return max(self.poll_interval, 0.7 * expected - elapsed)
+        if elapsed < 1.5 * expected:
+            return self.poll_interval
+        # сильно дольше обычного — реже
+        return min(self.max_poll_interval, self.poll_interval * 2)
+
+    def _reschedule(self, watch: _Watch, at: float) -> None:
+        """Следующая проверка не позже дедлайна; после дедлайна — TIMEOUT, что бы ни случилось с опросом."""
+        if time.monotonic() >= watch.deadline:
+            print(f"[Runway] Timeout waiting for {watch.task_id}")
+            self._resolve(watch, {"status": "TIMEOUT", "raw": watch.last})
+            return
+        watch.next_at = min(at, watch.deadline)
+
+    def _start_poller(self) -> None:
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        if self._poller is None or self._poller.done():
+            self._poller = asyncio.get_running_loop().create_task(self._poll_forever())
+        self._wakeup.set()
+
+    async def _poll_forever(self) -> None:
+        assert self._wakeup is not None
+        sem = asyncio.Semaphore(self.poll_concurrency)
+        while True:
+            if self.callbacks_enabled:
+                self._drain_registry()
+            now = time.monotonic()
+            if now < self._paused_until:
+                # на паузе опрашивать нельзя — задачи с истёкшим дедлайном завершаем без запроса
+                for w in [w for w in self._watches.values() if now >= w.deadline]:
+                    self._reschedule(w, now)
+            if not self._watches:
+                sleep_for = None
+            else:
+                resume_at = max(self._paused_until, min(w.next_at for w in self._watches.values()))
+                resume_at = min(resume_at, min(w.deadline for w in self._watches.values()))
+                sleep_for = max(0.0, resume_at - now)
+                if self.callbacks_enabled:
+                    sleep_for = min(sleep_for, self.registry_check_sec)
+            due_now = any(w.next_at <= now for w in self._watches.values()) and now >= self._paused_until
+            if not due_now:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=sleep_for)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            started = time.monotonic()
+            due = [w for w in self._watches.values() if w.next_at <= started]
+            await asyncio.gather(*(self._poll_one(w, sem) for w in due))
+            metrics.observe("runway.poll_tick_ms", (time.monotonic() - started) * 1000.0)
+            metrics.set_gauge("runway.tasks_in_flight", len(self._watches))
+
+    async def _poll_one(self, watch: _Watch, sem: asyncio.Semaphore) -> None:
+        async with sem:
+            if time.monotonic() < self._paused_until:
+                self._reschedule(watch, self._paused_until)
+                return
+            watch.checks += 1
+            metrics.incr("runway.poll_requests")
+            try:
+                data = await self.get_task(watch.task_id)
+            except httpx.HTTPStatusError as e:
+                if e.response.status_code == 429:
+                    self._throttled(watch, e.response)
+                    return
+                self._poll_error(watch, e, "NETWORK_ERROR")
+                return
+            except httpx.HTTPError as e:
+                self._poll_error(watch, e, "NETWORK_ERROR")
+                return
+            except Exception as e:  # noqa: BLE001
+                self._poll_error(watch, e, "ERROR")
+                return
+
+        watch.errors = 0
+        self._throttle_streak = 0
+        watch.last = data
+        st = data.get("status")
+        if watch.task_id not in self._watches:
+            return  # уже завершена колбэком, пока шёл запрос
+        if st in TERMINAL_STATUSES:
+            self._complete(watch, data, source="poll")
+        elif time.monotonic() > watch.deadline:
+            print(f"[Runway] Timeout waiting for {watch.task_id}")
+            self._resolve(watch, {"status": "TIMEOUT", "raw": data})
+        else:
+            for listener in watch.listeners:
+                try:
+                    listener(data)
+                except Exception as exc:  # noqa: BLE001
+                    print(f"[Runway] progress listener error for {watch.task_id}: {exc}")
+            self._reschedule(watch, time.monotonic() + self._adaptive_delay(watch, data))
+
+    def _drain_registry(self) -> None:
+        for watch in list(self._watches.values()):
+            data = self.registry.take(watch.task_id)
+            if data is not None:
+                self._complete(watch, data, source="callback")
+        self.registry.gc()
+
+    def _complete(self, watch: _Watch, data: dict, source: str) -> None:
+        st = data.get("status")
+        if st not in TERMINAL_STATUSES:
+            return
+        elapsed = time.monotonic() - watch.created
+        print(f"[Runway] Task {watch.task_id}: {st} after {elapsed:.0f}s ({watch.checks} checks, via {source})")
+        metrics.incr(f"runway.completed_via.{source}")
+        if st == "SUCCEEDED":
+            self.model.observe(watch.duration, elapsed)
+        self._resolve(watch, data)
+
+    def notify(self, task_id: str | None = None) -> None:
+        """Будит поллер (вызывается обработчиком колбэка в этом же процессе)."""
+        loop = self._loop
+        if loop is None or self._wakeup is None:
+            return
+        loop.call_soon_threadsafe(self._wakeup.set)
+
+    def _throttled(self, watch: _Watch, response: httpx.Response) -> None:
+        # лимит общий на ключ API — притормаживаем весь поллер, а не одну задачу
+        metrics.incr("runway.poll_429")
+        self._throttle_streak += 1
+        wait = _retry_after_sec(response)
+        if wait is None:
+            wait = _backoff_sec(self._throttle_streak, base=self.poll_interval, cap=self.max_poll_interval * 3)
+        self._paused_until = max(self._paused_until, time.monotonic() + wait)
+        self._reschedule(watch, self._paused_until)
+        print(f"[Runway] 429 while polling, pausing {wait:.1f}s")
+
+    def _poll_error(self, watch: _Watch, error: Exception, status: str) -> None:
+        watch.errors += 1
+        print(f"[Runway] Poll error for {watch.task_id} ({watch.errors}/{self.max_errors}): {error}")
+        if watch.errors >= self.max_errors:
+            self._resolve(watch, {"status": status, "error": str(error)})
+            return
+        self._reschedule(watch, time.monotonic() + _backoff_sec(watch.errors))
+
+    def _resolve(self, watch: _Watch, result: dict) -> None:
+        self._watches.pop(watch.task_id, None)
+        self._task_durations.pop(watch.task_id, None)
+        metrics.incr(f"runway.task.{result.get('status')}")
+        metrics.observe("runway.checks_per_task", watch.checks)
+        for fut in watch.futures:
+            if not fut.done():
+                fut.set_result(result)
+
+    # --- загрузка ---
+    async def download_async(
+        self,
+        url: str,
+        save_path: str,
+        verify: Callable[[str], bool] | None = None,
+        max_attempts: int = 5,
+    ) -> str:
+        """
+        Качает результат в <save_path>.part блоками по 1 МБ; после обрыва докачивает через Range.
+        Размер сверяется с Content-Length/Content-Range, затем verify(path) (быстрый пробник контейнера),
+        и только потом файл атомарно переименовывается в save_path.
+        """
+        tmp = f"{save_path}.part"
+        total: int | None = None
+        verified_once = False
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+
+        for attempt in range(1, max_attempts + 1):
+            have = os.path.getsize(tmp) if os.path.exists(tmp) else 0
+            headers = {"Range": f"bytes={have}-"} if have else {}
+            try:
+                async with self._download_http().stream("GET", url, headers=headers) as r:
+                    if r.status_code == 416 and total is not None and have == total:
+                        pass  # уже всё скачано
+                    else:
+                        r.raise_for_status()
+                        if have and r.status_code != 206:
+                            have = 0  # сервер проигнорировал Range — качаем заново
+                        total = self._expected_total(r, have) or total
+                        # запись на диск — в потоке: медленный диск не должен стопорить опрос всех задач на runway-io
+                        f = await asyncio.to_thread(open, tmp, "ab" if have else "wb")
+                        try:
+                            async for chunk in r.aiter_bytes(_DOWNLOAD_CHUNK):
+                                await asyncio.to_thread(f.write, chunk)
+                        finally:
+                            await asyncio.to_thread(f.close)
+            except httpx.HTTPStatusError:
+                raise
+            except httpx.TransportError as e:
+                if attempt >= max_attempts:
+                    raise
+                wait = _backoff_sec(attempt)
+                got = os.path.getsize(tmp) if os.path.exists(tmp) else 0
+                print(f"[Runway] download interrupted at {got} bytes ({e}); resume in {wait:.1f}s")
+                metrics.incr("runway.download_resumes")
+                await asyncio.sleep(wait)
+                continue
+
+            size = os.path.getsize(tmp)
+            if total is not None and size != total:
+                if size > total or attempt >= max_attempts:
+                    os.remove(tmp)
+                    raise IOError(f"download size mismatch: {size} != {total} for {save_path}")
+                continue  # недокачали без ошибки транспорта — докачиваем Range
+
+            if verify is not None and not await asyncio.to_thread(verify, tmp):
+                os.remove(tmp)
+                if verified_once or attempt >= max_attempts:
+                    raise IOError(f"downloaded file failed probe: {save_path}")
+                verified_once = True
+                total = None
+                print(f"[Runway] downloaded file failed probe, retrying from scratch: {save_path}")
+                continue
+
+            os.replace(tmp, save_path)
+            metrics.observe("runway.download_bytes", size)
+            return save_path
+
+        raise IOError(f"download failed after {max_attempts} attempts: {save_path}")
+
+    @staticmethod
+    def _expected_total(r: httpx.Response, have: int) -> int | None:
+        """Полный размер файла: из Content-Range (206) или have + Content-Length."""
+        cr = r.headers.get("Content-Range") or ""
+        if "/" in cr:
+            tail = cr.rsplit("/", 1)[1].strip()
+            if tail.isdigit():
+                return int(tail)
+        cl = r.headers.get("Content-Length")
+        if cl and cl.isdigit() and "Content-Encoding" not in r.headers:
+            return have + int(cl)
+        return None
+
+    # --- синхронные обёртки ---
+    def start(self, payload: dict) -> tuple[int, Any]:
+        return self._run(self.post_json("/image_to_video", payload))
+
+    def wait(
+        self,
+        task_id: str,
+        timeout_sec: float | None = None,
+        duration: int | None = None,
+        on_progress: Callable[[dict], None] | None = None,
+    ) -> dict:
+        return self._run(self.wait_async(task_id, timeout_sec, duration, on_progress))
+
+    def download(self, url: str, save_path: str, verify: Callable[[str], bool] | None = None) -> str:
+        return self._run(self.download_async(url, save_path, verify))
+
+    def snapshot(self) -> dict:
+        return {
+            "tasks_in_flight": len(self._watches),
+            "poll_interval_sec": self.poll_interval,
+            "max_poll_interval_sec": self.max_poll_interval,
+            "paused_for_sec": max(0.0, self._paused_until - time.monotonic()),
+            "callbacks_enabled": self.callbacks_enabled,
+            "completion_model": self.model.snapshot(),
+        }
+
+
+runway_client = RunwayClient()
+
+__all__ = [
+    "CompletionModel",
+    "CompletionRegistry",
+    "HEADERS",
+    "RunwayClient",
+    "TERMINAL_STATUSES",
+    "runway_client",
+    "sign_callback",
+    "verify_callback",
+]
@@ -0,0 +1,43 @@
+from __future__ import annotations
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Callable, List, Sequence
+
+from ..config import SCENE_MAX_WORKERS
+
+
+class SceneScheduler:
+    """
+    Рендер сцен заказа параллельно: все сцены уходят в работу сразу (лимит задач — runway_governor),
+    каждая по готовности скачивается и дообрабатывается в своём потоке,
+    on_done вызывается по мере завершения, run() возвращается, когда готова последняя.
+    """
+
+    def __init__(self, max_workers: int = SCENE_MAX_WORKERS):
+        self._pool = ThreadPoolExecutor(max_workers=max(1, int(max_workers)), thread_name_prefix="scene")
+
+    def run(
+        self,
+        items: Sequence[Any],
+        fn: Callable[[Any], Any],
+        on_done: Callable[[int, Any, Any, BaseException | None], None] | None = None,
+    ) -> List[Any]:
+        """Результаты в порядке items; для упавших сцен — исключение вместо результата."""
+        futures = {self._pool.submit(fn, item): idx for idx, item in enumerate(items)}
+        results: List[Any] = [None] * len(items)
+        for fut in as_completed(futures):
+            idx = futures[fut]
+            err = fut.exception()
+            res = None if err is not None else fut.result()
+            results[idx] = err if err is not None else res
+            if on_done:
+                try:
+                    on_done(idx, items[idx], res, err)
+                except Exception as exc:  # noqa: BLE001
+                    print(f"[SCENES] on_done error for #{idx}: {exc}")
+        return results
+
+
+scene_scheduler = SceneScheduler()
+
+__all__ = ["SceneScheduler", "scene_scheduler"]
@@ -0,0 +1,362 @@
+from __future__ import annotations
+
+import atexit
+import json
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Tuple
+
+from .config import (
+    SESSION_FLUSH_SEC,
+    SESSION_IDLE_TTL_SEC,
+    SESSION_MAX_IN_MEMORY,
+    SESSION_PERSIST_TTL_SEC,
+)
+from .db import connect, register_schema, transaction
+
+register_schema("sessions", """
+CREATE TABLE IF NOT EXISTS sessions (
+    ns         TEXT NOT NULL,
+    key        TEXT NOT NULL,
+    data       TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (ns, key)
+);
+CREATE INDEX IF NOT EXISTS idx_sessions_updated ON sessions(ns, updated_at);
+""")
+
+# промах сессии запоминается на это время: `uid in users` для незнакомых не ходит в SQLite каждый раз
+_MISS_TTL_SEC = 60.0
+
+# типы, которых нет в JSON, кодируются объектом с одним служебным ключом
+_TUPLE, _SET, _PAIRS = "__tuple__", "__set__", "__pairs__"
+_TAGS = (_TUPLE, _SET, _PAIRS)
+
+
+def _encode(value: Any) -> Any:
+    if value is None or isinstance(value, (str, bool, int, float)):
+        return value
+    if isinstance(value, list):
+        return [_encode(v) for v in value]
+    if isinstance(value, tuple):
+        return {_TUPLE: [_encode(v) for v in value]}
+    if isinstance(value, (set, frozenset)):
+        return {_SET: [_encode(v) for v in value]}
+    if isinstance(value, dict):
+        if all(isinstance(k, str) for k in value) and not (len(value) == 1 and next(iter(value)) in _TAGS):
+            return {k: _encode(v) for k, v in value.items()}
+        # нестроковые ключи (uid, индексы сцен) JSON превратил бы в строки
+        return {_PAIRS: [[_encode(k), _encode(v)] for k, v in value.items()]}
+    raise TypeError(f"{type(value).__name__} is not serializable for the session store")
+
+
+def _decode(value: Any) -> Any:
+    if isinstance(value, list):
+        return [_decode(v) for v in value]
+    if not isinstance(value, dict):
+        return value
+    if len(value) == 1:
+        tag, items = next(iter(value.items()))
+        if tag == _TUPLE:
+            return tuple(_decode(v) for v in items)
+        if tag == _SET:
+            return {_decode(v) for v in items}
+        if tag == _PAIRS:
+            return {_decode(k): _decode(v) for k, v in items}
+    return {k: _decode(v) for k, v in value.items()}
+
+
+def dumps(value: dict, **kwargs: Any) -> str:
+    """JSON с сохранением tuple/set/нестроковых ключей; прочие типы — TypeError, а не тихий str()."""
+    return json.dumps(_encode(value), ensure_ascii=False, **kwargs)
+
+
+def loads(raw: str) -> Any:
+    return _decode(json.loads(raw))
+
+
+class SessionBackend(ABC):
+    """Постоянное хранилище сессий. Значения — dict, сериализованные через dumps()."""
+
+    @abstractmethod
+    def load(self, ns: str, key: str) -> dict | None:
+        ...
+
+    @abstractmethod
+    def save_many(self, ns: str, items: List[Tuple[str, str]]) -> None:
+        """items: (key, результат dumps())."""
+
+    @abstractmethod
+    def delete(self, ns: str, key: str) -> None:
+        ...
+
+    @abstractmethod
+    def gc(self, ns: str, older_than: float) -> int:
+        ...
+
+    @abstractmethod
+    def find(self, ns: str, field: str, value: Any) -> List[str]:
+        """Ключи сессий, у которых верхнеуровневое поле field равно value."""
+
+
+class SqliteSessionBackend(SessionBackend):
+    """Таблица sessions в общей SQLite (bot/db.py)."""
+
+    def load(self, ns: str, key: str) -> dict | None:
+        row = connect().execute("SELECT data FROM sessions WHERE ns = ? AND key = ?", (ns, key)).fetchone()
+        if row is None:
+            return None
+        try:
+            data = loads(row["data"])
+        except ValueError:
+            return None
+        return data if isinstance(data, dict) else None
+
+    def save_many(self, ns: str, items: List[Tuple[str, str]]) -> None:
+        now = time.time()
+        with transaction() as c:
+            c.executemany(
+                "INSERT INTO sessions (ns, key, data, updated_at) VALUES (?, ?, ?, ?)"
+                " ON CONFLICT(ns, key) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at",
+                [(ns, key, data, now) for key, data in items],
+            )
+
+    def delete(self, ns: str, key: str) -> None:
+        connect().execute("DELETE FROM sessions WHERE ns = ? AND key = ?", (ns, key))
+
+    def gc(self, ns: str, older_than: float) -> int:
+        cur = connect().execute("DELETE FROM sessions WHERE ns = ? AND updated_at < ?", (ns, older_than))
+        return cur.rowcount or 0
+
+    def find(self, ns: str, field: str, value: Any) -> List[str]:
+        rows = connect().execute(
+            "SELECT key FROM sessions WHERE ns = ? AND json_extract(data, ?) = ?",
+            (ns, f"$.{field}", value),
+        ).fetchall()
+        return [row["key"] for row in rows]
+
+
+class SessionStore(MutableMapping):
+    """
+    dict-подобное хранилище сессий: горячие — в памяти (LRU + TTL простоя),
+    изменения сбрасываются в backend фоновым потоком раз в flush_sec (write-behind).
+    Промах в памяти подгружает сессию из backend — после рестарта пользователь продолжает с того же места.
+
+    Вызывающий код мутирует полученный dict на месте, поэтому при сбросе проверяется каждая
+    сессия, к которой обращались, но в backend пишутся только те, чей снимок изменился.
+    Код, который работает с сессией дольше одного обработчика (рендер, фоновые потоки),
+    держит её через hold() или pinned: такую сессию не вытесняем — перечитанная из backend
+    копия разошлась бы с той, что он меняет. Итерация и len() — только по сессиям в памяти.
+    """
+
+    def __init__(
+        self,
+        namespace: str,
+        backend: SessionBackend | None = None,
+        max_entries: int = SESSION_MAX_IN_MEMORY,
+        idle_ttl_sec: float = SESSION_IDLE_TTL_SEC,
+        persist_ttl_sec: float = SESSION_PERSIST_TTL_SEC,
+        flush_sec: float = SESSION_FLUSH_SEC,
+        pinned: Callable[[Any], bool] | None = None,
+    ):
+        self.namespace = namespace
+        self.backend = backend or SqliteSessionBackend()
+        self.max_entries = max(1, int(max_entries))
+        self.idle_ttl_sec = float(idle_ttl_sec)
+        self.persist_ttl_sec = float(persist_ttl_sec)
+        self.flush_sec = float(flush_sec)
+        self.pinned = pinned or (lambda _key: False)
+        self._lock = threading.RLock()
+        self._data: "OrderedDict[Any, dict]" = OrderedDict()
+        self._touched: Dict[Any, float] = {}
+        self._dirty: set = set()
+        self._saved: Dict[Any, int] = {}
+        self._holds: Dict[Any, int] = {}
+        self._missing: "OrderedDict[Any, float]" = OrderedDict()
+        self._flusher: threading.Thread | None = None
+        self._last_gc = 0.0
+        atexit.register(self.flush)
+
+    # --- MutableMapping ---
+    def __getitem__(self, key: Any) -> dict:
+        with self._lock:
+            if key not in self._data:
+                missed_at = self._missing.get(key)
+                if missed_at is not None and time.monotonic() - missed_at < _MISS_TTL_SEC:
+                    raise KeyError(key)
+                try:
+                    loaded = self.backend.load(self.namespace, str(key))
+                except Exception as exc:  # noqa: BLE001
+                    print(f"[SESSIONS] load error for {key}: {exc}")
+                    loaded = None
+                if loaded is None:
+                    self._remember_miss(key)
+                    raise KeyError(key)
+                self._missing.pop(key, None)
+                self._data[key] = loaded
+                self._saved[key] = hash(dumps(loaded))
+                self._evict()
+            self._touch(key)
+            return self._data[key]
+
+    def __setitem__(self, key: Any, value: dict) -> None:
+        with self._lock:
+            self._missing.pop(key, None)
+            self._data[key] = value
+            self._touch(key)
+            self._evict()
+
+    def __delitem__(self, key: Any) -> None:
+        with self._lock:
+            in_memory = self._data.pop(key, None) is not None
+            self._touched.pop(key, None)
+            self._dirty.discard(key)
+            self._saved.pop(key, None)
+            self._remember_miss(key)
+        try:
+            self.backend.delete(self.namespace, str(key))
+        except Exception as exc:  # noqa: BLE001
+            print(f"[SESSIONS] delete error for {key}: {exc}")
+        if not in_memory:
+            raise KeyError(key)
+
+    def __contains__(self, key: object) -> bool:
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+
+    def __iter__(self) -> Iterator[Any]:
+        with self._lock:
+            return iter(list(self._data))
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._data)
+
+    # --- память ---
+    def _remember_miss(self, key: Any) -> None:
+        self._missing[key] = time.monotonic()
+        self._missing.move_to_end(key)
+        while len(self._missing) > self.max_entries:
+            self._missing.popitem(last=False)
+
+    def _touch(self, key: Any) -> None:
+        self._data.move_to_end(key)
+        self._touched[key] = time.monotonic()
+        self._dirty.add(key)
+        self._ensure_flusher()
+
+    def _evict(self) -> None:
+        """Под self._lock. Вытесненные «грязные» сессии сначала сохраняются."""
+        now = time.monotonic()
+        victims = []
+        for key in list(self._data):
+            over_cap = len(self._data) - len(victims) > self.max_entries
+            idle = now - self._touched.get(key, now) > self.idle_ttl_sec
+            if not (over_cap or idle):
+                break  # дальше — более свежие (порядок LRU)
+            if self.pinned(key) or key in self._holds:
+                continue
+            victims.append(key)
+        if not victims:
+            return
+        self._save([k for k in victims if k in self._dirty])
+        for key in victims:
+            if key in self._dirty:
+                continue  # не сохранилась — остаётся в памяти до следующей попытки
+            self._data.pop(key, None)
+            self._touched.pop(key, None)
+            self._saved.pop(key, None)
+
+    @contextmanager
+    def hold(self, key: Any) -> Iterator[None]:
+        """Пока блок выполняется, сессия key не вытесняется из памяти (вложенные hold() считаются)."""
+        with self._lock:
+            self._holds[key] = self._holds.get(key, 0) + 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                left = self._holds.pop(key, 1) - 1
+                if left > 0:
+                    self._holds[key] = left
+
+    def save(self, key: Any) -> None:
+        """Сохранить сессию сразу, не дожидаясь фонового сброса (для меток, которые должны пережить рестарт)."""
+        with self._lock:
+            if key in self._data:
+                self._dirty.add(key)
+                self._save([key])
+
+    def find(self, field: str, value: Any) -> List[str]:
+        """Ключи (строками) сохранённых в backend сессий, у которых поле field равно value."""
+        self.flush()
+        return self.backend.find(self.namespace, field, value)
+
+    # --- write-behind ---
+    def _ensure_flusher(self) -> None:
+        if self._flusher is not None and self._flusher.is_alive():
+            return
+        self._flusher = threading.Thread(target=self._flush_loop, name=f"sessions-{self.namespace}", daemon=True)
+        self._flusher.start()
+
+    def _flush_loop(self) -> None:
+        while True:
+            time.sleep(self.flush_sec)
+            self.flush()
+            with self._lock:
+                self._evict()
+            if time.monotonic() - self._last_gc > 3600:
+                self._last_gc = time.monotonic()
+                try:
+                    removed = self.backend.gc(self.namespace, time.time() - self.persist_ttl_sec)
+                    if removed:
+                        print(f"[SESSIONS] gc {self.namespace}: removed {removed}")
+                except Exception as exc:  # noqa: BLE001
+                    print(f"[SESSIONS] gc error: {exc}")
+
+    def flush(self) -> None:
+        with self._lock:
+            keys = list(self._dirty)
+            self._save(keys)
+
+    def _save(self, keys: List[Any]) -> None:
+        items: List[Tuple[str, str]] = []
+        hashes: Dict[Any, int] = {}
+        unchanged = []
+        for key in keys:
+            value = self._data.get(key)
+            if value is None:
+                continue
+            try:
+                raw = dumps(value)
+                if self._saved.get(key) == hash(raw):
+                    unchanged.append(key)  # только читали — в backend уже то же самое
+                    continue
+                items.append((str(key), raw))
+                hashes[key] = hash(raw)
+            except TypeError as exc:
+                # значение не переживёт перезагрузку — сессия остаётся в памяти, ошибка видна в логе
+                print(f"[SESSIONS] ERROR cannot serialize {key}: {exc}")
+            except (RuntimeError, ValueError) as exc:
+                # dict меняется в другом потоке прямо сейчас — попробуем в следующий раз
+                print(f"[SESSIONS] serialize retry for {key}: {exc}")
+        self._dirty.difference_update(unchanged)
+        if not items:
+            return
+        try:
+            self.backend.save_many(self.namespace, items)
+        except Exception as exc:  # noqa: BLE001
+            print(f"[SESSIONS] save error: {exc}")
+            return
+        self._saved.update(hashes)
+        self._dirty.difference_update(hashes)
+
+
+__all__ = ["SessionBackend", "SessionStore", "SqliteSessionBackend", "dumps", "loads"]
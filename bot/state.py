@@ -2,6 +2,8 @@ from __future__ import annotations
 
 import json
 import os
+import threading
+import time
 from typing import Dict
 
 from . import assets
@@ -11,11 +13,16 @@ from .config import (
     FREE_HUGS_QUOTA_FILE,
     FREE_HUGS_SCENE_KEYS,
     FREE_HUGS_WHITELIST,
-    QUOTA_DIR,
 )
+from .db import connect, register_schema, transaction
+from .session_store import SessionStore
 
-users: Dict[int, dict] = {}
 IN_RENDER: set[int] = set()
+# поле сессии: рендер оплаченного заказа начат и не закончен — после рестарта бот продолжит его
+RENDER_IN_PROGRESS = "render_in_progress"
+# состояние мастера по uid: горячее — в памяти, остальное — в SQLite; пока идёт рендер, не вытесняется
+users: SessionStore = SessionStore("tg_users", pinned=lambda uid: uid in IN_RENDER)
+# альбомы живут секунды и чистятся обработчиком фото — в хранилище им не место
 PENDING_ALBUMS: Dict[str, dict] = {}
 
 
@@ -32,37 +39,81 @@ def is_free_hugs_whitelisted(uid: int) -> bool:
     return str(uid) in FREE_HUGS_WHITELIST
 
 
-def _quota_load() -> dict:
-    os.makedirs(QUOTA_DIR, exist_ok=True)
-    try:
-        with open(FREE_HUGS_QUOTA_FILE, 'r', encoding='utf-8') as fh:
-            data = json.load(fh)
-            return data if isinstance(data, dict) else {}
-    except Exception:
-        return {}
-
-
-def _quota_save(data: dict) -> None:
-    os.makedirs(QUOTA_DIR, exist_ok=True)
-    tmp_path = FREE_HUGS_QUOTA_FILE + '.tmp'
-    with open(tmp_path, 'w', encoding='utf-8') as fh:
-        json.dump(data, fh, ensure_ascii=False, indent=2)
-    os.replace(tmp_path, FREE_HUGS_QUOTA_FILE)
+# Счётчики «Объятий» — в общей SQLite (WAL): атомарный UPSERT вместо перезаписи всего JSON,
+# бот и веб-API инкрементируют без потерянных обновлений.
+register_schema("free_hugs_usage", """
+CREATE TABLE IF NOT EXISTS free_hugs_usage (
+    uid        TEXT PRIMARY KEY,
+    used       INTEGER NOT NULL DEFAULT 0,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS state_meta (
+    key        TEXT PRIMARY KEY,
+    value      TEXT,
+    updated_at REAL NOT NULL
+);
+""")
+
+# отметка о переносе JSON хранится в базе: сам файл не трогаем (рабочее дерево деплоя остаётся чистым)
+_QUOTA_MIGRATED_KEY = "free_hugs_json_migrated"
+
+_quota_migrated = False
+_quota_migrate_lock = threading.Lock()
+
+
+def _quota_migrate_json() -> None:
+    """
+    Разовый перенос quota/free_hugs_usage.json; факт переноса — строка в state_meta.
+    max() делает повтор из другого процесса безвредным.
+    """
+    global _quota_migrated
+    if _quota_migrated:
+        return
+    with _quota_migrate_lock:
+        if _quota_migrated:
+            return
+        done = connect().execute("SELECT 1 FROM state_meta WHERE key = ?", (_QUOTA_MIGRATED_KEY,)).fetchone()
+        if done is None and os.path.isfile(FREE_HUGS_QUOTA_FILE):
+            try:
+                with open(FREE_HUGS_QUOTA_FILE, 'r', encoding='utf-8') as fh:
+                    data = json.load(fh)
+            except Exception as exc:
+                print(f"[QUOTA] cannot read {FREE_HUGS_QUOTA_FILE}: {exc}")
+                data = None
+            if isinstance(data, dict):
+                rows = []
+                for key, value in data.items():
+                    try:
+                        rows.append((str(key), int(value), time.time()))
+                    except (TypeError, ValueError):
+                        continue
+                with transaction() as c:
+                    c.executemany(
+                        "INSERT INTO free_hugs_usage (uid, used, updated_at) VALUES (?, ?, ?)"
+                        " ON CONFLICT(uid) DO UPDATE SET used = MAX(used, excluded.used)",
+                        rows,
+                    )
+                    c.execute(
+                        "INSERT OR REPLACE INTO state_meta (key, value, updated_at) VALUES (?, ?, ?)",
+                        (_QUOTA_MIGRATED_KEY, str(len(rows)), time.time()),
+                    )
+                print(f"[QUOTA] migrated {len(rows)} users from {FREE_HUGS_QUOTA_FILE}")
+        _quota_migrated = True
 
 
 def get_free_hugs_count(uid: int) -> int:
-    data = _quota_load()
-    try:
-        return int(data.get(str(uid), 0))
-    except Exception:
-        return 0
+    _quota_migrate_json()
+    row = connect().execute("SELECT used FROM free_hugs_usage WHERE uid = ?", (str(uid),)).fetchone()
+    return int(row["used"]) if row else 0
 
 
 def inc_free_hugs_count(uid: int, delta: int = 1) -> None:
-    data = _quota_load()
-    key = str(uid)
-    data[key] = int(data.get(key, 0)) + delta
-    _quota_save(data)
+    _quota_migrate_json()
+    connect().execute(
+        "INSERT INTO free_hugs_usage (uid, used, updated_at) VALUES (?, ?, ?)"
+        " ON CONFLICT(uid) DO UPDATE SET used = used + excluded.used, updated_at = excluded.updated_at",
+        (str(uid), int(delta), time.time()),
+    )
 
 
 def is_free_hugs(scene_key: str) -> bool:
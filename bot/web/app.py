@@ -4,15 +4,17 @@ import asyncio
 import io
 import os
 import threading
+import time
 import uuid
 import json
 import hashlib
+import hmac
 from pathlib import Path
 from typing import Any, Dict, List, Optional, Tuple
 
-from fastapi import APIRouter, FastAPI, File, HTTPException, UploadFile, Form
+from fastapi import APIRouter, FastAPI, File, HTTPException, Request, UploadFile, Form
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel, Field
 from .. import assets, state
@@ -26,7 +28,14 @@ from ..config import (
     FREE_HUGS_WM_MODE,
     FREE_HUGS_WM_ROTATE,
     FREE_HUGS_WM_SCALE,
+    METRICS_TOKEN,
     PAYMENT_GATE_ENABLED,
+    RENDER_RESULT_TTL_SEC,
+    WEB_JOB_MAX_ATTEMPTS,
+    WEB_JOB_RECOVERY_SEC,
+    RUNWAY_FAKE,
+    RUNWAY_CALLBACKS_ENABLED,
+    TOCHKA_WEBHOOK_JWK,
     WATERMARK_PATH,
     CANDLE_PATH,
     ADMIN_CHAT_ID,
@@ -37,9 +46,33 @@ from ..render.pipeline import (
     make_start_frame as pipeline_make_start_frame,
     web_render_video,
     _abs_project_path,
+    apply_fullscreen_watermark,
+    download,
+    ensure_jpeg_copy,
+    postprocess_concat_ffmpeg,
+    runway_poll,
+    runway_prompt_image,
+    runway_start,
+    runway_task,
 )
-from ..payment.tochka import create_payment_link, get_payment_status, is_paid_status, TochkaError
-from ..payment import wait_for_tochka_payment
+from ..render.cache import content_key
+from ..render.executor import render_executor
+from ..render.governor import (
+    PRIORITY_FREE,
+    PRIORITY_PAID,
+    call_with_runway_request,
+    runway_governor,
+)
+from ..render.scenes import scene_scheduler
+from ..render.progress import call_with_progress, stage_percent
+from ..render.rembg_pool import start_warm_up
+from .registry import JobRegistry
+from ..render.runway import TERMINAL_STATUSES, runway_client, verify_callback
+from ..metrics import metrics
+from ..payment.tochka import create_payment_link, verify_webhook, TochkaError
+from ..payment import calc_order_price
+from ..payment.ledger import EXPIRED, PAID, SOURCE_WEB, payment_ledger
+from ..payment.reconciler import payment_reconciler
 
 ensure_directories()
 Path("renders/temp").mkdir(parents=True, exist_ok=True)
@@ -54,11 +87,12 @@ RENDERS_DIR = ROOT / "renders"
 UPLOADS_DIR.mkdir(parents=True, exist_ok=True)
 RENDERS_DIR.mkdir(parents=True, exist_ok=True)
 
-# in-memory store for render jobs
-RENDER_JOBS: Dict[str, Dict[str, Any]] = {}
-PAYMENT_SESSIONS: Dict[str, Dict[str, Any]] = {}
-PAYMENT_TASKS: Dict[str, asyncio.Task] = {}
-PAYMENT_TO_JOB: Dict[str, str] = {}
+# задания рендера и платежи — в общей SQLite (bot/web/registry.py): переживают рестарт, видны всем воркерам
+RENDER_JOBS = JobRegistry("render")
+PAYMENT_SESSIONS = JobRegistry("payment")
+# подтверждение оплаты — общий реестр операций (bot/payment/ledger.py) и реконсилер процесса;
+# обработчик оплаты исполняется в этом loop
+_APP_LOOP: asyncio.AbstractEventLoop | None = None
 
 _ALLOWED_ORIGINS = [
     "https://memoryforever.ru",
@@ -88,8 +122,7 @@ SESSION_STATUS_PROCESSING = "processing"
 SESSION_STATUS_FINISHED = "finished"
 SESSION_STATUS_ERROR = "error"
 
-sessions: Dict[str, Dict[str, Any]] = {}
-sessions_lock = threading.Lock()
+sessions = JobRegistry("session")
 
 
 class StartSessionRequest(BaseModel):
@@ -197,8 +230,7 @@ def _build_scene_jobs(scenes: List[str]) -> List[Dict[str, Any]]:
 
 
 def _ensure_session(session_id: str) -> Dict[str, Any]:
-    with sessions_lock:
-        session = sessions.get(session_id)
+    session = sessions.get(session_id)
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
     return session
@@ -332,16 +364,17 @@ def _generate_scene_segment(session: Dict[str, Any], job: Dict[str, Any]) -> str
         raise RuntimeError("FREE_HUGS_LIMIT_REACHED")
 
     send_path = ensure_jpeg_copy(start_frame)
-    data_uri, used_path = ensure_runway_datauri_under_limit(send_path)
+    data_uri, used_path = runway_prompt_image(send_path)
     if not data_uri:
         raise RuntimeError("EMPTY_START_FRAME_DATA")
 
-    start_resp = runway_start(data_uri, job.get("prompt", ""), int(job.get("duration", 10)))
-    task_id = start_resp.get("id") or start_resp.get("task", {}).get("id")
-    if not task_id:
-        raise RuntimeError("RUNWAY_NO_TASK_ID")
+    with runway_task():
+        start_resp = runway_start(data_uri, job.get("prompt", ""), int(job.get("duration", 10)))
+        task_id = start_resp.get("id") or start_resp.get("task", {}).get("id")
+        if not task_id:
+            raise RuntimeError("RUNWAY_NO_TASK_ID")
 
-    poll = runway_poll(task_id)
+        poll = runway_poll(task_id, duration=int(job.get("duration", 10)))
     status = (poll or {}).get("status")
     if status != "SUCCEEDED":
         raise RuntimeError(f"RUNWAY_STATUS_{status}")
@@ -390,22 +423,48 @@ def _run_generation(session_id: str) -> None:
         session["progress"] = 0.0
         jobs = session["scene_jobs"]
         total = max(1, len(jobs))
-        segments: List[str] = []
-        for idx, job in enumerate(jobs, start=1):
-            try:
-                job["status"] = JOB_STATUS_RENDERING
-                job["error"] = None
-                seg = _generate_scene_segment(session, job)
-            except Exception as exc:  # noqa: BLE001
+        for job in jobs:
+            if _scene_segment_ready(job):
+                continue
+            job["status"] = JOB_STATUS_RENDERING
+            job["error"] = None
+        sessions.put(session_id, session)
+        done = 0
+
+        # все сцены стартуют сразу; сегмент дообрабатывается, как только готов
+        def _on_scene_done(_idx, job, seg, err):
+            nonlocal done
+            done += 1
+            if err is not None:
                 job["status"] = JOB_STATUS_ERROR
-                job["error"] = str(exc)
-                raise
+                job["error"] = str(err)
             else:
                 job["video_path"] = seg
                 job["status"] = JOB_STATUS_RENDERED
-                segments.append(seg)
-            finally:
-                session["progress"] = idx / total
+            session["progress"] = done / total
+            sessions.put(session_id, session)
+
+        try:
+            paid = calc_order_price(session["state"])[0] > 0
+        except Exception:  # noqa: BLE001
+            paid = False
+        runway_req = {
+            "user_key": f"web:{session['quota_uid']}",
+            "priority": PRIORITY_PAID if paid else PRIORITY_FREE,
+            "tag": session_id,
+        }
+
+        def _segment(job):
+            # сегменты, готовые до рестарта или прошлой попытки, не генерируем повторно
+            if _scene_segment_ready(job):
+                return job["video_path"]
+            return call_with_runway_request(runway_req, _generate_scene_segment, session, job)
+
+        results = scene_scheduler.run(jobs, _segment, _on_scene_done)
+        for res in results:
+            if isinstance(res, BaseException):
+                raise res
+        segments: List[str] = list(results)
 
         bg_overlay = _resolve_background_path(session)
         music_path = _resolve_music_path(session)
@@ -427,6 +486,7 @@ def _run_generation(session_id: str) -> None:
             bg_overlay_file=bg_overlay,
             titles_meta=titles_meta,
             candle_path=CANDLE_PATH,
+            segment_durations=[float(job.get("duration") or 0) for job in jobs],
         )
         session["result_path"] = str(final_path)
         session["status"] = SESSION_STATUS_FINISHED
@@ -435,8 +495,16 @@ def _run_generation(session_id: str) -> None:
         session["status"] = SESSION_STATUS_ERROR
         session["message"] = str(exc)
     finally:
-        session.pop("worker", None)
         _update_session_status(session)
+        try:
+            sessions.put(session_id, session)
+        finally:
+            sessions.release(session_id)
+
+
+def _scene_segment_ready(job: Dict[str, Any]) -> bool:
+    path = job.get("video_path")
+    return job.get("status") == JOB_STATUS_RENDERED and bool(path) and os.path.isfile(path)
 
 
 @router.get("/catalog")
@@ -448,6 +516,78 @@ def get_catalog() -> Dict[str, Any]:
     )
 
 
+@router.get("/metrics")
+def get_metrics(request: Request) -> Dict[str, Any]:
+    """Внутренние счётчики (платежи, задания, очередь Runway) — только с METRICS_TOKEN."""
+    if not METRICS_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    auth = request.headers.get("authorization") or ""
+    if not hmac.compare_digest(auth.encode(), f"Bearer {METRICS_TOKEN}".encode()):
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    snapshot = metrics.snapshot()
+    snapshot["render_pool"] = render_executor.snapshot()
+    snapshot["runway"] = runway_client.snapshot()
+    snapshot["runway"]["governor"] = runway_governor.snapshot()
+    snapshot["payments"] = payment_reconciler.snapshot()
+    snapshot["jobs"] = {
+        "render": RENDER_JOBS.counts(),
+        "payment": PAYMENT_SESSIONS.counts(),
+        "session": sessions.counts(),
+    }
+    return snapshot
+
+
+@router.post("/runway/callback")
+async def runway_callback(request: Request) -> Dict[str, Any]:
+    """
+    Подписанный колбэк о завершении задачи Runway (X-Runway-Signature, HMAC-SHA256).
+    Кладёт результат в общий реестр — задачу заберёт тот процесс, который её ждёт.
+    Только при RUNWAY_CALLBACKS_ENABLED (fake_runway, внешние интеграции): прод Runway колбэков не шлёт.
+    """
+    if not RUNWAY_CALLBACKS_ENABLED:
+        raise HTTPException(status_code=404, detail="Not Found")
+    body = await request.body()
+    if not verify_callback(body, request.headers.get("X-Runway-Signature")):
+        raise HTTPException(status_code=401, detail="Invalid signature")
+    try:
+        data = json.loads(body)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid JSON")
+    task_id = str(data.get("id") or data.get("taskId") or "") if isinstance(data, dict) else ""
+    if not task_id:
+        raise HTTPException(status_code=400, detail="Missing task id")
+    if data.get("status") not in TERMINAL_STATUSES:
+        return {"ok": True, "ignored": True}
+    runway_client.registry.publish(task_id, data)
+    runway_client.notify(task_id)
+    metrics.incr("runway.callbacks")
+    return {"ok": True}
+
+
+@router.post("/payments/tochka/webhook")
+async def tochka_webhook(request: Request) -> Dict[str, Any]:
+    """
+    Вебхук Точки об оплате (acquiringInternetPayment): тело — JWT, подписанный ключом Точки.
+    Переводит операцию в общем реестре; реагирует процесс её источника (бот или веб).
+    """
+    if not TOCHKA_WEBHOOK_JWK:
+        raise HTTPException(status_code=404, detail="Not Found")
+    body = (await request.body()).decode("utf-8", "replace")
+    event = verify_webhook(body)
+    if event is None:
+        raise HTTPException(status_code=401, detail="Invalid signature")
+    op_id = str(event.get("operationId") or "")
+    if not op_id:
+        raise HTTPException(status_code=400, detail="Missing operationId")
+    metrics.incr("payments.webhooks")
+    if await asyncio.to_thread(payment_ledger.get, op_id) is None:
+        print(f"[WEB_PAID] webhook for unknown operation {op_id}: {event.get('status')}", flush=True)
+        return {"ok": True, "ignored": True}
+    await asyncio.to_thread(payment_ledger.apply, op_id, str(event.get("status") or ""), via="webhook")
+    payment_reconciler.notify()
+    return {"ok": True}
+
+
 @router.head("/catalog")
 async def head_catalog():
     return PlainTextResponse("", status_code=200)
@@ -479,7 +619,9 @@ async def start_frame(req: StartFrameRequest):
         if not os.path.isfile(bg_abs):
             raise HTTPException(status_code=400, detail="Background file not found")
 
-        start_path, metrics = pipeline_make_start_frame(abs_photos, req.format_key, bg_abs, layout=None)
+        start_path, metrics = await asyncio.to_thread(
+            pipeline_make_start_frame, abs_photos, req.format_key, bg_abs, layout=None
+        )
         rel_url = "/" + str(Path(start_path).as_posix())
         return {"start_frame_url": rel_url, "metrics": metrics, "width": 720, "height": 1280}
     except HTTPException:
@@ -555,9 +697,9 @@ async def render_start_paid(payload: RenderRequest):
         if price <= 0:
             queued = await _enqueue_render(payload)
             print(f"[WEB_PAID] render_started (free): job_id={queued.get('job_id')}", flush=True)
-            return RenderPaidResponse(status="render_started", **queued)
+            return _render_started_response(queued)
 
-        payment = PAYMENT_SESSIONS.get(payment_key)
+        payment = await asyncio.to_thread(PAYMENT_SESSIONS.get, payment_key)
 
         if not payment:
             try:
@@ -575,9 +717,9 @@ async def render_start_paid(payload: RenderRequest):
                 "payload": payload.model_dump(),
                 "payment_key": payment_key,
             }
-            PAYMENT_SESSIONS[payment_key] = payment
-            if payment_key not in PAYMENT_TASKS:
-                PAYMENT_TASKS[payment_key] = asyncio.create_task(_auto_render_after_payment(payment_key))
+            await asyncio.to_thread(PAYMENT_SESSIONS.put, payment_key, payment)
+            await asyncio.to_thread(payment_ledger.register, pay_id, SOURCE_WEB, payment_key, price)
+            payment_reconciler.notify()
             payment_payload = {"@context": "https://schema.org/Payment", "id": pay_id, "url": pay_url}
             print(f"[WEB_PAID] need_payment: payment_id={pay_id} url={pay_url}", flush=True)
             return RenderPaidResponse(
@@ -590,23 +732,27 @@ async def render_start_paid(payload: RenderRequest):
                 message="Счёт создан, требуется оплата.",
             )
 
-        if payment_key not in PAYMENT_TASKS:
-            PAYMENT_TASKS[payment_key] = asyncio.create_task(_auto_render_after_payment(payment_key))
-
-        # Если платёж уже существует, проверим статус
-        if payment.get("status") != "paid":
+        # Если платёж уже существует, проверим статус (реестр; пока не оплачен — один запрос к Точке)
+        if payment.get("status") != "paid" and not payment.get("job_id"):
+            # платежи, созданные до общего реестра
+            await asyncio.to_thread(
+                payment_ledger.register, payment["payment_id"], SOURCE_WEB, payment_key, payment.get("price_rub")
+            )
             try:
-                status_json = get_payment_status(payment["payment_id"])
+                op = await payment_reconciler.check_async(payment["payment_id"])
             except Exception as exc:  # noqa: BLE001
                 print(f"[WEB_PAID] ERROR payment status: {repr(exc)}", flush=True)
                 return JSONResponse(
                     {"status": "error", "message": "payment_status_failed", "detail": str(exc)}, status_code=500
                 )
 
-            if is_paid_status(status_json):
-                payment["status"] = "paid"
+            if op and op["status"] == PAID:
+                payment = await asyncio.to_thread(PAYMENT_SESSIONS.get, payment_key) or payment
+                if payment.get("status") == "need_payment":
+                    payment["status"] = "paid"
+                    await asyncio.to_thread(PAYMENT_SESSIONS.put, payment_key, payment)
             else:
-                print(f"[WEB_PAID] payment status raw: {status_json}", flush=True)
+                print(f"[WEB_PAID] payment status: {(op or {}).get('provider_status')}", flush=True)
                 pay_url = payment.get("payment_url")
                 pay_id = payment.get("payment_id")
                 payment_payload = {"@context": "https://schema.org/Payment", "id": pay_id, "url": pay_url}
@@ -626,19 +772,14 @@ async def render_start_paid(payload: RenderRequest):
             queued = await _enqueue_render(payload)
             payment["job_id"] = queued["job_id"]
             payment["status"] = "rendering"
-            PAYMENT_SESSIONS[payment_key] = payment
+            await asyncio.to_thread(PAYMENT_SESSIONS.put, payment_key, payment)
             print(f"[WEB_PAID] Payment confirmed → starting render for job_id={queued.get('job_id')}", flush=True)
-            return RenderPaidResponse(
-                status="render_started",
-                job_id=queued["job_id"],
-                status_url=queued.get("status_url"),
-                payment_key=payment_key,
-            )
+            return _render_started_response(queued, payment_key)
 
         # Оплачено (возможно, рендер уже запускался)
         if payment.get("job_id"):
             job_id = payment["job_id"]
-            job = RENDER_JOBS.get(job_id) or {}
+            job = await asyncio.to_thread(RENDER_JOBS.get, job_id) or {}
             if job.get("status") == "done":
                 result = job.get("result")
                 print(f"[WEB_PAID] done: job_id={job_id} video_url={(result or {}).get('video_url')}", flush=True)
@@ -654,15 +795,9 @@ async def render_start_paid(payload: RenderRequest):
         queued = await _enqueue_render(payload)
         payment["job_id"] = queued["job_id"]
         payment["status"] = "rendering"
-        PAYMENT_SESSIONS[payment_key] = payment
-        PAYMENT_TO_JOB[payment_key] = queued["job_id"]
+        await asyncio.to_thread(PAYMENT_SESSIONS.put, payment_key, payment)
         print(f"[WEB_PAID] render_started: job_id={queued.get('job_id')}", flush=True)
-        return RenderPaidResponse(
-            status="render_started",
-            job_id=queued["job_id"],
-            status_url=queued.get("status_url"),
-            payment_key=payment_key,
-        )
+        return _render_started_response(queued, payment_key)
     except Exception as exc:  # noqa: BLE001
         print(f"[WEB_PAID] ERROR start_paid: {repr(exc)}", flush=True)
         return JSONResponse(
@@ -671,57 +806,171 @@ async def render_start_paid(payload: RenderRequest):
         )
 
 
-async def _auto_render_after_payment(payment_key: str) -> None:
-    payment = PAYMENT_SESSIONS.get(payment_key)
-    if not payment:
-        return
-    pay_id = payment.get("payment_id")
-    if not pay_id:
-        return
+def _render_started_response(queued: Dict[str, Any], payment_key: Optional[str] = None) -> RenderPaidResponse:
+    # такой же рендер мог уже завершиться — тогда сразу отдаём результат из кэша
+    done = queued.get("status") == "done"
+    return RenderPaidResponse(
+        status="done" if done else "render_started",
+        job_id=queued["job_id"],
+        status_url=queued.get("status_url"),
+        result=queued.get("result"),
+        payment_key=payment_key,
+    )
+
+
+def _on_payment_paid(op: Dict[str, Any]) -> None:
+    """
+    Обработчик реестра (поток реконсилера): рендер запускаем в loop приложения.
+    Любое исключение — операция остаётся необработанной, реконсилер повторит.
+    """
+    if _APP_LOOP is None:
+        raise RuntimeError("app loop is not running")
+    fut = asyncio.run_coroutine_threadsafe(_render_after_payment(op["ref"]), _APP_LOOP)
+    fut.result(timeout=120)
+
+
+async def _render_after_payment(payment_key: str) -> None:
+    """Запустить рендер оплаченного заказа; исключение — рендер не запущен, вызывающий повторит."""
+    if not await asyncio.to_thread(PAYMENT_SESSIONS.claim, payment_key, only_stale=True):
+        # запускает другой воркер; успех засчитаем, когда у заказа появится job_id
+        raise RuntimeError(f"payment {payment_key} is being started by another worker")
     try:
-        print(f"[WEB_PAID] auto-poll start: key={payment_key} pay_id={pay_id}", flush=True)
-        resp = await wait_for_tochka_payment(pay_id, timeout=900, poll_interval=5)
-        if not resp:
-            print(f"[WEB_PAID] auto-poll timeout: key={payment_key}", flush=True)
-            return
+        payment = await asyncio.to_thread(PAYMENT_SESSIONS.get, payment_key)
+        if not payment or payment.get("job_id"):
+            return  # рендер уже запущен запросом start_paid
         payment["status"] = "paid"
+        await asyncio.to_thread(PAYMENT_SESSIONS.put, payment_key, payment)
         payload_dict = payment.get("payload") or {}
         try:
             payload_obj = RenderRequest(**payload_dict)
         except Exception as exc:  # noqa: BLE001
-            print(f"[WEB_PAID] auto-poll payload error: {exc}", flush=True)
+            print(f"[WEB_PAID] after-payment payload error: {exc}", flush=True)
+            payment["status"] = "error"
+            await asyncio.to_thread(PAYMENT_SESSIONS.put, payment_key, payment)
             return
         queued = await _enqueue_render(payload_obj)
         payment["job_id"] = queued["job_id"]
         payment["status"] = "rendering"
-        PAYMENT_SESSIONS[payment_key] = payment
-        PAYMENT_TO_JOB[payment_key] = queued["job_id"]
-        print(f"[WEB_PAID] auto-poll render_started: job_id={queued.get('job_id')} key={payment_key}", flush=True)
-    except Exception as exc:  # noqa: BLE001
-        print(f"[WEB_PAID] auto-poll error: {exc}", flush=True)
+        await asyncio.to_thread(PAYMENT_SESSIONS.put, payment_key, payment)
+        print(f"[WEB_PAID] paid → render_started: job_id={queued.get('job_id')} key={payment_key}", flush=True)
+    finally:
+        await asyncio.to_thread(PAYMENT_SESSIONS.release, payment_key)
 
 
 @router.get("/render/status/{job_id}")
 async def render_status(job_id: str):
-    data = RENDER_JOBS.get(job_id)
+    data = await asyncio.to_thread(RENDER_JOBS.get, job_id)
     if not data:
         return JSONResponse({"error": "not found"}, status_code=404)
+    if data.get("status") == "processing":
+        # очередь к Runway общая для бота и API: позиция и ETA до старта генерации.
+        # get() отдаёт общий dict процесса — ответ собираем в новом, запись не трогаем
+        return {**data, "runway_queue": await asyncio.to_thread(runway_governor.queue_info, job_id)}
     return data
 
 
+_SSE_TICK_SEC = 0.5
+_SSE_PING_SEC = 15.0
+_SSE_MAX_SEC = 30 * 60  # EventSource сам переподключится
+
+
+def _job_event(job_id: str, job: Dict[str, Any]) -> Dict[str, Any]:
+    status = job.get("status")
+    event = {
+        "job_id": job_id,
+        "status": status,
+        "stage": job.get("stage") or status,
+        "progress": job.get("progress", 0),
+        "detail": job.get("stage_detail"),
+    }
+    if status == "queued":
+        event["queue_position"] = job.get("queue_position")
+    if status == "done":
+        event["result"] = job.get("result")
+    if status == "error":
+        event["error"] = job.get("error")
+    return event
+
+
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def _render_event_stream(request: Request, job_id: Optional[str], payment_key: Optional[str] = None):
+    """
+    SSE: шлёт событие только при изменении задания (этап, прогресс, позиция в очереди).
+    Состояние читается из реестра — поток может обслуживать любой воркер, не только тот, что рендерит.
+    Чтения SQLite — в потоке: запись другого воркера (BEGIN IMMEDIATE) не должна стопорить event loop.
+    """
+    last_sent = None
+    last_io = time.monotonic()
+    started = last_io
+    while time.monotonic() - started < _SSE_MAX_SEC:
+        if await request.is_disconnected():
+            return
+        if job_id is None and payment_key:
+            payment = await asyncio.to_thread(PAYMENT_SESSIONS.get, payment_key) or {}
+            job_id = payment.get("job_id")
+            if job_id is None:
+                kind, data = "payment", {"payment_key": payment_key, "status": payment.get("status") or "not_found"}
+            else:
+                kind, data = "payment", {"payment_key": payment_key, "status": "render_started", "job_id": job_id}
+        else:
+            job = await asyncio.to_thread(RENDER_JOBS.get, job_id) or {"status": "error", "error": "not found"}
+            data = _job_event(job_id, job)
+            kind = data["status"] if data["status"] in ("done", "error") else "progress"
+        encoded = _sse(kind, data)
+        if encoded != last_sent:
+            yield encoded
+            last_sent, last_io = encoded, time.monotonic()
+            if kind in ("done", "error"):
+                return
+        elif time.monotonic() - last_io > _SSE_PING_SEC:
+            yield ": ping\n\n"
+            last_io = time.monotonic()
+        await asyncio.sleep(_SSE_TICK_SEC)
+
+
+def _sse_response(stream) -> StreamingResponse:
+    return StreamingResponse(
+        stream,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-store", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/render/events/{job_id}")
+async def render_events(job_id: str, request: Request):
+    if await asyncio.to_thread(RENDER_JOBS.get, job_id) is None:
+        return JSONResponse({"error": "not found"}, status_code=404)
+    return _sse_response(_render_event_stream(request, job_id))
+
+
+@router.get("/render/events_by_payment/{payment_key}")
+async def render_events_by_payment(payment_key: str, request: Request):
+    if await asyncio.to_thread(PAYMENT_SESSIONS.get, payment_key) is None:
+        return JSONResponse({"error": "not found"}, status_code=404)
+    return _sse_response(_render_event_stream(request, None, payment_key))
+
+
 @router.get("/render/status_by_payment/{payment_key}")
 async def render_status_by_payment(payment_key: str):
-    payment = PAYMENT_SESSIONS.get(payment_key)
+    payment = await asyncio.to_thread(PAYMENT_SESSIONS.get, payment_key)
     if not payment:
         return JSONResponse({"error": "not found"}, status_code=404)
 
-    job_id = payment.get("job_id") or PAYMENT_TO_JOB.get(payment_key)
+    job_id = payment.get("job_id")
     if job_id:
-        job = RENDER_JOBS.get(job_id)
+        job = await asyncio.to_thread(RENDER_JOBS.get, job_id)
         if job:
+            runway_queue = None
+            if job.get("status") == "processing":
+                runway_queue = await asyncio.to_thread(runway_governor.queue_info, job_id)
             return {
                 "status": job.get("status"),
                 "job_id": job_id,
+                "queue_position": job.get("queue_position"),
+                "runway_queue": runway_queue,
                 "status_url": f"/v1/render/status/{job_id}",
                 "result": job.get("result"),
             }
@@ -735,9 +984,7 @@ async def render_status_by_payment(payment_key: str):
 
 
 async def _run_render(job_id: str, payload: RenderRequest) -> None:
-    job = RENDER_JOBS.get(job_id, {})
-    job.update({"status": "processing", "progress": 5})
-    RENDER_JOBS[job_id] = job
+    job = await asyncio.to_thread(RENDER_JOBS.get, job_id) or {}
 
     try:
         if not payload.photos:
@@ -751,12 +998,47 @@ async def _run_render(job_id: str, payload: RenderRequest) -> None:
                 raise FileNotFoundError(f"photo not found: {abs_path}")
             abs_photos.append(str(abs_path))
 
-        job["progress"] = 40
-        RENDER_JOBS[job_id] = job
         print(f"[WEB_DEBUG] job {job_id} payload.photos = {payload.photos}")
         print(f"[WEB_DEBUG] job {job_id} abs_photos = {abs_photos}")
 
-        video_path = web_render_video(
+        def _on_start(_job_id: str) -> None:
+            # вызывается из потока диспетчера, когда освободился слот пула
+            job.update({"status": "processing", "stage": "started", "progress": stage_percent("started"), "queue_position": 0})
+            RENDER_JOBS.put(job_id, job)
+
+        def _on_position(_job_id: str, position: int) -> None:
+            # позиция в очереди пула этого воркера — в реестр: SSE может обслуживать другой воркер
+            if job.get("status") == "queued":
+                job["queue_position"] = position
+                RENDER_JOBS.put(job_id, job)
+
+        def _on_stage(stage: str, percent: int, detail: Dict[str, Any]) -> None:
+            # этапы пайплайна (вырезка, Runway, постобработка) — в реестр, оттуда их читает /render/events
+            job.update({
+                "stage": stage,
+                "stage_detail": detail or None,
+                "progress": max(int(job.get("progress") or 0), percent),
+            })
+            RENDER_JOBS.put(job_id, job)
+
+        # Рендер блокирующий (rembg, Runway, ffmpeg) — уводим его в пул,
+        # event loop остаётся свободным для статусов и загрузок.
+        paid = _scene_price(payload.scene_key) > 0 and not state.is_free_hugs(payload.scene_key)
+        runway_req = {
+            "user_key": f"web:{payload.user or job_id}",
+            "priority": PRIORITY_PAID if paid else PRIORITY_FREE,
+            "tag": job_id,
+        }
+        render_call: tuple = (call_with_runway_request, runway_req, web_render_video)
+        if render_executor.kind == "thread":
+            # замыкание _on_stage не сериализуется, а job — dict этого процесса:
+            # в пуле процессов этапы не транслируются, видны только started/done
+            render_call = (call_with_progress, _on_stage) + render_call
+        future = render_executor.submit(
+            job_id,
+            *render_call,
+            on_start=_on_start,
+            on_position=_on_position,
             format_key=payload.format_key,
             scene_key=payload.scene_key,
             background_key=payload.background_key,
@@ -766,21 +1048,28 @@ async def _run_render(job_id: str, payload: RenderRequest) -> None:
             photo_paths=abs_photos,
             session_id=payload.user,
         )
+        video_path = await asyncio.wrap_future(future)
 
         job["status"] = "done"
+        job["stage"] = "done"
         job["progress"] = 100
+        job["queue_position"] = None
+        job["finished_at"] = time.time()
         job["result"] = {
             "video_path": video_path,
             "video_url": f"/renders/{Path(video_path).name}",
         }
-        RENDER_JOBS[job_id] = job
+        await asyncio.to_thread(RENDER_JOBS.put, job_id, job)
         print(f"[WEB_DEBUG] job {job_id} completed: {video_path}")
 
     except Exception as exc:  # noqa: BLE001
         job["status"] = "error"
         job["error"] = str(exc)
-        RENDER_JOBS[job_id] = job
+        job["queue_position"] = None
+        await asyncio.to_thread(RENDER_JOBS.put, job_id, job)
         print(f"[WEB_DEBUG] error for job {job_id}: {exc!r}")
+    finally:
+        await asyncio.to_thread(RENDER_JOBS.release, job_id)
 
 
 @router.post("/session/start")
@@ -809,9 +1098,8 @@ def start_session(req: StartSessionRequest) -> Dict[str, Any]:
         "created_at": uuid.uuid4().hex,
         "quota_uid": int(req.user_id) if req.user_id is not None else uuid.uuid4().int % 10**9,
     }
-    with sessions_lock:
-        sessions[session_id] = session
     _update_session_status(session)
+    sessions.put(session_id, session)
     snapshot = _serialize_session(session)
     snapshot["session_id"] = session_id
     return snapshot
@@ -824,7 +1112,7 @@ async def upload_photo(
     scene_key: Optional[str] = Form(None),
     file: UploadFile = File(...),
 ) -> Dict[str, Any]:
-    session = _ensure_session(session_id)
+    session = await asyncio.to_thread(_ensure_session, session_id)
     if scene_index is None and not scene_key:
         raise HTTPException(status_code=400, detail="scene_index or scene_key is required")
     job, _ = _select_job(session, scene_index=scene_index, scene_key=scene_key)
@@ -840,6 +1128,7 @@ async def upload_photo(
         job["status"] = JOB_STATUS_READY_FOR_START
     job["error"] = None
     _update_session_status(session)
+    await asyncio.to_thread(sessions.put, session_id, session)
     return {
         "stored_path": path,
         "uploaded": len(job["photos"]),
@@ -868,6 +1157,7 @@ def make_start_frame(req: SceneActionRequest) -> Dict[str, Any]:
     job["status"] = JOB_STATUS_AWAITING_APPROVAL
     job["error"] = None
     _update_session_status(session)
+    sessions.put(req.session_id, session)
     return {"start_frame": start_path, "metrics": metrics}
 
 
@@ -884,13 +1174,14 @@ def approve_start(req: SceneActionRequest) -> Dict[str, Any]:
         job["status"] = JOB_STATUS_APPROVED
     job["error"] = None
     _update_session_status(session)
+    sessions.put(req.session_id, session)
     return {"approved": True, "scene_status": job["status"]}
 
 
 @router.post("/generate")
 def trigger_generation(req: GenerateRequest) -> Dict[str, Any]:
     session = _ensure_session(req.session_id)
-    if session.get("worker"):
+    if session.get("status") == SESSION_STATUS_PROCESSING:
         raise HTTPException(status_code=400, detail="Generation already in progress")
     jobs = session["scene_jobs"]
     if not jobs:
@@ -905,12 +1196,19 @@ def trigger_generation(req: GenerateRequest) -> Dict[str, Any]:
     session["progress"] = 0.0
     session["status"] = SESSION_STATUS_PROCESSING
     session["message"] = None
-    worker = threading.Thread(target=_run_generation, args=(req.session_id,), daemon=True)
-    session["worker"] = worker
-    worker.start()
+    # проверка статуса и захват — одна транзакция: параллельный /generate на другом воркере получит 400
+    if not sessions.put_unless(req.session_id, session, (SESSION_STATUS_PROCESSING,)):
+        raise HTTPException(status_code=400, detail="Generation already in progress")
+    _start_generation(req.session_id)
     return {"status": "started", "session_id": req.session_id}
 
 
+def _start_generation(session_id: str) -> None:
+    # вызывающий уже владеет записью: put_unless в /generate или claim(only_stale) при восстановлении;
+    # безусловный claim здесь отбирал бы сессию у воркера, который её генерирует
+    threading.Thread(target=_run_generation, args=(session_id,), daemon=True).start()
+
+
 @router.get("/status", response_model=StatusResponse)
 def get_status(session_id: str) -> StatusResponse:
     session = _ensure_session(session_id)
@@ -926,9 +1224,91 @@ def get_result(session_id: str):
         raise HTTPException(status_code=404, detail="Result not ready")
     return FileResponse(result_path, media_type="video/mp4", filename=Path(result_path).name)
 
+def _file_sha256(path: Path) -> str:
+    h = hashlib.sha256()
+    try:
+        with open(path, "rb") as fh:
+            for chunk in iter(lambda: fh.read(1 << 20), b""):
+                h.update(chunk)
+    except OSError:
+        # файла нет — рендер всё равно упадёт, ключ по пути не склеит его с чужим
+        return f"missing:{path}"
+    return h.hexdigest()
+
+
+def _render_key(payload: RenderRequest) -> str:
+    """
+    Ключ рендера по содержимому: фото по sha256 байтов (не по пути загрузки) + параметры сцены.
+    У «Объятий» результат зависит от пользователя (водяной знак снимается белому списку, лимит —
+    на пользователя), поэтому такие рендеры склеиваются только в пределах одного пользователя.
+    """
+    photos = [_file_sha256((BASE_DIR / p.lstrip("/")).resolve()) for p in payload.photos]
+    return content_key(
+        "web-render/v2",
+        photos,
+        payload.scene_key,
+        payload.format_key,
+        payload.background_key,
+        payload.music_key,
+        payload.title or "",
+        payload.subtitle or "",
+        (payload.user or "") if payload.scene_key == FREE_HUGS_SCENE else "",
+    )
+
+
+def _free_hugs_over_limit(payload: RenderRequest) -> bool:
+    """То же условие, что в web_render_video: пользователь исчерпал бесплатные «Объятия»."""
+    return bool(
+        payload.scene_key == FREE_HUGS_SCENE
+        and payload.user
+        and not state.is_free_hugs_whitelisted(payload.user)
+        and state.get_free_hugs_count(payload.user) >= FREE_HUGS_LIMIT
+    )
+
+
+def _reusable_job(job: Dict[str, Any]) -> bool:
+    """К заданию можно присоединиться: ещё в работе или готово и не старше RENDER_RESULT_TTL_SEC."""
+    status = job.get("status")
+    if status in ("queued", "processing"):
+        return True
+    if status == "done":
+        fresh = time.time() - job.get("finished_at", 0) <= RENDER_RESULT_TTL_SEC
+        video_path = (job.get("result") or {}).get("video_path")
+        return bool(fresh and video_path and os.path.isfile(video_path))
+    return False
+
+
 async def _enqueue_render(payload: RenderRequest) -> Dict[str, Any]:
-    job_id = uuid.uuid4().hex
-    RENDER_JOBS[job_id] = {"status": "queued", "photos": payload.photos, "payload": payload.model_dump()}
+    render_key = await asyncio.to_thread(_render_key, payload)
+    # сверх лимита готовый ролик через склейку не отдаём: новое задание упадёт в пайплайне
+    # с FREE_HUGS_LIMIT_REACHED — так же, как без дедупликации
+    over_limit = await asyncio.to_thread(_free_hugs_over_limit, payload)
+    new_id = uuid.uuid4().hex
+    # поиск и регистрация — одна транзакция в общей SQLite: одинаковые запросы,
+    # пришедшие на разные воркеры, получат одно задание
+    job_id, job = await asyncio.to_thread(
+        RENDER_JOBS.put_or_find,
+        new_id,
+        {
+            "status": "queued",
+            "progress": 0,
+            "queue_position": None,
+            "photos": payload.photos,
+            "payload": payload.model_dump(),
+        },
+        lookup=render_key,
+        reuse=(lambda _job: False) if over_limit else _reusable_job,
+        own=True,
+    )
+    if job_id != new_id:
+        status = job.get("status")
+        metrics.incr("render.dedup_cached" if status == "done" else "render.dedup_inflight")
+        print(f"[WEB_RENDER] dedup: key={render_key[:12]} → job_id={job_id} ({status})", flush=True)
+        out = {"job_id": job_id, "status": status, "status_url": f"/v1/render/status/{job_id}"}
+        if status == "done":
+            out["result"] = job.get("result")
+        return out
+
     asyncio.create_task(_run_render(job_id, payload))
     return {"job_id": job_id, "status": "queued", "status_url": f"/v1/render/status/{job_id}"}
 
@@ -943,6 +1323,100 @@ def _payment_key_from_payload(payload: RenderRequest) -> str:
     return hashlib.sha1(raw.encode("utf-8")).hexdigest()
 
 
+def _next_attempt(record: Dict[str, Any]) -> bool:
+    """Счётчик повторов после падений: задание, роняющее воркер, не крутится бесконечно."""
+    record["attempts"] = int(record.get("attempts") or 0) + 1
+    return record["attempts"] <= WEB_JOB_MAX_ATTEMPTS
+
+
+async def _recover_jobs() -> None:
+    """Подхватить задания, чей воркер умер (нет heartbeat): рендеры, оплаченные без рендера, генерации сессий."""
+    for job_id in await asyncio.to_thread(RENDER_JOBS.stale, ("queued", "processing")):
+        if not await asyncio.to_thread(RENDER_JOBS.claim, job_id, only_stale=True):
+            continue
+        job = await asyncio.to_thread(RENDER_JOBS.get, job_id) or {}
+        if not _next_attempt(job) or not job.get("payload"):
+            job.update({"status": "error", "error": "render interrupted", "queue_position": None})
+            await asyncio.to_thread(RENDER_JOBS.put, job_id, job)
+            await asyncio.to_thread(RENDER_JOBS.release, job_id)
+            continue
+        job.update({"status": "queued", "progress": 0, "queue_position": None})
+        await asyncio.to_thread(RENDER_JOBS.put, job_id, job)
+        print(f"[JOBS] recovering render {job_id} (attempt {job['attempts']})", flush=True)
+        asyncio.create_task(_run_render(job_id, RenderRequest(**job["payload"])))
+
+    # обработчик оплаты умер между «paid» и запуском рендера
+    for payment_key in await asyncio.to_thread(PAYMENT_SESSIONS.stale, ("paid",)):
+        payment = await asyncio.to_thread(PAYMENT_SESSIONS.get, payment_key) or {}
+        if payment.get("job_id"):
+            continue
+        print(f"[JOBS] recovering paid payment {payment_key}", flush=True)
+        try:
+            await _render_after_payment(payment_key)
+        except Exception as exc:  # noqa: BLE001
+            print(f"[JOBS] paid payment {payment_key} not recovered: {exc}", flush=True)
+
+    for session_id in await asyncio.to_thread(sessions.stale, (SESSION_STATUS_PROCESSING,)):
+        if not await asyncio.to_thread(sessions.claim, session_id, only_stale=True):
+            continue
+        session = await asyncio.to_thread(sessions.get, session_id) or {}
+        if not _next_attempt(session):
+            session.update({"status": SESSION_STATUS_ERROR, "message": "generation interrupted"})
+            await asyncio.to_thread(sessions.put, session_id, session)
+            await asyncio.to_thread(sessions.release, session_id)
+            continue
+        await asyncio.to_thread(sessions.put, session_id, session)
+        print(f"[JOBS] recovering generation {session_id} (attempt {session['attempts']})", flush=True)
+        _start_generation(session_id)
+
+
+def _keep_payment_session(payment: Dict[str, Any]) -> bool:
+    """Связку payment_key → job_id оплаченного (или ещё оплачиваемого) заказа по возрасту не удаляем."""
+    status = payment.get("status")
+    if status == "paid":
+        return True  # оплачен, рендер ещё не запущен
+    if status == "rendering":
+        job_id = payment.get("job_id")
+        return bool(job_id) and RENDER_JOBS.get(job_id) is not None
+    if status == "need_payment" and payment.get("payment_id"):
+        op = payment_ledger.get(payment["payment_id"])
+        return op is not None and op["status"] != EXPIRED
+    return False
+
+
+async def _job_maintenance() -> None:
+    last_gc = 0.0
+    while True:
+        try:
+            await _recover_jobs()
+            if time.monotonic() - last_gc > 3600:
+                last_gc = time.monotonic()
+                removed = await asyncio.to_thread(
+                    lambda: RENDER_JOBS.gc() + sessions.gc() + PAYMENT_SESSIONS.gc(keep_if=_keep_payment_session)
+                )
+                if removed:
+                    print(f"[JOBS] gc removed {removed} records", flush=True)
+        except Exception as exc:  # noqa: BLE001
+            print(f"[JOBS] maintenance error: {exc}", flush=True)
+        await asyncio.sleep(WEB_JOB_RECOVERY_SEC)
+
+
+def _adopt_pending_payments() -> None:
+    """Неоплаченные счета, созданные до общего реестра, — под реконсилер."""
+    for payment_key in PAYMENT_SESSIONS.stale(("need_payment",)):
+        payment = PAYMENT_SESSIONS.get(payment_key) or {}
+        if payment.get("payment_id") and not payment.get("job_id"):
+            payment_ledger.register(payment["payment_id"], SOURCE_WEB, payment_key, payment.get("price_rub"))
+
+
+def _start_job_maintenance() -> None:
+    global _APP_LOOP
+    _APP_LOOP = asyncio.get_running_loop()
+    _adopt_pending_payments()
+    payment_reconciler.subscribe(SOURCE_WEB, _on_payment_paid)
+    _APP_LOOP.create_task(_job_maintenance())
+
+
 def create_app() -> FastAPI:
     app = FastAPI(
         title="Memory Forever API",
@@ -958,6 +1432,14 @@ def create_app() -> FastAPI:
         allow_headers=["*"],
     )
     app.include_router(router)
+    if RUNWAY_FAKE:
+        from .fake_runway import router as fake_runway_router
+
+        app.include_router(fake_runway_router)
+    # прогрев ONNX-моделей rembg в фоне: первый пользователь после деплоя не ждёт загрузку
+    app.add_event_handler("startup", start_warm_up)
+    # восстановление заданий после рестарта и чистка старых записей
+    app.add_event_handler("startup", _start_job_maintenance)
 
     @app.get("/", include_in_schema=False)
     def root() -> PlainTextResponse:
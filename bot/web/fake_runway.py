@@ -0,0 +1,62 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import time
+import uuid
+from typing import Any, Dict
+
+import httpx
+from fastapi import APIRouter, HTTPException, Request
+
+from ..config import RUNWAY_CALLBACK_URL, RUNWAY_CALLBACKS_ENABLED, RUNWAY_FAKE_DELAY_SEC
+from ..render.runway import sign_callback
+
+# Локальная подмена Runway API для отладки колбэков: подключается при RUNWAY_FAKE=1,
+# клиент направляется сюда через RUNWAY_API_BASE=http://127.0.0.1:8000/fake-runway/v1
+router = APIRouter(prefix="/fake-runway/v1", include_in_schema=False)
+
+_TASKS: Dict[str, Dict[str, Any]] = {}
+_SAMPLE_VIDEO = "/assets/examples/example1.mp4"
+
+
+async def _post_callback(task: Dict[str, Any]) -> None:
+    if not RUNWAY_CALLBACKS_ENABLED:
+        return  # без колбэков клиент узнаёт о завершении опросом, как с настоящим Runway
+    body = json.dumps(task, ensure_ascii=False).encode("utf-8")
+    headers = {"Content-Type": "application/json", "X-Runway-Signature": sign_callback(body, int(time.time()))}
+    try:
+        async with httpx.AsyncClient(timeout=10.0) as client:
+            r = await client.post(RUNWAY_CALLBACK_URL, content=body, headers=headers)
+        print(f"[FAKE_RUNWAY] callback {task['id']} -> {r.status_code}")
+    except httpx.HTTPError as e:
+        print(f"[FAKE_RUNWAY] callback error for {task['id']}: {e}")
+
+
+async def _finish_later(task_id: str, output_url: str) -> None:
+    await asyncio.sleep(max(0.0, RUNWAY_FAKE_DELAY_SEC / 2))
+    task = _TASKS[task_id]
+    task.update({"status": "RUNNING", "progress": 0.5})
+    await asyncio.sleep(max(0.0, RUNWAY_FAKE_DELAY_SEC / 2))
+    task.update({"status": "SUCCEEDED", "progress": 1.0, "output": [output_url]})
+    await _post_callback(task)
+
+
+@router.post("/image_to_video")
+async def fake_image_to_video(request: Request) -> Dict[str, Any]:
+    payload = await request.json()
+    if not (payload.get("promptImage") or payload.get("image")):
+        raise HTTPException(status_code=400, detail="promptImage is required")
+    task_id = uuid.uuid4().hex
+    _TASKS[task_id] = {"id": task_id, "status": "PENDING", "createdAt": time.time()}
+    output_url = str(request.base_url).rstrip("/") + _SAMPLE_VIDEO
+    asyncio.create_task(_finish_later(task_id, output_url))
+    return {"id": task_id}
+
+
+@router.get("/tasks/{task_id}")
+async def fake_task(task_id: str) -> Dict[str, Any]:
+    task = _TASKS.get(task_id)
+    if task is None:
+        raise HTTPException(status_code=404, detail="Task not found")
+    return task
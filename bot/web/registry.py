@@ -0,0 +1,281 @@
+from __future__ import annotations
+
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, Iterable, List, Tuple
+
+from ..config import WEB_JOB_LEASE_TTL_SEC, WEB_JOB_TTL_SEC
+from ..db import connect, register_schema, transaction
+from ..session_store import dumps, loads
+
+# Задания, платежи и сессии веб-API в общей SQLite: переживают рестарт uvicorn
+# и видны всем воркерам. data — компактный JSON, статус и время — отдельными колонками под индекс.
+register_schema("web_jobs", """
+CREATE TABLE IF NOT EXISTS web_jobs (
+    kind       TEXT NOT NULL,
+    id         TEXT NOT NULL,
+    status     TEXT,
+    lookup     TEXT,
+    version    INTEGER NOT NULL DEFAULT 0,
+    owner      TEXT,
+    heartbeat  REAL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    data       TEXT NOT NULL,
+    PRIMARY KEY (kind, id)
+);
+CREATE INDEX IF NOT EXISTS idx_web_jobs_status ON web_jobs(kind, status, updated_at);
+CREATE INDEX IF NOT EXISTS idx_web_jobs_lookup ON web_jobs(kind, lookup);
+""")
+
+# владелец — конкретный процесс (pid в контейнере после рестарта может совпасть)
+PROCESS_TOKEN = uuid.uuid4().hex
+_CACHE_MAX = 2048
+
+
+def _dumps(data: Dict[str, Any]) -> str:
+    return dumps(data, separators=(",", ":"))
+
+
+class JobRegistry:
+    """
+    Реестр записей одного вида (render | payment | session).
+
+    get() возвращает один и тот же dict, пока запись не менялась в другом процессе
+    (сверка по version) — код, мутирующий запись на месте, работает как со старым dict;
+    после изменений нужно вызвать put().
+    Процесс, выполняющий задание, «владеет» записью (claim) и поддерживает heartbeat;
+    записи с протухшим heartbeat забирает другой процесс — это и есть восстановление после падения.
+    """
+
+    def __init__(self, kind: str, ttl_sec: float = WEB_JOB_TTL_SEC, lease_ttl: float = WEB_JOB_LEASE_TTL_SEC):
+        self.kind = kind
+        self.ttl_sec = float(ttl_sec)
+        self.lease_ttl = float(lease_ttl)
+        self._lock = threading.Lock()
+        self._cache: Dict[str, Tuple[int, Dict[str, Any]]] = {}
+        self._owned: set = set()
+        self._heartbeat: threading.Thread | None = None
+
+    # --- чтение/запись ---
+    def get(self, job_id: str) -> Dict[str, Any] | None:
+        with self._lock:
+            cached = self._cache.get(job_id)
+        known = cached[0] if cached else -1
+        row = connect().execute(
+            "SELECT version, CASE WHEN version != ? THEN data END AS data FROM web_jobs WHERE kind = ? AND id = ?",
+            (known, self.kind, job_id),
+        ).fetchone()
+        if row is None:
+            with self._lock:
+                self._cache.pop(job_id, None)
+            return None
+        if row["data"] is None:
+            return cached[1]
+        data = loads(row["data"])
+        self._remember(job_id, row["version"], data)
+        return data
+
+    def put(self, job_id: str, data: Dict[str, Any], *, lookup: str | None = None, own: bool = False) -> None:
+        """own=True — сразу стать владельцем (в той же транзакции, чтобы новую запись не «восстановил» сосед)."""
+        with transaction() as c:
+            version = self._write(c, job_id, data, lookup, own)
+        self._written(job_id, version, data, own)
+
+    def put_unless(self, job_id: str, data: Dict[str, Any], statuses: Iterable[str]) -> bool:
+        """
+        Записать data и стать владельцем, только если текущий статус записи не из statuses.
+        Проверка и запись — одна транзакция: из двух воркеров выигрывает один, второй получит False.
+        """
+        statuses = set(statuses)
+        with transaction() as c:
+            row = c.execute("SELECT status FROM web_jobs WHERE kind = ? AND id = ?", (self.kind, job_id)).fetchone()
+            if row is not None and row["status"] in statuses:
+                return False
+            version = self._write(c, job_id, data, None, True)
+        self._written(job_id, version, data, True)
+        return True
+
+    def put_or_find(
+        self,
+        job_id: str,
+        data: Dict[str, Any],
+        *,
+        lookup: str,
+        reuse: Callable[[Dict[str, Any]], bool],
+        own: bool = False,
+    ) -> Tuple[str, Dict[str, Any]]:
+        """
+        Дедупликация между процессами: последняя запись с тем же lookup, если reuse() её принимает,
+        иначе новая (job_id, data). Поиск и вставка — одна транзакция, одинаковые запросы
+        на разных воркерах получат одно задание.
+        """
+        with transaction() as c:
+            row = c.execute(
+                "SELECT id, data FROM web_jobs WHERE kind = ? AND lookup = ? ORDER BY updated_at DESC LIMIT 1",
+                (self.kind, lookup),
+            ).fetchone()
+            found = loads(row["data"]) if row is not None else None
+            if found is None or not reuse(found):
+                version = self._write(c, job_id, data, lookup, own)
+                found = None
+        if found is not None:
+            # через get(): тот же dict, что уже есть у этого процесса
+            return row["id"], self.get(row["id"]) or found
+        self._written(job_id, version, data, own)
+        return job_id, data
+
+    def _write(self, c: sqlite3.Connection, job_id: str, data: Dict[str, Any], lookup: str | None, own: bool) -> int:
+        now = time.time()
+        c.execute(
+            "INSERT INTO web_jobs (kind, id, status, lookup, version, created_at, updated_at, data)"
+            " VALUES (?, ?, ?, ?, 1, ?, ?, ?)"
+            " ON CONFLICT(kind, id) DO UPDATE SET status = excluded.status,"
+            " lookup = COALESCE(excluded.lookup, lookup), version = version + 1,"
+            " updated_at = excluded.updated_at, data = excluded.data",
+            (self.kind, job_id, data.get("status"), lookup, now, now, _dumps(data)),
+        )
+        if own:
+            c.execute(
+                "UPDATE web_jobs SET owner = ?, heartbeat = ? WHERE kind = ? AND id = ?",
+                (PROCESS_TOKEN, now, self.kind, job_id),
+            )
+        row = c.execute("SELECT version FROM web_jobs WHERE kind = ? AND id = ?", (self.kind, job_id)).fetchone()
+        return row["version"]
+
+    def _written(self, job_id: str, version: int, data: Dict[str, Any], own: bool) -> None:
+        self._remember(job_id, version, data)
+        if own:
+            with self._lock:
+                self._owned.add(job_id)
+            self._ensure_heartbeat()
+
+    def _remember(self, job_id: str, version: int, data: Dict[str, Any]) -> None:
+        with self._lock:
+            self._cache.pop(job_id, None)
+            self._cache[job_id] = (version, data)
+            # кэш только ради общего dict внутри процесса: старые чужие записи выбрасываем
+            if len(self._cache) > _CACHE_MAX:
+                for key in list(self._cache)[: len(self._cache) - _CACHE_MAX]:
+                    if key not in self._owned:
+                        self._cache.pop(key, None)
+
+    def delete(self, job_id: str) -> None:
+        with self._lock:
+            self._cache.pop(job_id, None)
+            self._owned.discard(job_id)
+        connect().execute("DELETE FROM web_jobs WHERE kind = ? AND id = ?", (self.kind, job_id))
+
+    def find_by_lookup(self, lookup: str) -> Tuple[str, Dict[str, Any]] | None:
+        row = connect().execute(
+            "SELECT id FROM web_jobs WHERE kind = ? AND lookup = ? ORDER BY updated_at DESC LIMIT 1",
+            (self.kind, lookup),
+        ).fetchone()
+        if row is None:
+            return None
+        data = self.get(row["id"])
+        return (row["id"], data) if data is not None else None
+
+    # --- владение и восстановление ---
+    def claim(self, job_id: str, *, only_stale: bool = False) -> bool:
+        """Атомарно забрать запись себе; only_stale — только если владелец перестал слать heartbeat."""
+        now = time.time()
+        sql = "UPDATE web_jobs SET owner = ?, heartbeat = ? WHERE kind = ? AND id = ?"
+        params: list = [PROCESS_TOKEN, now, self.kind, job_id]
+        if only_stale:
+            sql += " AND (owner IS NULL OR heartbeat IS NULL OR heartbeat < ?)"
+            params.append(now - self.lease_ttl)
+        cur = connect().execute(sql, params)
+        if not cur.rowcount:
+            return False
+        with self._lock:
+            self._owned.add(job_id)
+        self._ensure_heartbeat()
+        return True
+
+    def release(self, job_id: str) -> None:
+        with self._lock:
+            self._owned.discard(job_id)
+        connect().execute(
+            "UPDATE web_jobs SET owner = NULL, heartbeat = NULL WHERE kind = ? AND id = ? AND owner = ?",
+            (self.kind, job_id, PROCESS_TOKEN),
+        )
+
+    def stale(self, statuses: Iterable[str]) -> List[str]:
+        """id записей в статусах statuses, чей владелец мёртв (или его нет)."""
+        statuses = list(statuses)
+        marks = ",".join("?" for _ in statuses)
+        rows = connect().execute(
+            f"SELECT id FROM web_jobs WHERE kind = ? AND status IN ({marks})"
+            " AND (owner IS NULL OR heartbeat IS NULL OR heartbeat < ?)",
+            [self.kind, *statuses, time.time() - self.lease_ttl],
+        ).fetchall()
+        return [r["id"] for r in rows]
+
+    def _ensure_heartbeat(self) -> None:
+        with self._lock:
+            if self._heartbeat is not None and self._heartbeat.is_alive():
+                return
+            self._heartbeat = threading.Thread(target=self._heartbeat_loop, name=f"jobs-{self.kind}-hb", daemon=True)
+            self._heartbeat.start()
+
+    def _heartbeat_loop(self) -> None:
+        while True:
+            time.sleep(self.lease_ttl / 3)
+            with self._lock:
+                ids = list(self._owned)
+            if not ids:
+                continue
+            try:
+                with transaction() as c:
+                    c.executemany(
+                        "UPDATE web_jobs SET heartbeat = ? WHERE kind = ? AND id = ? AND owner = ?",
+                        [(time.time(), self.kind, job_id, PROCESS_TOKEN) for job_id in ids],
+                    )
+            except Exception as exc:  # noqa: BLE001
+                print(f"[JOBS] heartbeat error ({self.kind}): {exc}")
+
+    # --- обслуживание ---
+    def gc(
+        self,
+        keep_statuses: Iterable[str] = (),
+        keep_if: Callable[[Dict[str, Any]], bool] | None = None,
+    ) -> int:
+        """
+        Удаляет записи старше ttl_sec, кроме живых (есть владелец с heartbeat), статусов keep_statuses
+        и тех, для которых keep_if(data) истинно (например, оплаченный заказ, ещё не доведённый до рендера).
+        """
+        keep = list(keep_statuses)
+        now = time.time()
+        where = (
+            " WHERE kind = ? AND updated_at < ?"
+            " AND (owner IS NULL OR heartbeat IS NULL OR heartbeat < ?)"
+        )
+        params: list = [self.kind, now - self.ttl_sec, now - self.lease_ttl]
+        if keep:
+            where += f" AND status NOT IN ({','.join('?' for _ in keep)})"
+            params.extend(keep)
+        if keep_if is None:
+            return connect().execute("DELETE FROM web_jobs" + where, params).rowcount or 0
+        rows = connect().execute("SELECT id, version, data FROM web_jobs" + where, params).fetchall()
+        removed = 0
+        for row in rows:
+            if keep_if(loads(row["data"])):
+                continue
+            # version в условии: запись, обновлённую после чтения, не трогаем
+            cur = connect().execute(
+                "DELETE FROM web_jobs WHERE kind = ? AND id = ? AND version = ?", (self.kind, row["id"], row["version"])
+            )
+            removed += cur.rowcount or 0
+        return removed
+
+    def counts(self) -> Dict[str, int]:
+        rows = connect().execute(
+            "SELECT status, COUNT(*) AS n FROM web_jobs WHERE kind = ? GROUP BY status", (self.kind,)
+        ).fetchall()
+        return {str(r["status"]): r["n"] for r in rows}
+
+
+__all__ = ["JobRegistry", "PROCESS_TOKEN"]
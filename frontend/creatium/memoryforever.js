@@ -41,6 +41,31 @@ let currentStartFrameUrl = null;
 let sceneMetaMap = {};
 let pendingPayment = null;
 let paymentStatusTimer = null;
+let eventSource = null;
+let runwayTicker = null;
+let runwayFloor = 0;  // последний процент от сервера: оценка тикера ниже него не опускается
+
+// Этапы рендера из /v1/render/events → подписи для пользователя
+const STAGE_LABELS = {
+  queued: 'В очереди на рендер',
+  started: 'Подготовка',
+  cutout: 'Вырезаем людей с фото',
+  start_frame: 'Собираем стартовый кадр',
+  runway_queued: 'Ждём свободный слот генерации',
+  runway_submitted: 'Генерация видео поставлена',
+  runway_running: 'Генерируем видео',
+  download: 'Скачиваем сгенерированный клип',
+  watermark: 'Накладываем водяной знак',
+  post_titles: 'Готовим титры',
+  post_compose: 'Монтаж',
+  post_concat: 'Склейка',
+  post_bg: 'Анимация фона',
+  post_watermark: 'Водяной знак',
+  post_music: 'Музыка',
+  done: 'Готово'
+};
+// диапазон прогресса, который занимает генерация в Runway (совпадает с RUNWAY_BAND на сервере)
+const RUNWAY_BAND = [35, 75];
 
 const selectedState = {
   sceneKey: '',
@@ -697,9 +722,9 @@ async function startPaidRender() {
       currentJobId = data.job_id;
       pollAttempts = 0;
       setStatus('Рендер запущен. Ждём результат…');
-      setProgress(10);
+      setProgress(0);
       pendingPayment = null;
-      pollStatus(currentJobId);
+      watchJob(currentJobId);
       return;
     }
 
@@ -739,6 +764,118 @@ function clearPollTimer() {
     clearTimeout(paymentStatusTimer);
     paymentStatusTimer = null;
   }
+  closeEventSource();
+}
+
+function closeEventSource() {
+  if (eventSource) {
+    eventSource.close();
+    eventSource = null;
+  }
+  stopRunwayTicker();
+}
+
+function stopRunwayTicker() {
+  if (runwayTicker) {
+    clearInterval(runwayTicker);
+    runwayTicker = null;
+  }
+}
+
+// Пока Runway генерирует, сервер присылает события редко — двигаем полосу по ожидаемому времени,
+// не обгоняя реальные события.
+function startRunwayTicker(expectedSec, serverProgress) {
+  stopRunwayTicker();
+  runwayFloor = serverProgress;
+  const startedAt = Date.now();
+  const expectedMs = Math.max(10, expectedSec || 60) * 1000;
+  runwayTicker = setInterval(function () {
+    const frac = Math.min(0.95, (Date.now() - startedAt) / expectedMs);
+    const estimate = Math.round(RUNWAY_BAND[0] + (RUNWAY_BAND[1] - RUNWAY_BAND[0]) * frac);
+    const p = Math.max(runwayFloor, estimate);
+    setProgress(p);
+    setStatus(STAGE_LABELS.runway_running + '… (' + p + '%)');
+  }, 1000);
+}
+
+function showStageEvent(data) {
+  const p = typeof data.progress === 'number' ? data.progress : 0;
+  const detail = data.detail || {};
+  let label = STAGE_LABELS[data.stage] || 'Идёт рендер';
+  if (data.stage === 'runway_queued' && detail.position) {
+    label += ': вы ' + detail.position + '-й из ' + detail.depth;
+    if (detail.eta_sec) {
+      label += ', ~' + Math.max(1, Math.round(detail.eta_sec / 60)) + ' мин';
+    }
+  }
+  if (data.stage === 'queued' && data.queue_position) {
+    label += ': позиция ' + data.queue_position;
+  }
+  if (data.stage === 'runway_submitted') {
+    startRunwayTicker(detail.expected_sec, p);
+  } else if (data.stage === 'runway_running') {
+    runwayFloor = Math.max(runwayFloor, p);
+  } else {
+    stopRunwayTicker();
+  }
+  setProgress(p);
+  setStatus(label + '… (' + p + '%)');
+}
+
+function showRenderDone(data) {
+  setProgress(100);
+  setStatus('Готово! Видео сгенерировано.');
+  if (data.result && data.result.start_frame_url) {
+    showStartFrame(data.result.start_frame_url);
+  }
+  if (data.result && data.result.video_url) {
+    showFinalVideo(data.result.video_url);
+  }
+  enableRenderButton(true);
+  renderBtn.textContent = 'Сделать видео';
+  renderBtn.dataset.mode = 'render';
+}
+
+function showRenderFailed(errorText) {
+  setStatus('Ошибка при рендере: ' + (errorText || 'неизвестная ошибка'), 'error');
+  videoStatus = 'error';
+  videoUrl = null;
+  enableRenderButton(true);
+}
+
+// Прогресс рендера: поток событий сервера (SSE), при недоступности — прежний опрос.
+function watchJob(jobId) {
+  if (!jobId) return;
+  if (!window.EventSource) {
+    pollStatus(jobId);
+    return;
+  }
+  closeEventSource();
+  let failures = 0;
+  const es = new EventSource(API_BASE + '/v1/render/events/' + jobId);
+  eventSource = es;
+  es.addEventListener('progress', function (ev) {
+    failures = 0;
+    showStageEvent(JSON.parse(ev.data));
+  });
+  es.addEventListener('done', function (ev) {
+    closeEventSource();
+    showRenderDone(JSON.parse(ev.data));
+  });
+  es.addEventListener('error', function (ev) {
+    if (ev.data) {
+      closeEventSource();
+      showRenderFailed(JSON.parse(ev.data).error);
+      return;
+    }
+    // обрыв соединения: EventSource переподключится сам; если не выходит — переходим на опрос
+    failures += 1;
+    if (failures >= 3) {
+      safeLog('[MF_WEB] SSE недоступен, переходим на опрос статуса');
+      closeEventSource();
+      pollStatus(jobId);
+    }
+  });
 }
 
 async function pollStatus(jobId) {
@@ -775,25 +912,12 @@ async function pollStatus(jobId) {
     }
 
     if (data.status === 'done') {
-      setProgress(100);
-      setStatus('Готово! Видео сгенерировано.');
-      if (data.result && data.result.start_frame_url) {
-        showStartFrame(data.result.start_frame_url);
-      }
-      if (data.result && data.result.video_url) {
-        showFinalVideo(data.result.video_url);
-      }
-      enableRenderButton(true);
-      renderBtn.textContent = 'Сделать видео';
-      renderBtn.dataset.mode = 'render';
+      showRenderDone(data);
       return;
     }
 
     if (data.status === 'error') {
-      setStatus('Ошибка при рендере: ' + (data.error || 'неизвестная ошибка'), 'error');
-      videoStatus = 'error';
-      videoUrl = null;
-      enableRenderButton(true);
+      showRenderFailed(data.error);
       return;
     }
 
@@ -808,6 +932,32 @@ async function pollStatus(jobId) {
 
 function startPaymentStatusPolling(paymentKey) {
   if (!paymentKey) return;
+  if (window.EventSource) {
+    // сервер сам сообщит, когда оплата пройдёт и рендер стартует
+    closeEventSource();
+    const es = new EventSource(API_BASE + '/v1/render/events_by_payment/' + paymentKey);
+    eventSource = es;
+    es.addEventListener('payment', function (ev) {
+      const data = JSON.parse(ev.data);
+      if (data.job_id) {
+        closeEventSource();
+        currentJobId = data.job_id;
+        setStatus('Оплата получена. Рендер запущен…');
+        watchJob(data.job_id);
+      }
+    });
+    es.addEventListener('error', function (ev) {
+      if (!ev.data && es.readyState === EventSource.CLOSED) {
+        eventSource = null;
+        pollPaymentStatus(paymentKey);
+      }
+    });
+    return;
+  }
+  pollPaymentStatus(paymentKey);
+}
+
+function pollPaymentStatus(paymentKey) {
   const poll = async function () {
     try {
       const resp = await fetch(API_BASE + '/v1/render/status_by_payment/' + paymentKey);
@@ -818,7 +968,7 @@ function startPaymentStatusPolling(paymentKey) {
         return;
       }
       const data = await resp.json();
-      if (data.status === 'render_started' && data.job_id) {
+      if (data.job_id && (data.status === 'render_started' || data.status === 'queued' || data.status === 'processing')) {
         pollStatus(data.job_id);
         return;
       }
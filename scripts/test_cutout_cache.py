@@ -0,0 +1,53 @@
+"""
+Behaviour test for the smart_cutout result cache (`bot/render/pipeline.py`).
+
+Checks that the same input pixels are segmented once and served from the disk
+cache afterwards, and that a different photo misses. The segmentation itself is
+replaced by a counting stand-in, so rembg models are not loaded.
+
+Usage:
+    python scripts/test_cutout_cache.py
+"""
+from __future__ import annotations
+
+import tempfile
+
+from PIL import Image
+
+from bot.render import pipeline
+from bot.render.cache import DiskLRUCache
+
+
+def check_cutout_cache() -> None:
+    calls: list = []
+
+    def fake_uncached(img: Image.Image) -> Image.Image:
+        calls.append(img.getpixel((0, 0)))
+        out = img.copy()
+        out.putalpha(128)
+        return out
+
+    original_cache, original_uncached = pipeline._CUTOUT_CACHE, pipeline._smart_cutout_uncached
+    pipeline._CUTOUT_CACHE = DiskLRUCache(tempfile.mkdtemp(prefix="cutout_test_"), max_entries=8, suffix=".png")
+    pipeline._smart_cutout_uncached = fake_uncached
+    try:
+        red = Image.new("RGBA", (40, 60), (200, 30, 30, 255))
+        first = pipeline.smart_cutout(red)
+        again = pipeline.smart_cutout(red.copy())
+        assert len(calls) == 1, "same pixels are segmented once"
+        assert again.mode == "RGBA" and again.tobytes() == first.tobytes(), "cached cutout is lossless"
+
+        pipeline.smart_cutout(Image.new("RGBA", (40, 60), (30, 30, 200, 255)))
+        assert len(calls) == 2, "a different photo misses the cache"
+        assert pipeline._cutout_cache_key(red) != pipeline._cutout_cache_key(red.resize((41, 60)))
+    finally:
+        pipeline._CUTOUT_CACHE, pipeline._smart_cutout_uncached = original_cache, original_uncached
+    print("[TEST] cutout cache: ok")
+
+
+def main() -> None:
+    check_cutout_cache()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Behaviour test for the on-disk render cache (`bot/render/cache.py`).
+
+Covers content keys, TTL expiry since last access, and LRU eviction where a hit
+refreshes the entry. Runs in a throw-away directory; mtimes are set explicitly so
+the result does not depend on filesystem timestamp resolution.
+
+Usage:
+    python scripts/test_disk_cache.py
+"""
+from __future__ import annotations
+
+import os
+import tempfile
+import time
+
+from bot.render.cache import DiskLRUCache, content_key
+
+
+def _age(path: str, seconds: float) -> None:
+    ts = time.time() - seconds
+    os.utime(path, (ts, ts))
+
+
+def check_content_key() -> None:
+    assert content_key("title", {"a": 1, "b": 2}) == content_key("title", {"b": 2, "a": 1})
+    assert content_key("a", "b") != content_key("b", "a"), "order of parts matters"
+    print("[TEST] content key: ok")
+
+
+def check_ttl(root: str) -> None:
+    cache = DiskLRUCache(os.path.join(root, "ttl"), max_entries=10, ttl_sec=60, suffix=".png")
+    path = cache.put_bytes("k", b"data")
+    assert cache.get("k") == path and path.endswith("k.png")
+    _age(path, 30)
+    assert cache.get("k") == path, "entry younger than ttl is served"
+    assert time.time() - os.path.getmtime(path) < 5, "a hit refreshes the access time"
+    _age(path, 120)
+    assert cache.get("k") is None and not os.path.exists(path), "expired entry is removed"
+    print("[TEST] ttl: ok")
+
+
+def check_lru_eviction(root: str) -> None:
+    cache = DiskLRUCache(os.path.join(root, "lru"), max_entries=2, suffix=".bin")
+    a = cache.put_bytes("a", b"a")
+    b = cache.put_bytes("b", b"b")
+    _age(a, 30)
+    _age(b, 20)
+    cache.get("a")  # a становится самой свежей
+
+    src = os.path.join(root, "c.src")
+    with open(src, "wb") as fh:
+        fh.write(b"c")
+    cache.put_file("c", src, move=True)
+    assert not os.path.exists(src), "move=True takes the source file"
+    assert cache.get("a") and cache.get("c"), "recently used entries stay"
+    assert cache.get("b") is None, "least recently used entry is evicted"
+    assert not [n for n in os.listdir(cache.directory) if n.endswith(".tmp")]
+    print("[TEST] lru eviction: ok")
+
+
+def main() -> None:
+    root = tempfile.mkdtemp(prefix="disk_cache_test_")
+    check_content_key()
+    check_ttl(root)
+    check_lru_eviction(root)
+
+
+if __name__ == "__main__":
+    main()
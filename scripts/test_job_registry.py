@@ -0,0 +1,101 @@
+"""
+Behaviour test for the web job registry shared by uvicorn workers (`bot/web/registry.py`).
+
+Runs against a throw-away SQLite file; other workers are simulated by swapping
+`registry.PROCESS_TOKEN`.
+
+Usage:
+    python scripts/test_job_registry.py
+"""
+from __future__ import annotations
+
+import os
+import tempfile
+
+from bot.db import connect
+from bot.web import registry
+from bot.web.registry import JobRegistry
+
+KIND = "test"
+
+
+def _as_worker(token: str) -> None:
+    registry.PROCESS_TOKEN = token
+
+
+def check_round_trip() -> None:
+    data = {"status": "queued", "tags": {"a", "b"}, "size": (720, 1280), "by_scene": {0: "ok", 1: None}}
+    JobRegistry(KIND).put("rt", data)
+    # новый экземпляр — без кэша процесса, только то, что лежит в SQLite
+    assert JobRegistry(KIND).get("rt") == data
+    print("[TEST] round trip: ok")
+
+
+def check_put_unless() -> None:
+    jobs = JobRegistry(KIND)
+    _as_worker("worker-a")
+    assert jobs.put_unless("gen", {"status": "processing"}, ("processing",))
+    _as_worker("worker-b")
+    assert not jobs.put_unless("gen", {"status": "processing"}, ("processing",)), "second /generate must lose"
+    assert not jobs.claim("gen", only_stale=True), "a live owner keeps the record"
+    print("[TEST] put_unless: ok")
+
+
+def check_put_or_find() -> None:
+    jobs = JobRegistry(KIND)
+    first, _ = jobs.put_or_find("r1", {"status": "queued"}, lookup="key", reuse=lambda job: True, own=True)
+    again, job = JobRegistry(KIND).put_or_find("r2", {"status": "queued"}, lookup="key", reuse=lambda job: True)
+    assert first == again == "r1" and job["status"] == "queued", "same key joins the existing job"
+    fresh, _ = jobs.put_or_find("r3", {"status": "queued"}, lookup="key", reuse=lambda job: False)
+    assert fresh == "r3" and jobs.find_by_lookup("key")[0] == "r3"
+    print("[TEST] put_or_find: ok")
+
+
+def check_claim_stale_recovery() -> None:
+    jobs = JobRegistry(KIND, lease_ttl=3600)
+    _as_worker("worker-a")
+    jobs.put("job", {"status": "processing"}, own=True)
+
+    _as_worker("worker-b")
+    assert "job" not in jobs.stale(["processing"])
+    assert not jobs.claim("job", only_stale=True)
+
+    # worker-a умер: heartbeat больше не обновляется
+    connect().execute("UPDATE web_jobs SET heartbeat = 0 WHERE kind = ? AND id = ?", (KIND, "job"))
+    assert "job" in jobs.stale(["processing"])
+    assert jobs.claim("job", only_stale=True), "stale record is recovered"
+
+    _as_worker("worker-c")
+    assert not jobs.claim("job", only_stale=True), "only one worker recovers it"
+
+    _as_worker("worker-b")
+    jobs.release("job")
+    assert "job" in jobs.stale(["processing"])
+    print("[TEST] claim/stale/recovery: ok")
+
+
+def check_gc_keep_if() -> None:
+    jobs = JobRegistry(KIND + "_gc", ttl_sec=0)
+    jobs.put("paid", {"status": "paid"})
+    jobs.put("old", {"status": "error"})
+    assert jobs.gc(keep_if=lambda data: data["status"] == "paid") == 1
+    assert jobs.get("paid") and jobs.get("old") is None, "paid record outlives the ttl"
+    print("[TEST] gc keep_if: ok")
+
+
+def main() -> None:
+    # относительный STATE_DB_FILE откроется во временной папке, рабочая база не трогается
+    os.chdir(tempfile.mkdtemp(prefix="registry_test_"))
+    original = registry.PROCESS_TOKEN
+    try:
+        check_round_trip()
+        check_put_unless()
+        check_put_or_find()
+        check_claim_stale_recovery()
+        check_gc_keep_if()
+    finally:
+        registry.PROCESS_TOKEN = original
+
+
+if __name__ == "__main__":
+    main()
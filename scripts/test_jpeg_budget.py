@@ -0,0 +1,76 @@
+"""
+Behaviour test for JPEG encoding under a size budget (`bot/render/pipeline.py`).
+
+Checks that the default quality is kept when it fits, that the quality search
+returns the highest quality that fits the budget, that an impossible budget falls
+back to min_quality, and that the data URI budget accounts for base64 overhead.
+
+Usage:
+    python scripts/test_jpeg_budget.py
+"""
+from __future__ import annotations
+
+import base64
+import io
+
+import numpy as np
+from PIL import Image
+
+from bot.render.pipeline import _JPEG_DATAURI_PREFIX, _jpeg_budget_for_datauri, encode_jpeg_for_budget
+
+
+def _noisy(w: int = 320, h: int = 480) -> Image.Image:
+    # шум плохо сжимается — размер заметно зависит от качества
+    rng = np.random.default_rng(7)
+    return Image.fromarray(rng.integers(0, 256, (h, w, 3), dtype=np.uint8), "RGB")
+
+
+def _size_at(im: Image.Image, q: int, optimize: bool = True) -> int:
+    bio = io.BytesIO()
+    im.save(bio, "JPEG", quality=q, optimize=optimize, progressive=True)
+    return len(bio.getvalue())
+
+
+def check_fits_without_search() -> None:
+    im = _noisy()
+    data, q = encode_jpeg_for_budget(im, None, quality=88)
+    assert q == 88 and data[:2] == b"\xff\xd8"
+    data, q = encode_jpeg_for_budget(im, len(data) + 1, quality=88)
+    assert q == 88, "no search when the first encode fits"
+    print("[TEST] fits at default quality: ok")
+
+
+def check_search_highest_fitting() -> None:
+    im = _noisy()
+    budget = (_size_at(im, 60) + _size_at(im, 61)) // 2
+    data, q = encode_jpeg_for_budget(im, budget, quality=88, min_quality=40)
+    assert len(data) <= budget, "result fits the budget"
+    assert 50 <= q <= 61, q
+    # поиск меряет кодирование без optimize — по нему следующий шаг уже не влезает
+    assert _size_at(im, q + 1, optimize=False) > budget, "next quality step would not fit"
+    print(f"[TEST] quality search (q={q}): ok")
+
+
+def check_impossible_budget() -> None:
+    data, q = encode_jpeg_for_budget(_noisy(), 1000, quality=88, min_quality=40)
+    assert q == 40 and len(data) > 1000, "falls back to min_quality"
+    print("[TEST] impossible budget: ok")
+
+
+def check_datauri_budget() -> None:
+    limit = 100_000
+    budget = _jpeg_budget_for_datauri(limit)
+    uri = _JPEG_DATAURI_PREFIX + base64.b64encode(b"\0" * budget).decode("ascii")
+    assert len(uri) <= limit < len(uri) + 8, "budget fills the data URI without overflowing it"
+    print("[TEST] data URI budget: ok")
+
+
+def main() -> None:
+    check_fits_without_search()
+    check_search_highest_fitting()
+    check_impossible_budget()
+    check_datauri_budget()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+Behaviour test for the two-person start-frame layout (`make_start_frame`).
+
+Places pairs of cutouts of awkward sizes and checks that both silhouettes stay
+inside the safe margins of the frame and do not overlap when overlap is not
+allowed. Segmentation is replaced by the photo itself (fully opaque), so rembg
+is not needed. Runs in a throw-away directory.
+
+Usage:
+    python scripts/test_pair_layout.py
+"""
+from __future__ import annotations
+
+import os
+import tempfile
+
+from PIL import Image
+
+from bot.render import pipeline
+
+W, MARGIN = 720, 20
+SIZES = [
+    ((901, 1203), (997, 1111)),
+    ((400, 1500), (1300, 900)),
+    ((333, 777), (335, 779)),
+    ((1599, 1601), (1601, 1599)),
+]
+
+
+def _photo(name: str, size: tuple[int, int]) -> str:
+    Image.new("RGB", size, (200, 120, 80)).save(name, "JPEG")
+    return name
+
+
+def check_pair_fits() -> None:
+    Image.new("RGB", (720, 1280), (40, 80, 60)).save("bg.jpg", "JPEG")
+    original = pipeline.smart_cutout
+    pipeline.smart_cutout = lambda img: img.convert("RGBA")
+    try:
+        for i, (left, right) in enumerate(SIZES):
+            photos = [_photo(f"l{i}.jpg", left), _photo(f"r{i}.jpg", right)]
+            for framing in ("В рост", "По пояс", "По грудь"):
+                _, m = pipeline.make_start_frame(photos, framing, "bg.jpg")
+                rl, rr = m["L"]["rect_abs"], m["R"]["rect_abs"]
+                assert rl[0] >= MARGIN and rr[2] <= W - MARGIN, (framing, left, right, rl, rr)
+                if framing != "По пояс":  # лёгкий нахлёст разрешён только «по пояс»
+                    assert rl[2] <= rr[0], (framing, left, right, rl, rr)
+    finally:
+        pipeline.smart_cutout = original
+    print("[TEST] pair stays inside the frame: ok")
+
+
+def main() -> None:
+    os.chdir(tempfile.mkdtemp(prefix="pair_layout_test_"))
+    os.makedirs("uploads", exist_ok=True)
+    os.makedirs("renders/temp", exist_ok=True)
+    check_pair_fits()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Behaviour test for the shared payment ledger and its reconciler (`bot/payment`).
+
+Covers status transitions and exactly-once handling: a paid operation is marked
+handled only after its handler succeeds, failed handlers are retried, leases keep
+two processes from handling the same operation. Runs on a throw-away SQLite file,
+Tochka is never called.
+
+Usage:
+    python scripts/test_payment_ledger.py
+"""
+from __future__ import annotations
+
+import os
+import tempfile
+import time
+
+from bot.db import connect
+from bot.payment.ledger import (
+    EXPIRED,
+    HANDLED,
+    HANDLER_FAILED,
+    PAID,
+    PENDING,
+    SOURCE_API,
+    SOURCE_TG,
+    SOURCE_WEB,
+    PaymentLedger,
+)
+from bot.payment.reconciler import PaymentReconciler
+
+
+def _expire_lease(op_id: str) -> None:
+    connect().execute("UPDATE payments SET handling_until = ? WHERE op_id = ?", (time.time() - 1, op_id))
+
+
+def check_transitions(ledger: PaymentLedger) -> None:
+    ledger.register("t1", SOURCE_TG, "1", 990)
+    ledger.register("t1", SOURCE_TG, "2", 1)  # повторная регистрация ничего не меняет
+    assert ledger.get("t1")["ref"] == "1" and ledger.get("t1")["status"] == PENDING
+
+    assert ledger.apply("t1", "CREATED", via="poll") is None
+    assert ledger.apply("t1", "APPROVED", via="webhook") == PAID
+    assert ledger.apply("t1", "APPROVED", via="poll") is None, "paid is reported once"
+    assert ledger.apply("t1", "EXPIRED", via="poll") is None, "paid is terminal"
+    assert ledger.get("t1")["confirmed_via"] == "webhook"
+
+    ledger.register("t2", SOURCE_TG, "1")
+    assert ledger.apply("t2", "EXPIRED", via="poll") == EXPIRED
+    assert ledger.apply("t2", "APPROVED", via="poll") == PAID, "late payment after our TTL still counts"
+    assert ledger.apply("missing", "APPROVED", via="poll") is None
+    print("[TEST] transitions: ok")
+
+
+def check_exactly_once(ledger: PaymentLedger) -> None:
+    calls: list = []
+    failures = {"n": 1}
+
+    def handler(row: dict) -> None:
+        calls.append(row["op_id"])
+        if failures["n"]:
+            failures["n"] -= 1
+            raise RuntimeError("user blocked the bot")
+
+    rec = PaymentReconciler(ledger=ledger, handler_lease=60, max_attempts=3)
+    rec._handlers[SOURCE_WEB] = handler
+
+    ledger.register("e1", SOURCE_WEB, "1")
+    ledger.apply("e1", "APPROVED", via="poll")
+
+    rows = ledger.take_paid([SOURCE_WEB], lease_sec=60)
+    assert [r["op_id"] for r in rows] == ["e1"]
+    assert not ledger.take_paid([SOURCE_WEB], lease_sec=60), "leased operation is not handed out twice"
+
+    assert not rec._dispatch(rows[0]), "failed handler does not mark the operation handled"
+    assert ledger.get("e1")["handled"] != HANDLED
+    assert not ledger.take_paid([SOURCE_WEB], lease_sec=60), "retry waits for the backoff"
+
+    _expire_lease("e1")
+    rows = ledger.take_paid([SOURCE_WEB], lease_sec=60)
+    assert rows and rows[0]["handle_attempts"] == 2
+    assert rec._dispatch(rows[0])
+    assert ledger.get("e1")["handled"] == HANDLED
+    _expire_lease("e1")
+    assert not ledger.take_paid([SOURCE_WEB], lease_sec=60), "handled operation is never handed out again"
+    assert calls == ["e1", "e1"]
+    print("[TEST] exactly-once handling: ok")
+
+
+def check_lease_and_give_up(ledger: PaymentLedger) -> None:
+    ledger.register("g1", SOURCE_API, "1")
+    ledger.apply("g1", "APPROVED", via="poll")
+    first = ledger.take_paid([SOURCE_API], lease_sec=60)
+    ledger.extend(["g1"], 60)
+    assert not ledger.take_paid([SOURCE_API], lease_sec=60), "extended lease keeps the operation"
+
+    # процесс-владелец умер: лиза истекла, операцию берёт следующий
+    _expire_lease("g1")
+    assert ledger.take_paid([SOURCE_API], lease_sec=60), "expired lease is taken over"
+
+    rec = PaymentReconciler(ledger=ledger, handler_lease=60, max_attempts=2)
+
+    def broken(row: dict) -> None:
+        raise RuntimeError("app loop is not running")
+
+    rec._handlers[SOURCE_API] = broken
+    rec._dispatch(dict(first[0], handle_attempts=2))
+    assert ledger.get("g1")["handled"] == HANDLER_FAILED
+    _expire_lease("g1")
+    assert not ledger.take_paid([SOURCE_API], lease_sec=60)
+    assert ledger.counts().get("paid_handler_failed") == 1
+    print("[TEST] lease takeover and give-up: ok")
+
+
+def main() -> None:
+    # относительный STATE_DB_FILE откроется во временной папке, рабочая база не трогается
+    os.chdir(tempfile.mkdtemp(prefix="ledger_test_"))
+    ledger = PaymentLedger()
+    check_transitions(ledger)
+    check_exactly_once(ledger)
+    check_lease_and_give_up(ledger)
+
+
+if __name__ == "__main__":
+    main()
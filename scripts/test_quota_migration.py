@@ -0,0 +1,69 @@
+"""
+Behaviour test for the free-hugs quota store (`bot/state.py`).
+
+Covers the one-time import of the legacy quota/free_hugs_usage.json into SQLite:
+counters are merged with max(), the JSON file is left in place, and the migration
+is recorded in the database so it is not repeated. Runs in a throw-away directory.
+
+Usage:
+    python scripts/test_quota_migration.py
+"""
+from __future__ import annotations
+
+import json
+import os
+import tempfile
+
+from bot import state
+from bot.config import FREE_HUGS_QUOTA_FILE
+from bot.db import connect
+
+
+def _write_legacy(data: dict) -> None:
+    os.makedirs(os.path.dirname(FREE_HUGS_QUOTA_FILE), exist_ok=True)
+    with open(FREE_HUGS_QUOTA_FILE, "w", encoding="utf-8") as fh:
+        json.dump(data, fh)
+
+
+def _restart() -> None:
+    # новый процесс: флаг в памяти сброшен, база та же
+    state._quota_migrated = False
+
+
+def check_migration() -> None:
+    _write_legacy({"100": 2, "200": 1, "bad": "x"})
+    state.inc_free_hugs_count(200)  # миграция идёт до первого инкремента
+    assert state.get_free_hugs_count(100) == 2
+    assert state.get_free_hugs_count(200) == 2, "increment is applied on top of the migrated value"
+    assert state.get_free_hugs_count(300) == 0
+    assert os.path.isfile(FREE_HUGS_QUOTA_FILE), "legacy file is not renamed or removed"
+    row = connect().execute("SELECT value FROM state_meta WHERE key = ?", (state._QUOTA_MIGRATED_KEY,)).fetchone()
+    assert row is not None and row["value"] == "2", "migration is recorded in the database"
+    print("[TEST] json migration: ok")
+
+
+def check_not_repeated() -> None:
+    _write_legacy({"100": 5, "400": 1})
+    _restart()
+    assert state.get_free_hugs_count(100) == 2, "recorded migration is not applied again"
+    assert state.get_free_hugs_count(400) == 0
+    print("[TEST] migration runs once: ok")
+
+
+def check_remaining() -> None:
+    _restart()
+    state.inc_free_hugs_count(500, state.FREE_HUGS_LIMIT + 3)
+    assert state.free_hugs_remaining(500) == 0, "remaining never goes negative"
+    print("[TEST] remaining: ok")
+
+
+def main() -> None:
+    # относительные STATE_DB_FILE и FREE_HUGS_QUOTA_FILE — во временной папке, рабочие данные не трогаются
+    os.chdir(tempfile.mkdtemp(prefix="quota_test_"))
+    check_migration()
+    check_not_repeated()
+    check_remaining()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Behaviour test for web render deduplication (`_render_key` / `_enqueue_render`).
+
+Checks that identical paid renders share a key across users, that free-hugs renders
+never share a key between users, and that a user over the free-hugs limit is not
+handed an existing result through dedup.
+
+Usage:
+    python scripts/test_render_dedup.py
+"""
+from __future__ import annotations
+
+import asyncio
+import time
+import uuid
+from pathlib import Path
+
+from PIL import Image
+
+from bot.config import FREE_HUGS_LIMIT, FREE_HUGS_SCENE
+from bot.web import app
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+UPLOADS_DIR = BASE_DIR / "uploads"
+UPLOADS_DIR.mkdir(parents=True, exist_ok=True)
+RENDERS_DIR = BASE_DIR / "renders"
+RENDERS_DIR.mkdir(parents=True, exist_ok=True)
+
+PAID_SCENE = next(k for k in app.assets.SCENES if k != FREE_HUGS_SCENE and app._scene_price(k) > 0)
+
+
+def _make_photo(color: tuple[int, int, int]) -> str:
+    name = f"dedup_{uuid.uuid4().hex}.jpg"
+    Image.new("RGB", (600, 900), color).save(UPLOADS_DIR / name, "JPEG", quality=90)
+    return f"/uploads/{name}"
+
+
+def _payload(scene_key: str, photos: list[str], user: str | None) -> app.RenderRequest:
+    return app.RenderRequest(
+        format_key=next(iter(app.assets.FORMATS)),
+        scene_key=scene_key,
+        background_key=next(iter(app.assets.BG_FILES)),
+        music_key="none",
+        photos=photos,
+        user=user,
+    )
+
+
+def check_keys(photos: list[str]) -> None:
+    paid_a = app._render_key(_payload(PAID_SCENE, photos, "user-a"))
+    paid_b = app._render_key(_payload(PAID_SCENE, photos, "user-b"))
+    assert paid_a == paid_b, "paid renders of the same photos must share a key"
+
+    hugs_a = app._render_key(_payload(FREE_HUGS_SCENE, photos, "user-a"))
+    hugs_b = app._render_key(_payload(FREE_HUGS_SCENE, photos, "user-b"))
+    assert hugs_a != hugs_b, "free-hugs renders must not be shared between users"
+    assert hugs_a == app._render_key(_payload(FREE_HUGS_SCENE, photos, "user-a"))
+    print("[TEST] render keys: ok")
+
+
+def check_over_limit_skips_reuse(photos: list[str]) -> None:
+    user = f"dedup_{uuid.uuid4().hex}"
+    payload = _payload(FREE_HUGS_SCENE, photos, user)
+    video = RENDERS_DIR / f"dedup_{uuid.uuid4().hex}.mp4"
+    video.write_bytes(b"\0")
+    done_id = uuid.uuid4().hex
+    app.RENDER_JOBS.put(
+        done_id,
+        {"status": "done", "finished_at": time.time(), "result": {"video_path": str(video)}},
+        lookup=app._render_key(payload),
+    )
+
+    started: list[str] = []
+
+    def _fake_run_render(job_id, _payload):
+        started.append(job_id)
+        return asyncio.sleep(0)
+
+    original_run, original_count = app._run_render, app.state.get_free_hugs_count
+    app._run_render = _fake_run_render
+    try:
+        app.state.get_free_hugs_count = lambda uid: 0
+        reused = asyncio.run(app._enqueue_render(payload))
+        assert reused["job_id"] == done_id and not started, "under the limit the cached result is reused"
+
+        app.state.get_free_hugs_count = lambda uid: FREE_HUGS_LIMIT
+        fresh = asyncio.run(app._enqueue_render(payload))
+        assert fresh["job_id"] != done_id, "over the limit dedup must not hand out the cached video"
+        assert started == [fresh["job_id"]], "a new job goes through the pipeline quota check"
+    finally:
+        app._run_render, app.state.get_free_hugs_count = original_run, original_count
+        video.unlink(missing_ok=True)
+    print("[TEST] free-hugs limit vs dedup: ok")
+
+
+def main() -> None:
+    photos = [_make_photo((180, 80, 80)), _make_photo((80, 120, 190))]
+    check_keys(photos)
+    check_over_limit_skips_reuse(photos)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Behaviour test for the bounded render pool (`bot/render/executor.py`).
+
+Covers FIFO start order, queue positions (including on_position updates), and
+cancellation of a waiting render. Uses the thread pool and Event-gated dummy
+renders — nothing is actually rendered.
+
+Usage:
+    python scripts/test_render_executor.py
+"""
+from __future__ import annotations
+
+import threading
+import time
+from concurrent.futures import CancelledError
+
+from bot.render.executor import RenderExecutor
+
+
+def _gated(gate: threading.Event, started: list, name: str):
+    def run() -> str:
+        started.append(name)
+        gate.wait(5)
+        return name
+    return run
+
+
+def _wait_until(cond, timeout: float = 5.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not cond():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def check_fifo_and_positions() -> None:
+    pool = RenderExecutor(max_workers=1, kind="thread")
+    gates = {name: threading.Event() for name in "abc"}
+    started: list = []
+    positions: dict = {}
+
+    def on_position(job_id: str, position: int) -> None:
+        positions.setdefault(job_id, []).append(position)
+
+    futures = {
+        name: pool.submit(name, _gated(gates[name], started, name), on_position=on_position)
+        for name in "abc"
+    }
+    assert pool.position("a") == 0 and pool.position("b") == 1 and pool.position("c") == 2
+    assert pool.position("missing") is None
+    assert positions == {"b": [1], "c": [2]}
+
+    gates["a"].set()
+    assert futures["a"].result(5) == "a"
+    _wait_until(lambda: pool.position("b") == 0)
+    assert pool.position("c") == 1
+    _wait_until(lambda: positions["c"] == [2, 1])  # сдвиг в очереди сообщается через on_position
+
+    gates["b"].set()
+    gates["c"].set()
+    assert [futures[n].result(5) for n in "bc"] == ["b", "c"]
+    assert started == ["a", "b", "c"], "renders start in submit order"
+    assert pool.snapshot()["running"] == 0 and pool.snapshot()["queued"] == 0
+    pool.shutdown()
+    print("[TEST] fifo and positions: ok")
+
+
+def check_cancel_waiting() -> None:
+    pool = RenderExecutor(max_workers=1, kind="thread")
+    gate = threading.Event()
+    started: list = []
+    first = pool.submit("a", _gated(gate, started, "a"))
+    waiting = pool.submit("b", _gated(threading.Event(), started, "b"))
+    last = pool.submit("c", lambda: "c")
+
+    assert waiting.cancel(), "a queued render can be cancelled"
+    assert pool.position("b") is None, "cancelled render leaves the queue"
+    assert pool.position("c") == 1, "renders behind it move up"
+
+    gate.set()
+    assert first.result(5) == "a" and last.result(5) == "c"
+    assert "b" not in started, "cancelled render never runs"
+    try:
+        waiting.result(0)
+    except CancelledError:
+        pass
+    else:
+        raise AssertionError("cancelled future must raise CancelledError")
+    pool.shutdown()
+    print("[TEST] cancel waiting render: ok")
+
+
+def main() -> None:
+    check_fifo_and_positions()
+    check_cancel_waiting()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+Behaviour test for resumable result downloads (`RunwayClient.download_async`).
+
+Covers resuming with a Range request after a dropped connection, restarting from
+scratch when the server ignores Range, rejecting a file larger than announced,
+and the probe retry. HTTP goes through httpx.MockTransport — nothing leaves the box.
+
+Usage:
+    python scripts/test_runway_download.py
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+import tempfile
+
+import httpx
+
+from bot.render import runway
+from bot.render.runway import _DOWNLOAD_CHUNK, RunwayClient
+
+# больше двух блоков записи: обрыв посреди второго оставляет на диске ровно один блок
+PAYLOAD = bytes(range(256)) * (_DOWNLOAD_CHUNK * 5 // 2 // 256)
+CUT = _DOWNLOAD_CHUNK * 3 // 2
+URL = "https://cdn.runway.test/result.mp4"
+
+
+class _DroppingStream(httpx.AsyncByteStream):
+    """Отдаёт часть тела и рвёт соединение."""
+
+    def __init__(self, data: bytes, cut: int):
+        self.data, self.cut = data, cut
+
+    async def __aiter__(self):
+        yield self.data[: self.cut]
+        raise httpx.ReadError("connection reset")
+
+
+def _download(handler, verify=None, max_attempts: int = 5) -> tuple[str | None, Exception | None]:
+    save_path = os.path.join(tempfile.mkdtemp(prefix="runway_dl_"), "seg.mp4")
+
+    async def run() -> str:
+        client = RunwayClient(base_url="https://runway.test/v1")
+        client._dl_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        return await client.download_async(URL, save_path, verify=verify, max_attempts=max_attempts)
+
+    try:
+        return asyncio.run(run()), None
+    except Exception as exc:  # noqa: BLE001
+        assert not os.path.exists(f"{save_path}.part"), "rejected file is not left behind"
+        return None, exc
+
+
+def check_range_resume() -> None:
+    ranges: list = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        rng = request.headers.get("Range")
+        ranges.append(rng)
+        if rng is None:
+            return httpx.Response(
+                200, headers={"Content-Length": str(len(PAYLOAD))}, stream=_DroppingStream(PAYLOAD, CUT)
+            )
+        start = int(rng.split("=")[1].rstrip("-"))
+        body = PAYLOAD[start:]
+        headers = {
+            "Content-Range": f"bytes {start}-{len(PAYLOAD) - 1}/{len(PAYLOAD)}",
+            "Content-Length": str(len(body)),
+        }
+        return httpx.Response(206, headers=headers, content=body)
+
+    path, err = _download(handler)
+    assert err is None, err
+    with open(path, "rb") as fh:
+        assert fh.read() == PAYLOAD, "resumed file is byte-identical"
+    assert ranges == [None, f"bytes={_DOWNLOAD_CHUNK}-"], "only the unwritten tail is requested again"
+    print("[TEST] range resume: ok")
+
+
+def check_range_ignored() -> None:
+    calls = {"n": 0}
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls["n"] += 1
+        headers = {"Content-Length": str(len(PAYLOAD))}
+        if calls["n"] == 1:
+            return httpx.Response(200, headers=headers, stream=_DroppingStream(PAYLOAD, CUT))
+        return httpx.Response(200, headers=headers, content=PAYLOAD)
+
+    path, err = _download(handler)
+    assert err is None, err
+    with open(path, "rb") as fh:
+        assert fh.read() == PAYLOAD, "server without Range support: file is downloaded again, not appended"
+    print("[TEST] range ignored by server: ok")
+
+
+def check_size_mismatch() -> None:
+    def handler(request: httpx.Request) -> httpx.Response:
+        # заявлено меньше, чем пришло — файл битый, докачка не поможет
+        return httpx.Response(206, headers={"Content-Range": "bytes 0-99/100"}, content=PAYLOAD)
+
+    path, err = _download(handler)
+    assert path is None and isinstance(err, IOError) and "size mismatch" in str(err), err
+    print("[TEST] size mismatch: ok")
+
+
+def check_probe_retry() -> None:
+    probes: list = []
+
+    def verify(path: str) -> bool:
+        probes.append(os.path.getsize(path))
+        return len(probes) > 1  # первая копия «битая»
+
+    path, err = _download(lambda r: httpx.Response(200, content=PAYLOAD), verify=verify)
+    assert err is None and probes == [len(PAYLOAD), len(PAYLOAD)], (err, probes)
+    _, err = _download(lambda r: httpx.Response(200, content=PAYLOAD), verify=lambda p: False)
+    assert isinstance(err, IOError) and "probe" in str(err), "a file that never passes the probe is rejected"
+    print("[TEST] probe retry: ok")
+
+
+def main() -> None:
+    # без пауз между попытками
+    runway._backoff_sec = lambda attempt, base=2.0, cap=60.0: 0.0
+    check_range_resume()
+    check_range_ignored()
+    check_size_mismatch()
+    check_probe_retry()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Behaviour test for the shared Runway task limit (`bot/render/governor.py`).
+
+Covers queue order (paid first, then the user with fewer running tasks, then
+FIFO), slot grants under the limit, queue positions, reclaiming leases of dead
+processes and idempotent release. Runs on a throw-away SQLite file; leases of
+other processes are inserted directly.
+
+Usage:
+    python scripts/test_runway_governor.py
+"""
+from __future__ import annotations
+
+import os
+import tempfile
+import time
+
+from bot.db import connect
+from bot.render.governor import PRIORITY_FREE, PRIORITY_PAID, RunwayGovernor
+
+
+def _lease(lease_id: str, user: str, priority: int, state: str, enqueued_at: float, heartbeat: float | None = None) -> None:
+    connect().execute(
+        "INSERT INTO runway_leases (id, user_key, priority, state, duration, pid, enqueued_at, heartbeat, tag)"
+        " VALUES (?, ?, ?, ?, 5, 1, ?, ?, ?)",
+        (lease_id, user, priority, state, enqueued_at, heartbeat or time.time(), lease_id),
+    )
+
+
+def _clear() -> None:
+    connect().execute("DELETE FROM runway_leases")
+
+
+def check_priority_and_fairness() -> None:
+    _clear()
+    gov = RunwayGovernor(limit=2, lease_ttl=60)
+    _lease("a-run", "user-a", PRIORITY_FREE, "running", 0.0)
+    _lease("a-wait", "user-a", PRIORITY_FREE, "waiting", 1.0)
+    _lease("b-wait", "user-b", PRIORITY_FREE, "waiting", 2.0)
+    _lease("c-paid", "user-c", PRIORITY_PAID, "waiting", 3.0)
+
+    # один слот свободен: его получает платный, хоть он и пришёл последним
+    granted, info = gov._try_grant("a-wait")
+    assert not granted and info["position"] == 3, "user with a running task goes after the others"
+    granted, info = gov._try_grant("b-wait")
+    assert not granted and info["position"] == 2
+    assert gov._try_grant("c-paid")[0], "paid task takes the free slot first"
+
+    assert gov.queue_info("c-paid")["state"] == "running"
+    assert gov.queue_info("b-wait")["position"] == 1
+    assert gov.snapshot()["running"] == 2 and gov.snapshot()["waiting"] == 2
+    print("[TEST] priority and fairness: ok")
+
+
+def check_fifo_and_release() -> None:
+    _clear()
+    gov = RunwayGovernor(limit=1, lease_ttl=60)
+    _lease("first", "user-a", PRIORITY_FREE, "waiting", 1.0)
+    _lease("second", "user-b", PRIORITY_FREE, "waiting", 2.0)
+    assert not gov._try_grant("second")[0], "same priority and load: first come, first served"
+    assert gov._try_grant("first")[0]
+
+    gov.release("first")
+    gov.release("first")  # повторно — без ошибок
+    assert gov._try_grant("second")[0], "released slot goes to the next in line"
+    print("[TEST] fifo and release: ok")
+
+
+def check_dead_process_lease() -> None:
+    _clear()
+    gov = RunwayGovernor(limit=1, lease_ttl=60)
+    _lease("dead", "user-a", PRIORITY_PAID, "running", 0.0, heartbeat=time.time() - 600)
+    lease = gov.acquire("user-b", PRIORITY_FREE, tag="job-b", duration=5)
+    assert gov.queue_info("job-b")["state"] == "running", "lease without heartbeat frees its slot"
+    gov.bind(lease, "task-b")
+    gov.release_task("task-b")
+    assert gov.queue_info("job-b") is None
+    print("[TEST] dead process lease: ok")
+
+
+def main() -> None:
+    # относительный STATE_DB_FILE откроется во временной папке, рабочая база не трогается
+    os.chdir(tempfile.mkdtemp(prefix="governor_test_"))
+    check_priority_and_fairness()
+    check_fifo_and_release()
+    check_dead_process_lease()
+
+
+if __name__ == "__main__":
+    main()
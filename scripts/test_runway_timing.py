@@ -0,0 +1,90 @@
+"""
+Behaviour test for Runway completion timing and throttling (`bot/render/runway.py`).
+
+Covers the CompletionModel EWMA (and its persistence across restarts), Retry-After
+parsing, the jittered exponential backoff bounds, and the 429 retry in post_json.
+HTTP goes through httpx.MockTransport — Runway is never called.
+
+Usage:
+    python scripts/test_runway_timing.py
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+import tempfile
+import time
+from email.utils import formatdate
+
+import httpx
+
+from bot.render.runway import CompletionModel, RunwayClient, _backoff_sec, _retry_after_sec
+
+
+def check_ewma() -> None:
+    path = os.path.join(tempfile.mkdtemp(prefix="runway_timing_"), "timings.json")
+    model = CompletionModel(path=path, alpha=0.5)
+    prior = model.expected(5)
+    assert prior > 0, "without observations the prior is used"
+
+    model.observe(5, 40.0)
+    assert model.expected(5) == 40.0, "first observation seeds the average"
+    model.observe(5, 60.0)
+    assert model.expected(5) == 50.0
+    assert model.expected(10) != 50.0, "durations are tracked separately"
+
+    restarted = CompletionModel(path=path, alpha=0.5)
+    assert restarted.expected(5) == 50.0 and restarted.snapshot()["5"]["n"] == 2, "estimates survive a restart"
+    print("[TEST] completion EWMA: ok")
+
+
+def check_backoff() -> None:
+    def _resp(value: str) -> httpx.Response:
+        return httpx.Response(429, headers={"Retry-After": value})
+
+    assert _retry_after_sec(_resp("7")) == 7.0
+    assert 25 <= _retry_after_sec(_resp(formatdate(time.time() + 30, usegmt=True))) <= 30
+    assert _retry_after_sec(_resp("soon")) is None
+    assert _retry_after_sec(httpx.Response(429)) is None and _retry_after_sec(None) is None
+
+    for attempt, exp in ((1, 2.0), (3, 8.0), (10, 60.0)):
+        for _ in range(50):
+            assert exp / 2 <= _backoff_sec(attempt) <= exp, "equal jitter keeps half of the delay"
+    print("[TEST] retry-after and backoff: ok")
+
+
+def check_post_retries_429() -> None:
+    seen: list = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        seen.append(request.url.path)
+        if len(seen) < 3:
+            return httpx.Response(429, headers={"Retry-After": "0"}, json={"error": "throttled"})
+        return httpx.Response(200, json={"id": "task-1"})
+
+    async def run() -> tuple:
+        client = RunwayClient(base_url="https://runway.test/v1")
+        client._client = httpx.AsyncClient(base_url=client.base_url, transport=httpx.MockTransport(handler))
+        ok = await client.post_json("/image_to_video", {"duration": 5})
+        seen.clear()
+        client._client = httpx.AsyncClient(
+            base_url=client.base_url,
+            transport=httpx.MockTransport(lambda r: httpx.Response(429, headers={"Retry-After": "0"})),
+        )
+        throttled = await client.post_json("/image_to_video", {"duration": 5}, max_throttle_retries=1)
+        return ok, throttled
+
+    ok, throttled = asyncio.run(run())
+    assert ok == (200, {"id": "task-1"}), "429 is retried until the request goes through"
+    assert throttled[0] == 429, "after the retry budget the 429 is returned to the caller"
+    print("[TEST] post_json 429 retry: ok")
+
+
+def main() -> None:
+    check_ewma()
+    check_backoff()
+    check_post_retries_429()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Behaviour test for Runway payload variant fallback (`bot/render/pipeline.py`).
+
+Checks that only structured 400/422 validation errors switch to another payload
+form, that wording like "invalid API key" does not, and that a switch is cached
+only when the rejected forms were refused with 422. Runway is never called:
+`_post_runway` is replaced by a scripted responder.
+
+Usage:
+    python scripts/test_runway_variants.py
+"""
+from __future__ import annotations
+
+from bot.render import pipeline
+from bot.render.pipeline import _runway_is_schema_error
+
+VARIANTS = [{"form": 1}, {"form": 2}, {"form": 3}]
+OK = (200, {"id": "task"})
+
+
+def _run(responses: dict) -> tuple[list, dict | None]:
+    """responses: номер формы → (status, body). Возвращает порядок попыток и результат."""
+    tried: list = []
+
+    def fake_post(payload: dict):
+        tried.append(payload["form"])
+        return responses[payload["form"]]
+
+    original = pipeline._post_runway
+    pipeline._post_runway = fake_post
+    try:
+        try:
+            body = pipeline._runway_start_variants(VARIANTS)
+        except RuntimeError:
+            body = None
+    finally:
+        pipeline._post_runway = original
+    return tried, body
+
+
+def check_classification() -> None:
+    validation = {"error": "Validation of body failed", "issues": [{"path": ["promptImage"]}]}
+    assert _runway_is_schema_error(400, validation)
+    assert _runway_is_schema_error(422, {"error": "Validation failed"})
+    assert not _runway_is_schema_error(400, {"error": "Invalid API key"})
+    assert not _runway_is_schema_error(400, {"error": "Unknown task"})
+    assert not _runway_is_schema_error(400, "invalid request: required field expected")
+    assert not _runway_is_schema_error(401, validation)
+    assert not _runway_is_schema_error(400, {"error": "Not enough credits", "issues": [1]})
+    print("[TEST] schema error classification: ok")
+
+
+def check_fallback_and_cache() -> None:
+    reject_422 = (422, {"error": "Validation of body failed", "issues": [{"path": ["ratio"]}]})
+    reject_400 = (400, {"error": "Validation of body failed", "issues": [{"path": ["ratio"]}]})
+
+    pipeline._remember_runway_variant(None)
+    tried, body = _run({1: (400, {"error": "Invalid API key"}), 2: OK, 3: OK})
+    assert tried == [1] and body is None, "non-schema error does not fall back"
+    assert pipeline._cached_runway_variant() is None
+
+    tried, body = _run({1: reject_400, 2: OK, 3: OK})
+    assert tried == [1, 2] and body
+    assert pipeline._cached_runway_variant() is None, "switch after a plain 400 is not cached"
+
+    tried, body = _run({1: reject_422, 2: OK, 3: OK})
+    assert tried == [1, 2] and body
+    assert pipeline._cached_runway_variant() == 1, "switch after 422 is cached"
+
+    tried, _ = _run({1: OK, 2: (401, {"error": "Invalid API key"}), 3: OK})
+    assert tried == [2] and pipeline._cached_runway_variant() == 1, "auth error keeps the cached form"
+    pipeline._remember_runway_variant(None)
+    print("[TEST] variant fallback and cache: ok")
+
+
+def main() -> None:
+    check_classification()
+    check_fallback_and_cache()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Behaviour test for the bot session store (`bot/session_store.py`).
+
+Covers the value codec (tuple/set/non-string keys survive a reload), LRU eviction
+with hold(), write-behind that skips sessions which were only read, and lookup of
+persisted sessions by field. Runs on a throw-away SQLite file.
+
+Usage:
+    python scripts/test_session_store.py
+"""
+from __future__ import annotations
+
+import os
+import tempfile
+
+from bot.session_store import SessionStore, SqliteSessionBackend, dumps, loads
+
+
+class CountingBackend(SqliteSessionBackend):
+    def __init__(self) -> None:
+        self.writes: list = []
+
+    def save_many(self, ns, items):
+        self.writes.extend(key for key, _ in items)
+        super().save_many(ns, items)
+
+
+def _store(ns: str, **kwargs) -> SessionStore:
+    # фоновый сброс не нужен — тест вызывает flush() сам
+    return SessionStore(ns, backend=CountingBackend(), flush_sec=3600, **kwargs)
+
+
+def check_codec() -> None:
+    value = {"size": (720, 1280), "tags": {"a"}, "by_scene": {0: "ok"}, "nested": [{"__tuple__": 1}]}
+    assert loads(dumps(value)) == value
+    try:
+        dumps({"bad": object()})
+    except TypeError:
+        pass
+    else:
+        raise AssertionError("unknown types must not be stringified silently")
+    print("[TEST] codec round trip: ok")
+
+
+def check_reload() -> None:
+    users = _store("reload")
+    users[1] = {"step": "photos", "scene_jobs": [{"duration": 5, "size": (1, 2)}]}
+    users.flush()
+    fresh = _store("reload")
+    assert fresh[1] == users[1], "session survives a restart"
+    assert 2 not in fresh
+    print("[TEST] reload from backend: ok")
+
+
+def check_eviction_and_hold() -> None:
+    users = _store("evict", max_entries=2)
+    users[1] = {"n": 1}
+    with users.hold(1):
+        users[2] = {"n": 2}
+        users[3] = {"n": 3}
+        assert 1 in list(users), "held session stays in memory over the cap"
+    users[4] = {"n": 4}
+    assert len(users) <= 2, "cap is enforced once nothing holds the sessions"
+    assert users[1] == {"n": 1}, "evicted session is saved and loaded back"
+    print("[TEST] eviction and hold: ok")
+
+
+def check_read_does_not_write() -> None:
+    users = _store("dirty")
+    users[1] = {"n": 1}
+    users.flush()
+    backend = users.backend
+    backend.writes.clear()
+
+    assert 1 in users and users[1]["n"] == 1
+    users.flush()
+    assert backend.writes == [], "a session that was only read is not rewritten"
+
+    users[1]["n"] = 2  # мутация на месте, без __setitem__
+    users.flush()
+    assert backend.writes == ["1"]
+    print("[TEST] write-behind skips unchanged sessions: ok")
+
+
+def check_find() -> None:
+    users = _store("find")
+    users[1] = {"render_in_progress": True}
+    users[2] = {"render_in_progress": False}
+    users[3] = {}
+    assert users.find("render_in_progress", True) == ["1"]
+    users[1].pop("render_in_progress")
+    users.save(1)
+    assert users.find("render_in_progress", True) == []
+    print("[TEST] find by field: ok")
+
+
+def main() -> None:
+    # относительный STATE_DB_FILE откроется во временной папке, рабочая база не трогается
+    os.chdir(tempfile.mkdtemp(prefix="sessions_test_"))
+    check_codec()
+    check_reload()
+    check_eviction_and_hold()
+    check_read_does_not_write()
+    check_find()
+
+
+if __name__ == "__main__":
+    main()
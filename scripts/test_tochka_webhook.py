@@ -0,0 +1,85 @@
+"""
+Behaviour test for the Tochka webhook verifier (`bot.payment.tochka.verify_webhook`).
+
+The token below was signed with RS256 by openssl (`openssl dgst -sha256 -sign`)
+with a throw-away 2048-bit key; only its public JWK is kept here.
+
+Usage:
+    python scripts/test_tochka_webhook.py
+"""
+from __future__ import annotations
+
+import base64
+import json
+
+from bot.payment.tochka import verify_webhook
+
+JWK = json.dumps({
+    "kty": "RSA",
+    "e": "AQAB",
+    "n": (
+        "uAA9TbWtgawPgWkrp-IyYlhVW6tYj4aCvgUAmVa-C6PnabUo4loyK0IWFuzsCz85rIKEjT9K4iSAvalN8SVsLJs2"
+        "FNqj4Z5rGEKjjS4wclMXLTLf7Tzd_KipJUkXO75HJH3TNhwB3tDIvCHevsqkY9IYRPb7gvLEf3EjeKaUiC1WkxC9"
+        "UOtZxBuQcxq8-oVtqIM2ISzPpLGtnNym0G3vzzVfyAzEhux9McR_nV2sus9E5KlWUmZ8C2H0fu5u5ODX9HAUX-Y6"
+        "040ho0fXCre98OdKi4VLBA0hN_Ii96mklgtu_BzHKPZqQTovhQP6JtkSKwdwHlRbR2cFPlHJ-JTvDQ"
+    ),
+})
+
+HEADER = "eyJhbGciOiJSUzI1NiIsInR5cCI6IkpXVCJ9"
+PAYLOAD = (
+    "eyJ3ZWJob29rVHlwZSI6ImFjcXVpcmluZ0ludGVybmV0UGF5bWVudCIsIm9wZXJhdGlvbklkIjoib3AtdGVzdC0x"
+    "Iiwic3RhdHVzIjoiQVBQUk9WRUQiLCJhbW91bnQiOiI5OTAuMDAifQ"
+)
+SIGNATURE = (
+    "gkDRJSNf4BF-FRrrJO6PYmDR3wXH72kHFSw2iy3gUJlfuzWRg1eo-iDvtWNPAECv3iFAwMaMbqSp8LqVeary1_17"
+    "huL9Ns5EK3ZK3R01BOSsm2wg0ip9kLsuvauywhJYQ4wX06CYUt0Ars71Ih2dr5SADKLIuROiXySPv4rK_4Nud4ol"
+    "GWCDXfSXr-uwn211-v1jET6jd7vXIbgRFKspfbPT80ySJ55yDkRLyEY61fP_8MgWIXelK-tlOL65gQdOVpIauKJc"
+    "H77RdzIgiLAfxN0o8EU_HRs4DZ_1NzZt9jP4l_I18XktppmkRXpV554iWlaoZnlEUSdO17dBWKndSQ"
+)
+TOKEN = f"{HEADER}.{PAYLOAD}.{SIGNATURE}"
+
+
+def _b64(data: dict) -> str:
+    raw = json.dumps(data, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def check_known_good() -> None:
+    payload = verify_webhook(TOKEN, JWK)
+    assert payload is not None, "openssl-signed token must verify"
+    assert payload["operationId"] == "op-test-1" and payload["status"] == "APPROVED"
+    assert verify_webhook(TOKEN + "\n", JWK) == payload, "trailing newline in the body is tolerated"
+    print("[TEST] known-good token: ok")
+
+
+def check_tampered() -> None:
+    forged_payload = _b64({
+        "webhookType": "acquiringInternetPayment",
+        "operationId": "op-test-1",
+        "status": "APPROVED",
+        "amount": "1.00",
+    })
+    flipped = SIGNATURE[:-2] + ("A" if SIGNATURE[-2] != "A" else "B") + SIGNATURE[-1]
+    cases = {
+        "payload changed": f"{HEADER}.{forged_payload}.{SIGNATURE}",
+        "signature changed": f"{HEADER}.{PAYLOAD}.{flipped}",
+        "alg none": f"{_b64({'alg': 'none', 'typ': 'JWT'})}.{PAYLOAD}.",
+        "alg HS256": f"{_b64({'alg': 'HS256', 'typ': 'JWT'})}.{PAYLOAD}.{SIGNATURE}",
+        "non-ascii payload": f"{HEADER}.{PAYLOAD}ё.{SIGNATURE}",
+        "not a jwt": "hello",
+        "empty": "",
+    }
+    for name, token in cases.items():
+        assert verify_webhook(token, JWK) is None, f"{name}: must be rejected"
+    assert verify_webhook(TOKEN, "") is None, "no key configured — webhook disabled"
+    assert verify_webhook(TOKEN, "{not json") is None
+    print("[TEST] tampered tokens rejected: ok")
+
+
+def main() -> None:
+    check_known_good()
+    check_tampered()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+"""
+Behaviour test for the crossfade chain offsets (`bot/render/pipeline.py`).
+
+Checks that xfade offsets follow the accumulated length of the merged video for
+segments of different durations, and that `segment_durations` is used when a
+segment cannot be probed. ffmpeg is not needed: the filter string is inspected.
+
+Usage:
+    python scripts/test_xfade_offsets.py
+"""
+from __future__ import annotations
+
+import re
+
+from bot.render.pipeline import _segment_durations, _xfade_chain_filter
+
+
+def _offsets(graph: str) -> list[float]:
+    return [float(v) for v in re.findall(r"offset=([0-9.]+)", graph)]
+
+
+def check_offsets() -> None:
+    graph = _xfade_chain_filter(["s0", "s1", "s2", "s3"], [5.0, 10.0, 5.0, 10.0], 0.5)
+    # накопленная длина минус fade: 5-0.5; (5+10-0.5)-0.5; (14.5+5-0.5)-0.5
+    assert _offsets(graph) == [4.5, 14.0, 18.5], graph
+    assert graph.count("xfade=") == 3 and graph.endswith("[vx]")
+    assert "[s0][s1]" in graph and "[x1][s2]" in graph and "[x2][s3]" in graph
+    assert _xfade_chain_filter(["s0"], [5.0], 0.5) == "[s0]null[vx]"
+    assert _offsets(_xfade_chain_filter(["a", "b"], [0.2, 5.0], 0.5)) == [0.0], "offset never goes negative"
+    print("[TEST] xfade offsets: ok")
+
+
+def check_known_durations() -> None:
+    missing = ["/nonexistent/seg0.mp4", "/nonexistent/seg1.mp4"]
+    assert _segment_durations(missing, [10.0, 5.0]) == [10.0, 5.0], "known durations replace a failed probe"
+    assert _segment_durations(missing) == [0.0, 0.0]
+    assert _segment_durations(missing, [10.0]) == [10.0, 0.0]
+    print("[TEST] segment_durations fallback: ok")
+
+
+def main() -> None:
+    check_offsets()
+    check_known_durations()
+
+
+if __name__ == "__main__":
+    main()